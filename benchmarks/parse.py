@@ -0,0 +1,103 @@
+"""
+Benchmark ``Changeset.from_file`` against the previous line-by-line parser.
+
+Usage::
+
+    python benchmarks/parse.py [SIZE_MB ...]
+
+Sizes default to 1, 10 and 100 MB.  Larger sizes, such as 500, work as well,
+but the legacy parser can take a long time on them.
+
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tern.changeset import Changeset  # noqa
+
+
+_end_re = re.compile(r'^-{2,}\s*end$', flags=re.IGNORECASE)
+_created_at_re = re.compile(
+    r'^-{2,}\s*created at\s*:\s*([0-9]+)$', flags=re.IGNORECASE
+)
+_order_re = re.compile(r'^-{2,}\s*order\s*:\s*([0-9]+)$', flags=re.IGNORECASE)
+_setup_re = re.compile(r'^-{2,}\s*begin setup$', flags=re.IGNORECASE)
+_teardown_re = re.compile(r'^-{2,}\s*begin teardown$', flags=re.IGNORECASE)
+
+
+def legacy_from_file(filename):
+    """
+    The parser as it was before the single-pass rewrite.
+
+    """
+    created_at = order = setup = teardown = None
+
+    def read_block(fh):
+        content = ''
+        for line in fh:
+            if _end_re.match(line.strip()) is not None:
+                break
+            else:
+                content += line
+        return content
+
+    with open(filename) as fh:
+        for line in fh:
+            line = line.strip()
+            created_re = _created_at_re.match(line)
+            order_re = _order_re.match(line)
+            if order_re is not None:
+                order = int(order_re.group(1))
+            elif created_re is not None:
+                created_at = int(created_re.group(1))
+            elif _setup_re.match(line) is not None:
+                setup = read_block(fh)
+            elif _teardown_re.match(line) is not None:
+                teardown = read_block(fh)
+    return Changeset(setup, teardown, order, created_at)
+
+
+def make_changeset_file(size):
+    """
+    Write a changeset file of roughly ``size`` bytes, split evenly between
+    setup and teardown, and return its filename.
+
+    """
+    line = "insert into foo values (1, 'Lorem ipsum -- dolor sit amet');\n"
+    body = line * max(1, size // (2 * len(line)))
+    changeset = Changeset(body, body, 1, 123)
+    fd, filename = tempfile.mkstemp(prefix='tern-bench-')
+    os.close(fd)
+    changeset.save(filename)
+    return filename
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [1, 10, 100]
+    print('{0:>8}  {1:>10}  {2:>10}  {3:>8}'.format(
+        'size MB', 'legacy s', 'new s', 'speedup',
+    ))
+    for size in sizes:
+        filename = make_changeset_file(size * 1024 * 1024)
+        try:
+            repeat = 3 if size <= 100 else 1
+            legacy = best_of(lambda: legacy_from_file(filename), repeat)
+            new = best_of(lambda: Changeset.from_file(filename), repeat)
+        finally:
+            os.remove(filename)
+        print('{0:>8}  {1:>10.3f}  {2:>10.3f}  {3:>7.1f}x'.format(
+            size, legacy, new, legacy / new,
+        ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
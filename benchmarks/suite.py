@@ -0,0 +1,291 @@
+"""
+Benchmark the hot paths of loading, diffing and updating on synthetic tern
+directories.
+
+Usage::
+
+    python benchmarks/suite.py [--counts 100,1000,10000] [--bodies small,large]
+        [--postgres DBNAME] [--save FILE] [--compare FILE]
+
+Each tern directory holds ``count`` changesets whose setup inserts a row
+with a string of ``body`` bytes:  ``small`` (100 bytes), ``large`` (10 kB)
+or ``huge`` (1 MB).  The strings are full of semicolons, which statement
+splitting must skip over.  The directories are deterministic, so runs of
+different versions measure the same work.  Combinations over 1 GB of SQL,
+such as 100000 huge changesets, are skipped.
+
+The measurements, the best of ``--repeat`` runs in seconds, are:
+
+* ``from_file``:  parsing every changeset file with ``Changeset.from_file``.
+* ``save``:  writing every changeset with ``Changeset.save``.
+* ``load``:  ``Tern._get_saved_changesets`` on the directory, cold and with
+  a warm index.
+* ``diff``:  ``Tern.diff`` against a database with all but 1% of the
+  changesets applied.
+* ``update``:  ``Tern.update(batch=True)`` of a fresh database.
+
+``diff`` and ``update`` run against an SQLite file and, with
+``--postgres``, a local PostgreSQL database (connection settings are taken
+from the usual ``PG*`` environment variables).  Tables named ``tern_bench``
+and ``bench`` are dropped and recreated in it.
+
+``--save`` writes the results to a JSON file, a baseline for later runs;
+``--compare`` prints the results next to a baseline and exits with status 1
+if any measurement is over ``--threshold`` times slower.
+
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tern.api import Tern  # noqa
+from tern.changeset import Changeset  # noqa
+from tern.index import ChangesetIndex  # noqa
+from tern.adapters.sqlite import SQLiteAdapter  # noqa
+
+
+BODIES = {'small': 100, 'large': 10 * 1024, 'huge': 1024 * 1024}
+MAX_TOTAL = 1024 ** 3
+TABLE = 'tern_bench'
+
+
+def make_changesets(count, size):
+    """
+    Return ``count`` deterministic changesets, each inserting a row with a
+    string of ``size`` bytes, a semicolon in every 28.
+
+    """
+    padding = ('Lorem ipsum; dolor sit amet ' * (size // 28 + 1))[:size]
+    return [
+        Changeset(
+            "insert into bench(n, note) values ({0}, '{1}');".format(
+                i, padding,
+            ),
+            'delete from bench where n = {0};'.format(i),
+            i,
+            i,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def save_all(changesets, directory):
+    for changeset in changesets:
+        changeset.save(os.path.join(directory, changeset.hex_hash))
+
+
+def best_of(func, repeat, setup=None):
+    """
+    Return the shortest time ``func`` took over ``repeat`` runs, calling
+    ``setup`` untimed before each run and passing on what it returns.
+
+    """
+    times = list()
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        timer = timeit.default_timer
+        start = timer()
+        func(*args)
+        times.append(timer() - start)
+    return min(times)
+
+
+def sqlite_adapter(root):
+    path = os.path.join(root, 'bench.db')
+    if os.path.exists(path):
+        os.remove(path)
+    return SQLiteAdapter(path, None, None, None, tern_table=TABLE)
+
+
+def postgres_adapter(dbname):
+    from tern.adapters.postgresql import PostgreSQLAdapter
+    adapter = PostgreSQLAdapter(None, dbname, None, None, tern_table=TABLE)
+    with adapter:
+        with adapter.conn.cursor() as c:
+            c.execute(
+                'drop table if exists {0}, {0}_digest, bench cascade;\n'
+                'drop function if exists {0}_digest_update();'.format(TABLE)
+            )
+        adapter.conn.commit()
+    return adapter
+
+
+def prepare_database(adapter, changesets):
+    """
+    Open the adapter, initialize the database and apply the given changesets
+    in one batch.  The adapter is left open.
+
+    """
+    adapter.open()
+    adapter.initialize_tern()
+    adapter._execute_script(
+        'create table bench(n integer primary key, note text);'
+    )
+    with adapter.batch():
+        adapter.apply_many(changesets)
+
+
+def run(args):
+    results = dict()
+    root = tempfile.mkdtemp(prefix='tern-bench-')
+    databases = [('sqlite', lambda: sqlite_adapter(root))]
+    if args.postgres:
+        databases.append(('postgres', lambda: postgres_adapter(args.postgres)))
+    try:
+        for count in args.counts:
+            for body in args.bodies:
+                if count * BODIES[body] > MAX_TOTAL:
+                    continue
+                key = '{0}/{1}'.format(count, body)
+                directory = os.path.join(root, 'tern')
+                changesets = make_changesets(count, BODIES[body])
+
+                def fresh_directory():
+                    shutil.rmtree(directory, ignore_errors=True)
+                    os.mkdir(directory)
+                    return directory
+
+                results['save/' + key] = best_of(
+                    lambda d: save_all(changesets, d), args.repeat,
+                    fresh_directory,
+                )
+                paths = [
+                    os.path.join(directory, cs.hex_hash) for cs in changesets
+                ]
+                results['from_file/' + key] = best_of(
+                    lambda: [Changeset.from_file(p) for p in paths],
+                    args.repeat,
+                )
+
+                def cold_tern():
+                    index = os.path.join(directory, ChangesetIndex.filename)
+                    if os.path.exists(index):
+                        os.remove(index)
+                    return Tern(None, directory, verify=False, index=True)
+
+                results['load/' + key] = best_of(
+                    lambda t: t._get_saved_changesets(), args.repeat,
+                    cold_tern,
+                )
+                tern = Tern(None, directory, verify=False, index=True)
+                tern._get_saved_changesets()
+                results['load_indexed/' + key] = best_of(
+                    tern._get_saved_changesets, args.repeat,
+                )
+
+                applied = changesets[:count - max(1, count // 100)]
+                for name, make_adapter in databases:
+                    adapter = make_adapter()
+                    prepare_database(adapter, applied)
+                    try:
+                        tern = Tern(adapter, directory, index=True)
+                        results['diff/{0}/{1}'.format(name, key)] = best_of(
+                            tern.diff, args.repeat,
+                        )
+                    finally:
+                        adapter.close()
+
+                    def fresh_database():
+                        adapter = make_adapter()
+                        prepare_database(adapter, [])
+                        return Tern(adapter, directory, index=True)
+
+                    def update(tern):
+                        try:
+                            tern.update(batch=True)
+                        finally:
+                            tern.adapter.close()
+
+                    results['update/{0}/{1}'.format(name, key)] = best_of(
+                        update, args.repeat, fresh_database,
+                    )
+                print('{0} done'.format(key), file=sys.stderr)
+    finally:
+        shutil.rmtree(root)
+    return results
+
+
+def report(results, baseline, threshold):
+    """
+    Print the results, next to the baseline's if given.  Returns whether
+    any measurement regressed past the threshold.
+
+    """
+    regressed = False
+    print('{0:<36}  {1:>10}  {2:>10}  {3:>7}'.format(
+        'benchmark', 'seconds', 'baseline', 'ratio',
+    ))
+    for name in sorted(results):
+        seconds = results[name]
+        before = baseline.get(name)
+        if before is None:
+            print('{0:<36}  {1:>10.4f}'.format(name, seconds))
+            continue
+        ratio = seconds / before if before else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  slower'
+            regressed = True
+        print('{0:<36}  {1:>10.4f}  {2:>10.4f}  {3:>6.2f}x{4}'.format(
+            name, seconds, before, ratio, flag,
+        ))
+    return regressed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--counts', default='100,1000,10000',
+        type=lambda s: [int(x) for x in s.split(',')],
+        help='Comma-separated numbers of changesets, up to 100000.',
+    )
+    parser.add_argument(
+        '--bodies', default='small,large',
+        type=lambda s: s.split(','),
+        help='Comma-separated body sizes:  small, large and huge.',
+    )
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--postgres', metavar='DBNAME', help=(
+        'Also benchmark against this local PostgreSQL database.'
+    ))
+    parser.add_argument('--save', metavar='FILE', help=(
+        'Save the results as a baseline.'
+    ))
+    parser.add_argument('--compare', metavar='FILE', help=(
+        'Compare the results with a saved baseline.'
+    ))
+    parser.add_argument('--threshold', type=float, default=1.2, help=(
+        'With --compare, the slowdown counted as a regression.'
+    ))
+    args = parser.parse_args(argv)
+    for body in args.bodies:
+        if body not in BODIES:
+            parser.error('Unknown body size: {0}'.format(body))
+
+    results = run(args)
+    baseline = dict()
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)['results']
+    regressed = report(results, baseline, args.threshold)
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'repeat': args.repeat,
+                'results': results,
+            }, fh, indent=2, sort_keys=True)
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -16,6 +16,11 @@ from .adapters import extract_adapter
 from .exceptions import NotInitialized
 from .changeset import Changeset
 from .api import Tern
+from .fleet import Fleet, schema_targets
+from .compare import compare
+from .plan import plan
+from .stats import Progress, estimate_durations, timings_report
+from .events import JSONLinesSink, PrometheusSink
 
 
 def main():
@@ -31,15 +36,80 @@ def main():
     subparsers.add_parser('init', help=(
         'Initializes the database for use with Tern.'
     ))
-    subparsers.add_parser('test', help=(
+    test_parser = subparsers.add_parser('test', help=(
         'Test the SQL you\'ve written in setup.sql and teardown.sql.'
     ))
+    test_parser.add_argument('--clone', action='store_true', help=(
+        'Test on a disposable clone of the database instead of rolling back.'
+    ))
     subparsers.add_parser('apply', help=(
         'Apply the SQL to the database and save it to repo.'
     ))
-    subparsers.add_parser('update', help=(
+    baseline_parser = subparsers.add_parser('baseline', help=(
+        'Squash the changesets up to an order, so fresh databases skip them.'
+    ))
+    baseline_parser.add_argument('order', type=int, help=(
+        'The highest order to squash.'
+    ))
+    baseline_parser.add_argument('--setup', metavar='FILE', help=(
+        'SQL creating the state after the squashed changesets, such as a '
+        'schema dump.  Defaults to their setup SQL, concatenated.'
+    ))
+    subparsers.add_parser('pack', help=(
+        'Move the changeset files into a single pack file.'
+    ))
+    update_parser = subparsers.add_parser('update', help=(
         'Bring the database in sync with the repository.'
     ))
+    update_parser.add_argument('--batch', action='store_true', help=(
+        'Run the whole update in a single transaction.'
+    ))
+    update_parser.add_argument('--batch-size', type=int, help=(
+        'With --batch, commit after every BATCH_SIZE changesets.'
+    ))
+    update_parser.add_argument('--eta', action='store_true', help=(
+        'Report progress with an ETA, predicted from the timings recorded by '
+        'the databases under `targets`.  This connects to each of them and '
+        'explains the pending SQL before the update starts.'
+    ))
+    subparsers.add_parser('plan', help=(
+        'Estimate how long an update would take, without running any SQL.'
+    ))
+    stats_parser = subparsers.add_parser('stats', help=(
+        'Report how long the applied changesets took.'
+    ))
+    stats_parser.add_argument('--top', type=int, default=10, help=(
+        'The number of slowest changesets to list.'
+    ))
+    fleet_parser = subparsers.add_parser('fleet', help=(
+        'Update every database listed under `targets` in the config file.'
+    ))
+    fleet_parser.add_argument('-j', '--jobs', type=int, default=8, help=(
+        'The number of databases to update at once.'
+    ))
+    fleet_parser.add_argument('--schemas', metavar='PATTERN', help=(
+        'Instead of `targets`, update every schema matching the LIKE pattern '
+        'in the database configured under `adapter`.'
+    ))
+    fleet_parser.add_argument('--initialize', action='store_true', help=(
+        'Initialize databases or schemas which have not been initialized.'
+    ))
+    fleet_parser.add_argument('--batch', action='store_true', help=(
+        'Run the update of each database in a single transaction.'
+    ))
+    fleet_parser.add_argument('--batch-size', type=int, help=(
+        'With --batch, commit after every BATCH_SIZE changesets.'
+    ))
+    compare_parser = subparsers.add_parser('compare', help=(
+        'Compare the changesets applied to two databases.'
+    ))
+    compare_parser.add_argument('left', help=(
+        'The name of a database listed under `targets` in the config file, '
+        'or the path to another config file.'
+    ))
+    compare_parser.add_argument('right', help=(
+        'Likewise, the database to compare with.'
+    ))
 
     args = parser.parse_args()
 
@@ -127,10 +197,30 @@ def main():
         config, tern, adapter = load(args.config, verify=False)
         try:
             adapter.verify_tern()
-            sys.stderr.write('Tern is already initialized.\n')
-            sys.exit(1)
         except NotInitialized:
             pass
+        else:
+            upgraded = False
+            if adapter.get_digest() is None:
+                # Initialized before digests were added, add one.
+                try:
+                    adapter.initialize_digest()
+                    sys.stdout.write('Added the applied changeset digest.\n')
+                    upgraded = True
+                except NotImplementedError:
+                    pass
+            if adapter.get_timings(()) is None:
+                # Likewise for timings.
+                try:
+                    adapter.initialize_timings()
+                    sys.stdout.write('Added the changeset timings.\n')
+                    upgraded = True
+                except NotImplementedError:
+                    pass
+            if upgraded:
+                sys.exit(0)
+            sys.stderr.write('Tern is already initialized.\n')
+            sys.exit(1)
 
         sys.stdout.write('Initializing... ')
         sys.stdout.flush()
@@ -144,8 +234,10 @@ def main():
         sys.stdout.flush()
         cs = load_pending_changeset(tern)
         try:
-            adapter.test(cs)
+            timings = tern.test(cs, clone=args.clone)
             sys.stdout.write('Success\n')
+            for name, seconds in sorted((timings or dict()).items()):
+                sys.stdout.write('  {0}:  {1:.3f}s\n'.format(name, seconds))
         except:
             sys.stdout.write('Error\n')
             raise
@@ -158,7 +250,7 @@ def main():
 
         # Make sure it works
         try:
-            adapter.test(cs)
+            tern.test(cs)
         except:
             raise
 
@@ -179,11 +271,127 @@ def main():
             fh.write('')
         sys.stdout.write('Done\n')
 
-    elif args.command == 'update':
+    elif args.command == 'fleet':
+        config = load_config(args.config)
+        if args.schemas is not None:
+            # One target per tenant schema, sharing a pool of connections.
+            adapter_config = dict(config['adapter'], pool_size=args.jobs)
+            targets = schema_targets(
+                make_adapter(adapter_config), args.schemas,
+            )
+        else:
+            targets = [
+                (target.get('name') or str(i),
+                    make_adapter(target['adapter']))
+                for i, target in enumerate(config['targets'])
+            ]
+        fleet = Fleet(
+            targets, config['directory'], jobs=args.jobs,
+            initialize=args.initialize, **tern_options(config)
+        )
+
+        def progress(result):
+            if result.ok:
+                sys.stdout.write('{0}:  reverted {1}, applied {2}\n'.format(
+                    result.name, result.reverted, result.applied,
+                ))
+            else:
+                sys.stdout.write('{0}:  failed\n'.format(result.name))
+            sys.stdout.flush()
+
+        report = fleet.update(
+            batch=args.batch, batch_size=args.batch_size, progress=progress,
+        )
+        sys.stdout.write(report.summary() + '\n')
+        if report.failed:
+            sys.exit(1)
+
+    elif args.command == 'compare':
+        config = load_config(args.config)
+        left = make_adapter(find_adapter_config(config, args.left))
+        right = make_adapter(find_adapter_config(config, args.right))
+        with left:
+            with right:
+                result = compare(left, right)
+        for name, differences in [
+            (args.left, result.only_left), (args.right, result.only_right),
+        ]:
+            for hex_hash, order in differences:
+                sys.stdout.write('only in {0}:  {1} (order {2})\n'.format(
+                    name, hex_hash, order,
+                ))
+        if not result.same:
+            sys.exit(1)
+        sys.stdout.write('Same changesets applied.\n')
+
+    elif args.command == 'baseline':
+        config = load_config(args.config)
+        tern = Tern(
+            None, config['directory'], verify=False, **tern_options(config)
+        )
+        setup = None
+        if args.setup is not None:
+            with open(args.setup) as fh:
+                setup = fh.read()
+        baseline = tern.make_baseline(args.order, setup)
+        sys.stdout.write('{0} changesets squashed.\n'.format(
+            len(baseline.hashes),
+        ))
+
+    elif args.command == 'pack':
+        config = load_config(args.config)
+        tern = Tern(
+            None, config['directory'], verify=False, **tern_options(config)
+        )
+        sys.stdout.write('Packing... ')
+        sys.stdout.flush()
+        sys.stdout.write('{0} changesets packed.\n'.format(tern.pack()))
+
+    elif args.command == 'plan':
+        config, tern, adapter = load(args.config)
+        to_revert, to_apply = tern.diff()
+        sys.stdout.write(plan(adapter, to_revert, to_apply).report() + '\n')
+
+    elif args.command == 'stats':
+        config, tern, adapter = load(args.config)
+        timings = adapter.get_timings()
+        if timings is None:
+            sys.stderr.write(
+                'Timings are not recorded.  Run `tern init` to add them.\n'
+            )
+            sys.exit(1)
+        orders = dict(adapter.get_applied_hashes())
+        sys.stdout.write(timings_report(timings, orders, args.top) + '\n')
+
+    elif args.command == 'update' and not args.eta:
         config, tern, adapter = load(args.config)
         sys.stdout.write('Updating... ')
         sys.stdout.flush()
-        tern.update()
+        tern.update(batch=args.batch, batch_size=args.batch_size)
+        sys.stdout.write('Done\n')
+
+    elif args.command == 'update':
+        config, tern, adapter = load(args.config)
+        to_revert, to_apply = tern.diff()
+        sources = fleet_timing_sources(config)
+        try:
+            estimates = estimate_durations(
+                adapter, to_revert, to_apply, sources,
+            )
+        finally:
+            for source in sources:
+                source.close()
+        progress = Progress(
+            to_revert + to_apply, estimates,
+            lambda line: sys.stdout.write(line + '\n'),
+        )
+        sys.stdout.write('Updating {0} changesets, ETA {1:.0f}s\n'.format(
+            progress.total, progress.eta(),
+        ))
+        sys.stdout.flush()
+        tern.update(
+            batch=args.batch, batch_size=args.batch_size, progress=progress,
+        )
         sys.stdout.write('Done\n')
 
 
@@ -193,17 +401,105 @@ def load(config_file, verify=True):
     ``(config, tern, adapter)``.
 
     """
-    with open(config_file or 'tern.yml') as fh:
-        config = yaml.load(fh.read())
-
-    Adapter = extract_adapter(import_module(config['adapter']['module']))
-    del config['adapter']['module']
-    adapter = Adapter(**config['adapter'])
+    config = load_config(config_file)
+    adapter = make_adapter(config['adapter'])
     adapter.open()
-    tern = Tern(adapter, config['directory'], verify=verify)
+    tern = Tern(
+        adapter, config['directory'], verify=verify, **tern_options(config)
+    )
     return config, tern, adapter
 
 
+def load_config(config_file):
+    with open(config_file or 'tern.yml') as fh:
+        return yaml.safe_load(fh.read())
+
+
+def fleet_timing_sources(config):
+    """
+    Return the adapters of the databases listed under ``targets`` in the
+    config file which record timings, to predict the duration of an update
+    from.  They're returned open; those which can't be reached are skipped
+    with a warning.
+
+    """
+    sources = list()
+    for i, target in enumerate(config.get('targets') or []):
+        adapter = make_adapter(target['adapter'])
+        try:
+            adapter.open()
+        except Exception as e:
+            sys.stderr.write(
+                'Warning:  skipping timings of {0}:  {1}\n'.format(
+                    target.get('name') or str(i), e,
+                )
+            )
+            continue
+        sources.append(adapter)
+    return sources
+
+
+def find_adapter_config(config, target):
+    """
+    Return the adapter configuration of the named target from the config
+    file, or of the config file at the given path.
+
+    """
+    for i, item in enumerate(config.get('targets') or []):
+        if (item.get('name') or str(i)) == target:
+            return item['adapter']
+    return load_config(target)['adapter']
+
+
+def make_adapter(adapter_config):
+    """
+    Create an adapter from its configuration, the ``adapter`` section of the
+    config file.  The adapter is not opened.
+
+    """
+    adapter_config = dict(adapter_config)
+    Adapter = extract_adapter(import_module(adapter_config.pop('module')))
+    return Adapter(**adapter_config)
+
+
+def tern_options(config):
+    """
+    Return the keyword arguments for ``Tern`` set in the config file.
+
+    """
+    return dict(
+        index=config.get('index', False),
+        workers=config.get('workers'),
+        worker_type=config.get('worker_type', 'thread'),
+        hooks=make_hooks(config),
+    )
+
+
+def make_hooks(config):
+    """
+    Create the hooks listed under ``hooks`` in the config file, such as::
+
+        hooks:
+          - type: jsonl
+            path: /var/log/tern/events.jsonl
+          - type: prometheus
+            path: /var/lib/node_exporter/tern.prom
+            labels: {database: main}
+
+    """
+    hooks = list()
+    for hook in config.get('hooks') or []:
+        hook = dict(hook)
+        kind = hook.pop('type')
+        if kind == 'jsonl':
+            hooks.append(JSONLinesSink(**hook))
+        elif kind == 'prometheus':
+            hooks.append(PrometheusSink(**hook))
+        else:
+            raise ValueError('Unknown hook type: {0}'.format(kind))
+    return hooks
+
+
 def load_pending_changeset(tern):
     with open('setup.sql') as fh:
         setup = fh.read().strip()
@@ -1,6 +1,6 @@
 from __future__ import absolute_import
 from importlib import import_module
-from inspect import getmembers
+from inspect import getmembers, isclass
 import six
 
 from .adapterbase import AdapterBase
@@ -19,6 +19,6 @@ def extract_adapter(module):
     """
     if isinstance(module, six.string_types):
         module = import_module(module)
-    for _, member in getmembers(module):
+    for _, member in getmembers(module, isclass):
         if member is not AdapterBase and issubclass(member, AdapterBase):
             return member
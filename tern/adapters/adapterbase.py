@@ -1,4 +1,9 @@
+from __future__ import absolute_import
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
+
+from ..digest import digest
+from ..exceptions import ChangesetError
 
 
 class AdapterBase(object):
@@ -14,6 +19,21 @@ class AdapterBase(object):
         ('password', 'Password', ''),
     ]
 
+    # The number of statements sent to the database, for measuring the
+    # overhead of an operation.  Adapters should count every statement by
+    # using ``_execute``.
+    round_trips = 0
+
+    # The open connection, managed by ``open`` and ``close``.
+    conn = None
+    # An optional ``tern.adapters.pool.ConnectionPool`` of idle connections.
+    pool = None
+    # Pooled connections idle for longer than this many seconds are checked
+    # with ``_ping`` before they are reused.
+    ping_after = 30
+    # The number of references to the open connection.
+    _refs = 0
+
     @abstractmethod
     def __init__(
         self, host, dbname, username, password, port=None, tern_table='tern'
@@ -30,18 +50,145 @@ class AdapterBase(object):
     def __exit__(self, type, value, traceback):
         self.close()
 
-    @abstractmethod
+    def _execute(self, cursor, sql, params=None):
+        """
+        Execute a statement with the given DB-API cursor, counting the round
+        trip.
+
+        """
+        self.round_trips += 1
+        if params is None:
+            return cursor.execute(sql)
+        return cursor.execute(sql, params)
+
     def open(self):
         """
-        Do whatever needs to be done to open a connection.
+        Open a connection, or take another reference to the connection if it's
+        already open.  Each call must be matched by a call to ``close``;
+        ``with adapter:`` does both.
+
+        If ``self.pool`` is set, an idle connection is taken from the pool
+        when possible.  Connections which have been idle for longer than
+        ``ping_after`` seconds are checked with ``_ping`` first, and replaced
+        if they're broken.
+
+        Adapters implement ``_connect`` and ``_disconnect`` rather than
+        overriding this.
 
         """
-        pass
+        if self._refs > 0 and not self._alive(self.conn):
+            # The connection was lost while in use; reconnect.
+            self._discard(self.conn)
+            self.conn = self._connect()
+            self._prepare(self.conn)
+        elif self._refs == 0:
+            self.conn = self._checkout()
+            self._prepare(self.conn)
+        self._refs += 1
 
-    @abstractmethod
     def close(self):
         """
-        Do whatever needs to be done to close the connection.
+        Release a reference to the connection, closing it (or returning it to
+        the pool) when the last reference is released.
+
+        """
+        if self._refs == 0:
+            return
+        self._refs -= 1
+        if self._refs == 0:
+            conn, self.conn = self.conn, None
+            self._checkin(conn)
+
+    def _checkout(self):
+        """
+        Return a healthy connection from the pool, or a new one.
+
+        """
+        while self.pool is not None:
+            item = self.pool.get()
+            if item is None:
+                break
+            conn, idle = item
+            if not self._alive(conn):
+                self._discard(conn)
+            elif idle > self.ping_after and not self._ping(conn):
+                self._discard(conn)
+            else:
+                return conn
+        return self._connect()
+
+    def _checkin(self, conn):
+        """
+        Return the connection to the pool if there is room, else close it.
+
+        """
+        if self.pool is not None and self._alive(conn):
+            try:
+                self._reset(conn)
+            except Exception:
+                self._discard(conn)
+                return
+            if self.pool.put(conn):
+                return
+        self._disconnect(conn)
+
+    def _discard(self, conn):
+        """
+        Close a connection which may be broken, ignoring any errors.
+
+        """
+        try:
+            self._disconnect(conn)
+        except Exception:
+            pass
+
+    def _connect(self):
+        """
+        Open and return a new connection.
+
+        This and ``_disconnect`` are used by the default ``open`` and
+        ``close``, so adapters relying on those must implement both.  They're
+        not abstract because adapters with no real connection, such as
+        ``tern.adapters.mock.MockAdapter``, may override ``open`` and
+        ``close`` instead.
+
+        """
+        raise NotImplementedError()
+
+    def _disconnect(self, conn):
+        """
+        Close the given connection.  See ``_connect``.
+
+        """
+        raise NotImplementedError()
+
+    def _alive(self, conn):
+        """
+        Return ``False`` if the connection is known to be closed.  This must
+        not make a round trip.
+
+        """
+        return conn is not None
+
+    def _ping(self, conn):
+        """
+        Return ``True`` if the connection is usable.  This may make a round
+        trip.
+
+        """
+        return True
+
+    def _prepare(self, conn):
+        """
+        Set up a connection for this adapter, after it has been opened or
+        taken from the pool.
+
+        """
+        pass
+
+    def _reset(self, conn):
+        """
+        Prepare the connection for reuse, before it's returned to the pool.
 
         """
         pass
@@ -58,6 +205,10 @@ class AdapterBase(object):
         * teardown (text, not null)
         * order (int, not null)
 
+        Adapters which keep a digest of the applied changesets then call
+        ``initialize_digest``, and those which record timings call
+        ``initialize_timings``.
+
         """
         pass
 
@@ -82,6 +233,48 @@ class AdapterBase(object):
         """
         pass
 
+    def apply_many(self, changesets, progress=None):
+        """
+        Apply the given changesets in sequence.  If one fails, a
+        ``tern.exceptions.ChangesetError`` is raised; the changesets before it
+        have been applied.
+
+        The default implementation calls ``apply`` for each changeset.
+        Adapters may override it to send several changesets at once.
+
+        :param changesets:  The changesets to apply, in order.
+        :type changesets:  list of tern.Changeset
+        :param progress:  Called as ``progress(changeset)`` once each
+            changeset has been applied.
+        :type progress:  callable
+
+        """
+        for changeset in changesets:
+            try:
+                self.apply(changeset)
+            except Exception as e:
+                raise ChangesetError(changeset, e)
+            if progress is not None:
+                progress(changeset)
+
+    def apply_baseline(self, baseline, changesets):
+        """
+        Load a baseline into a fresh database, and record the changesets it
+        squashes as applied, in a single transaction if possible.
+
+        Adapters that don't support this raise ``NotImplementedError``, and
+        the squashed changesets are applied one by one instead.
+
+        :param baseline:  The baseline to load.
+        :type baseline:  tern.baseline.Baseline
+        :param changesets:  The squashed changesets, in order.
+        :type changesets:  list of tern.Changeset
+
+        """
+        raise NotImplementedError(
+            '{0} does not support baselines.'.format(type(self).__name__)
+        )
+
     @abstractmethod
     def revert(self, changeset):
         """
@@ -93,18 +286,68 @@ class AdapterBase(object):
         """
         pass
 
+    @contextmanager
+    def batch(self):
+        """
+        A context manager that runs the applies and reverts within it in a
+        single transaction, committed when the block exits.  If an exception
+        is raised, the whole transaction is rolled back.
+
+        Adapters that don't support this raise ``NotImplementedError``.
+
+        """
+        raise NotImplementedError(
+            '{0} does not support batched updates.'.format(
+                type(self).__name__,
+            )
+        )
+        yield
+
     @abstractmethod
     def test(self, changeset):
         """
         Apply and revert the given changeset, and then rollback the
         transaction.  Throws any SQL errors that might occur.
 
+        Adapters may return a dictionary of timings in seconds, such as
+        ``setup`` and ``teardown``.
+
         :param changeset:  The changeset to test.
         :type changeset:  tern.Changeset
 
         """
         pass
 
+    def test_clone(self, changeset):
+        """
+        Apply and revert the given changeset on a disposable clone of the
+        database, see ``clone``.  Unlike ``test``, nothing runs on the
+        database itself, and statements which can't run in a transaction can
+        be tested.  Throws any SQL errors that might occur.
+
+        Adapters support clones by inheriting
+        ``tern.adapters.clones.CloneMixin``; others raise
+        ``NotImplementedError``.
+
+        :param changeset:  The changeset to test.
+        :type changeset:  tern.Changeset
+
+        """
+        raise NotImplementedError(
+            '{0} does not support clones.'.format(type(self).__name__)
+        )
+
+    def clone(self):
+        """
+        A context manager yielding an open adapter for a disposable clone of
+        the database, which is dropped when the block exits.  See
+        ``test_clone``.
+
+        """
+        raise NotImplementedError(
+            '{0} does not support clones.'.format(type(self).__name__)
+        )
+
     @abstractmethod
     def get_applied(self):
         """
@@ -113,3 +356,184 @@ class AdapterBase(object):
 
         """
         pass
+
+    def get_applied_hashes(self, low=None, high=None):
+        """
+        Return a list of ``(hash, order)`` tuples, one for each changeset
+        which has been applied to the database.  The hash is the hex hash.
+
+        The default implementation uses ``get_applied``; adapters should
+        override it to avoid fetching the SQL of every changeset.
+
+        :param low:  If given, only changesets with an order of at least
+            ``low`` are included.
+        :type low:  int
+        :param high:  If given, only changesets with an order less than
+            ``high`` are included.
+        :type high:  int
+
+        """
+        return [
+            (cs.hex_hash, cs.order) for cs in self.get_applied()
+            if (low is None or cs.order >= low)
+            and (high is None or cs.order < high)
+        ]
+
+    def get_order_range(self):
+        """
+        Return the lowest and highest order of the applied changesets as a
+        ``(low, high)`` tuple, or ``None`` if none have been applied.
+
+        The default implementation uses ``get_applied_hashes``.
+
+        """
+        orders = [order for _, order in self.get_applied_hashes()]
+        if not orders:
+            return None
+        return min(orders), max(orders)
+
+    def get_range_digests(self, low, width, count):
+        """
+        Return the digests, see ``tern.digest``, of consecutive ranges of the
+        applied changesets by order.  The ``i``th digest covers the orders
+        from ``low + i * width`` up to, but excluding,
+        ``low + (i + 1) * width``.
+
+        The default implementation uses ``get_applied_hashes``; adapters
+        should override it to compute the digests in the database.
+
+        :param low:  The lowest order of the first range.
+        :type low:  int
+        :param width:  The number of orders in each range.
+        :type width:  int
+        :param count:  The number of ranges.
+        :type count:  int
+
+        """
+        buckets = [list() for _ in range(count)]
+        for pair in self.get_applied_hashes(low, low + width * count):
+            buckets[(pair[1] - low) // width].append(pair)
+        return [digest(bucket) for bucket in buckets]
+
+    def get_digest(self):
+        """
+        Return the digest of the applied changesets, see ``tern.digest``, as
+        kept up to date by the database.  This must not need to read the
+        whole tern table.
+
+        The default implementation returns ``None``, meaning the database
+        doesn't keep a digest, as do databases initialized before digests
+        were added.
+
+        """
+        return None
+
+    def initialize_digest(self):
+        """
+        Start keeping the digest of the applied changesets, computing it from
+        the tern table.  If a digest is kept already, it's recomputed.  This
+        is called by ``initialize_tern``, and may be called to add a digest
+        to a database initialized without one.
+
+        Adapters that don't support this raise ``NotImplementedError``.
+
+        """
+        raise NotImplementedError(
+            '{0} does not support digests.'.format(type(self).__name__)
+        )
+
+    def initialize_timings(self):
+        """
+        Start recording how long changesets take to apply, adding the
+        columns to the tern table if they're missing:
+
+        * applied_at (when the setup started, as a unix timestamp)
+        * duration (the time the setup took, in seconds)
+        * statements (the number of statements in the setup)
+
+        This is called by ``initialize_tern``, and may be called to add the
+        columns to a database initialized without them.
+
+        Adapters that don't support this raise ``NotImplementedError``.
+
+        """
+        raise NotImplementedError(
+            '{0} does not support timings.'.format(type(self).__name__)
+        )
+
+    def get_timings(self, hashes=None):
+        """
+        Return the recorded timings of applied changesets, as a dictionary
+        mapping their hex hashes to ``(applied_at, duration, statements)``
+        tuples.  Changesets applied before timings were recorded, or loaded
+        from a baseline, are left out.
+
+        The default implementation returns ``None``, meaning the database
+        doesn't record timings, as do databases initialized before timings
+        were added.
+
+        :param hashes:  Only return the timings of these changesets, if set.
+        :type hashes:  iterable of str
+
+        """
+        return None
+
+    def get_changesets(self, hashes):
+        """
+        Return a list of Changeset objects for the applied changesets with the
+        given hex hashes.  Hashes which have not been applied are ignored.
+
+        The default implementation uses ``get_applied``; adapters should
+        override it to fetch only the requested changesets.
+
+        :param hashes:  The hex hashes of the changesets.
+        :type hashes:  iterable of str
+
+        """
+        hashes = set(hashes)
+        return [cs for cs in self.get_applied() if cs.hex_hash in hashes]
+
+    def split_statements(self, sql):
+        """
+        Split SQL into its statements, in the database's dialect.
+
+        The default implementation returns the SQL as a single statement.
+
+        :param sql:  The SQL.
+        :type sql:  str
+
+        """
+        return [sql] if sql.strip() else []
+
+    def get_table_sizes(self, tables):
+        """
+        Return the sizes of tables, as a dictionary mapping the names of
+        those which exist to ``(bytes, rows)`` tuples, where either may be
+        ``None`` if unknown.  Used by ``tern.plan``.
+
+        Adapters that don't support this raise ``NotImplementedError``.
+
+        :param tables:  The table names, as written in SQL.
+        :type tables:  list of str
+
+        """
+        raise NotImplementedError(
+            '{0} does not support table sizes.'.format(type(self).__name__)
+        )
+
+    def explain(self, statement):
+        """
+        Return the number of rows the database expects a statement to
+        process, without running it, or ``None`` if it can't tell, such as
+        when the statement depends on tables which don't exist yet.  Used by
+        ``tern.plan``.
+
+        Adapters that don't support this raise ``NotImplementedError``.
+
+        :param statement:  A single SQL statement.
+        :type statement:  str
+
+        """
+        raise NotImplementedError(
+            '{0} does not support explain.'.format(type(self).__name__)
+        )
@@ -0,0 +1,230 @@
+"""
+Asyncio adapters for Tern.  Requires Python 3.7 or later.
+
+"""
+import asyncio
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .sqlite import SQLiteAdapter
+
+
+class AsyncAdapterBase(metaclass=ABCMeta):
+    """
+    The asyncio counterpart of ``tern.adapters.AdapterBase``.  Methods are
+    coroutines, but otherwise behave as documented there.  ``async with
+    adapter:`` opens and closes the connection.
+
+    """
+
+    async def __aenter__(self):
+        await self.open()
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+    @abstractmethod
+    async def open(self):
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def initialize_tern(self):
+        pass
+
+    @abstractmethod
+    async def verify_tern(self):
+        pass
+
+    @abstractmethod
+    async def apply(self, changeset):
+        pass
+
+    @abstractmethod
+    async def apply_many(self, changesets):
+        pass
+
+    @abstractmethod
+    async def apply_baseline(self, baseline, changesets):
+        pass
+
+    @abstractmethod
+    async def revert(self, changeset):
+        pass
+
+    @abstractmethod
+    async def test(self, changeset):
+        pass
+
+    @abstractmethod
+    async def get_applied(self):
+        pass
+
+    @abstractmethod
+    async def get_applied_hashes(self):
+        pass
+
+    @abstractmethod
+    async def get_changesets(self, hashes):
+        pass
+
+    @abstractmethod
+    async def get_order_range(self):
+        pass
+
+    @abstractmethod
+    async def get_digest(self):
+        pass
+
+    @abstractmethod
+    def batch(self):
+        """
+        Return an asynchronous context manager, see ``AdapterBase.batch``.
+
+        """
+        pass
+
+
+class ThreadedAsyncAdapter(AsyncAdapterBase):
+    """
+    An async adapter which wraps a blocking adapter, running its methods on a
+    dedicated thread so they don't block the event loop.  Using one thread
+    per adapter keeps each connection on the thread that created it, while
+    many adapters can work concurrently.
+
+    Arguments are passed to ``_make_adapter``.  The wrapped adapter is
+    available as ``adapter``.  The thread is started when needed, and shut
+    down when ``close`` releases the last reference to the connection.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.adapter = self._make_adapter(*args, **kwargs)
+        self._executor = None
+
+    @abstractmethod
+    def _make_adapter(self, *args, **kwargs):
+        """
+        Create the blocking adapter to wrap.
+
+        """
+        pass
+
+    def _call(self, func, *args):
+        """
+        Run ``func(*args)`` on the adapter's thread, returning a future.
+
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1)
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(func, *args),
+        )
+
+    @property
+    def round_trips(self):
+        return self.adapter.round_trips
+
+    async def open(self):
+        await self._call(self.adapter.open)
+
+    async def close(self):
+        try:
+            await self._call(self.adapter.close)
+        finally:
+            # Once the last reference is released and the connection closed,
+            # the thread has no more work.
+            if not self.adapter._refs:
+                executor, self._executor = self._executor, None
+                executor.shutdown(wait=False)
+
+    async def initialize_tern(self):
+        await self._call(self.adapter.initialize_tern)
+
+    async def verify_tern(self):
+        await self._call(self.adapter.verify_tern)
+
+    async def apply(self, changeset):
+        await self._call(self.adapter.apply, changeset)
+
+    async def apply_many(self, changesets):
+        await self._call(self.adapter.apply_many, changesets)
+
+    async def apply_baseline(self, baseline, changesets):
+        await self._call(self.adapter.apply_baseline, baseline, changesets)
+
+    async def revert(self, changeset):
+        await self._call(self.adapter.revert, changeset)
+
+    async def test(self, changeset):
+        await self._call(self.adapter.test, changeset)
+
+    async def get_applied(self):
+        return await self._call(self.adapter.get_applied)
+
+    async def get_applied_hashes(self):
+        return await self._call(self.adapter.get_applied_hashes)
+
+    async def get_changesets(self, hashes):
+        return await self._call(self.adapter.get_changesets, hashes)
+
+    async def get_order_range(self):
+        return await self._call(self.adapter.get_order_range)
+
+    async def get_digest(self):
+        return await self._call(self.adapter.get_digest)
+
+    def batch(self):
+        return _ThreadedBatch(self)
+
+
+class _ThreadedBatch(object):
+    """
+    Enters and exits the wrapped adapter's ``batch`` on the adapter's thread.
+
+    """
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self._cm = None
+
+    async def __aenter__(self):
+        self._cm = self.adapter.adapter.batch()
+        await self.adapter._call(self._cm.__enter__)
+
+    async def __aexit__(self, type, value, traceback):
+        return await self.adapter._call(
+            self._cm.__exit__, type, value, traceback,
+        )
+
+
+class AsyncSQLiteAdapter(ThreadedAsyncAdapter):
+    """
+    An async ``tern.adapters.sqlite.SQLiteAdapter``.
+
+    """
+
+    def _make_adapter(self, *args, **kwargs):
+        return SQLiteAdapter(*args, **kwargs)
+
+
+class AsyncPostgreSQLAdapter(ThreadedAsyncAdapter):
+    """
+    An async ``tern.adapters.postgresql.PostgreSQLAdapter``.  Like
+    ``AsyncSQLiteAdapter``, it runs the blocking adapter on a thread:  this is
+    not native asyncio I/O.  psycopg2 releases the GIL while it waits on the
+    network, so many databases can still be migrated concurrently.
+
+    psycopg2's asynchronous connections (``async_=True``) aren't used, as
+    they're always in autocommit mode and can't ``commit`` or ``rollback``,
+    which batches, pipelining and lock retries rely on.
+
+    """
+
+    def _make_adapter(self, *args, **kwargs):
+        from .postgresql import PostgreSQLAdapter
+        return PostgreSQLAdapter(*args, **kwargs)
@@ -0,0 +1,179 @@
+from __future__ import absolute_import
+from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
+import binascii
+import os
+
+
+class CloneMixin(object):
+    """
+    Support for testing changesets on disposable clones of the database, for
+    adapters which can create them cheaply.  Adapters inherit this before
+    ``tern.adapters.AdapterBase`` and implement the abstract hooks.
+
+    """
+    __metaclass__ = ABCMeta
+
+    # The number of spare clones of the database kept ready for
+    # ``test_clone``.
+    clone_spares = 1
+
+    def test_clone(self, changeset):
+        """
+        Apply and revert the given changeset on a disposable clone of the
+        database, see ``clone``.  Unlike ``test``, nothing runs on the
+        database itself, and statements which can't run in a transaction can
+        be tested.  Throws any SQL errors that might occur.
+
+        :param changeset:  The changeset to test.
+        :type changeset:  tern.Changeset
+
+        """
+        with self.clone() as clone:
+            clone._execute_script(changeset.setup, changeset.settings)
+            if changeset.teardown:
+                clone._execute_script(changeset.teardown, changeset.settings)
+
+    @contextmanager
+    def clone(self):
+        """
+        A context manager yielding an open adapter for a disposable clone of
+        the database, which is dropped when the block exits.
+
+        A database can't be cloned while it's connected to, so if the
+        adapter is open, its connection is closed for the duration and
+        reopened afterwards.  Any transaction in progress on it is rolled
+        back, so this can't be used in a batch.
+
+        To make clones fast, ``clone_spares`` spare clones are created after
+        each use, tagged with the digest of the applied changesets (see
+        ``get_digest``), and taken next time if the digest still matches.
+        Changes to the database made outside of Tern are not detected.
+        Without a digest, clones are created when needed.
+
+        """
+        refs = self._refs
+        if refs:
+            if getattr(self, '_batch', False):
+                raise ValueError('The database can\'t be cloned in a batch.')
+            self._refs = 1
+            self.close()
+        try:
+            with self:
+                applied = self.get_digest()
+            tag = None if applied is None else '{0:x}x{1:x}'.format(*applied)
+            name = self._claim_clone(tag)
+            try:
+                clone = self._clone_adapter(name)
+                with clone:
+                    yield clone
+            finally:
+                self._drop_clone(name)
+                if tag is not None:
+                    self._make_spare_clones(tag)
+        finally:
+            if refs:
+                self.open()
+                self._refs = refs
+
+    def _clone_name(self, kind, tag=None):
+        """
+        Return a new, unique name for a clone:  ``kind`` is ``'spare'`` for a
+        spare clone with the given tag, or ``'test'`` for one in use.
+
+        """
+        suffix = binascii.hexlify(os.urandom(4)).decode('ascii')
+        if kind == 'spare':
+            return '{0}spare_{1}_{2}'.format(self._clone_prefix(), tag, suffix)
+        return '{0}test_{1}'.format(self._clone_prefix(), suffix)
+
+    def _claim_clone(self, tag):
+        """
+        Take a spare clone with the given tag, dropping stale spares, or
+        create a clone.  Returns the name of the clone, which is now in use.
+
+        """
+        spare = '{0}spare_'.format(self._clone_prefix())
+        name = self._clone_name('test')
+        for existing in self._list_clones():
+            if not existing.startswith(spare):
+                continue
+            if tag is None or not existing.startswith(spare + tag + '_'):
+                self._drop_clone(existing)
+            elif self._rename_clone(existing, name):
+                return name
+        self._create_clone(name)
+        return name
+
+    def _make_spare_clones(self, tag):
+        """
+        Create spare clones with the given tag, up to ``clone_spares``.  Errors
+        are ignored, since spares only speed up the next clone.
+
+        """
+        prefix = '{0}spare_{1}_'.format(self._clone_prefix(), tag)
+        existing = [x for x in self._list_clones() if x.startswith(prefix)]
+        for _ in range(self.clone_spares - len(existing)):
+            try:
+                self._create_clone(self._clone_name('spare', tag))
+            except Exception:
+                return
+
+    @abstractmethod
+    def _clone_prefix(self):
+        """
+        Return the prefix of the names of this database's clones.
+
+        """
+        pass
+
+    @abstractmethod
+    def _list_clones(self):
+        """
+        Return the names of this database's clones.
+
+        """
+        pass
+
+    @abstractmethod
+    def _create_clone(self, name):
+        """
+        Create a clone of the database with the given name.
+
+        """
+        pass
+
+    @abstractmethod
+    def _rename_clone(self, name, new_name):
+        """
+        Rename a clone, returning ``False`` if it no longer exists, such as
+        when another process took it first.
+
+        """
+        pass
+
+    @abstractmethod
+    def _drop_clone(self, name):
+        """
+        Drop a clone, if it exists.
+
+        """
+        pass
+
+    @abstractmethod
+    def _clone_adapter(self, name):
+        """
+        Return an adapter, not yet open, for the clone with the given name.
+
+        """
+        pass
+
+    @abstractmethod
+    def _execute_script(self, sql, settings=()):
+        """
+        Execute SQL, which may contain several statements, with the given
+        settings (see ``Changeset.settings``), and commit it.  Used on
+        clones, where nothing needs to be rolled back or restored.
+
+        """
+        pass
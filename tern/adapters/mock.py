@@ -1,6 +1,8 @@
 from __future__ import absolute_import
+from contextlib import contextmanager
 
 from .adapterbase import AdapterBase
+from ..digest import digest
 
 
 class MockAdapter(AdapterBase):
@@ -33,11 +35,31 @@ class MockAdapter(AdapterBase):
             changeset.order = 12
         self.applied.append(changeset)
 
+    def apply_baseline(self, baseline, changesets):
+        if not self._open:
+            raise ValueError('Adapter has not been opened.')
+        self.applied.extend(changesets)
+
     def revert(self, changeset):
         self.applied.remove(changeset)
 
+    @contextmanager
+    def batch(self):
+        applied = list(self.applied)
+        try:
+            yield
+        except Exception:
+            self.applied = applied
+            raise
+
     def test(self, changeset):
         pass
 
     def get_applied(self):
         return self.applied
+
+    def initialize_digest(self):
+        pass
+
+    def get_digest(self):
+        return digest((cs.hex_hash, cs.order) for cs in self.applied)
@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+import threading
+from time import time
+
+
+class ConnectionPool(object):
+    """
+    A small, thread-safe pool of idle database connections.  Adapters return
+    their connection to the pool when closed and take one from it when
+    opened, so repeated API calls reuse a warm connection.
+
+    Pools are usually shared between adapters with the same connection
+    settings, see ``ConnectionPool.shared``.
+
+    :param size:  The maximum number of idle connections to keep.
+    :type size:  int
+
+    """
+
+    _shared = dict()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = list()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key, size):
+        """
+        Return the pool for the given key, creating it if necessary.
+
+        :param key:  A hashable identifying the connection settings.
+        :param size:  The size of the pool, if it needs to be created.
+        :type size:  int
+
+        """
+        with cls._shared_lock:
+            pool = cls._shared.get(key)
+            if pool is None:
+                pool = cls._shared[key] = cls(size)
+            return pool
+
+    def get(self):
+        """
+        Take an idle connection from the pool.
+
+        :returns:  A ``(connection, idle_seconds)`` tuple, or ``None`` if the
+            pool is empty.
+
+        """
+        with self._lock:
+            if not self._idle:
+                return None
+            conn, since = self._idle.pop()
+        return conn, time() - since
+
+    def put(self, conn):
+        """
+        Return a connection to the pool.
+
+        :returns:  ``False`` if the pool is full, in which case the caller
+            should close the connection.
+
+        """
+        with self._lock:
+            if len(self._idle) >= self.size:
+                return False
+            self._idle.append((conn, time()))
+            return True
+
+    def drain(self):
+        """
+        Remove and return all idle connections, so they can be closed.
+
+        """
+        with self._lock:
+            idle, self._idle = self._idle, list()
+        return [conn for conn, _ in idle]
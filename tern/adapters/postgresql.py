@@ -1,6 +1,15 @@
 from __future__ import absolute_import
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
 try:
     import psycopg2
+    import psycopg2.extensions
 except ImportError:
     raise ImportError(
         'You must have psycopg2 installed to use the Postgres adapter.'
@@ -8,10 +17,103 @@ except ImportError:
 
 from ..exceptions import NotInitialized
 from .adapterbase import AdapterBase
+from .clones import CloneMixin
+from .pool import ConnectionPool
 from ..changeset import Changeset
 
+logger = logging.getLogger(__name__)
+
+# The SQLSTATE of errors raised when ``lock_timeout`` expires.
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+# Splits SQL into statements, skipping over the semicolons in string
+# literals, quoted identifiers, comments and dollar-quoted bodies.
+_statement_re = re.compile(
+    r"""
+    [Ee]'(?:[^'\\]|\\.|'')*'?
+    | '(?:[^']|'')*'?
+    | "(?:[^"]|"")*"?
+    | --[^\n]*
+    | /\*(?:[^*]|\*(?!/))*(?:\*/)?
+    | (?P<dollar>\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$)
+    | (?P<end>;)
+    | [^'"$;/Ee-]+
+    | .
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Matches an index build, whose progress is reported.
+_index_build_re = re.compile(
+    r'^\s*(?:create\s+(?:unique\s+)?index|reindex)\b', re.I,
+)
+
+# Matches a concurrent index build, capturing the name of the index.
+_concurrent_index_re = re.compile(
+    r'^\s*create\s+(?:unique\s+)?index\s+concurrently\s+'
+    r'(?:if\s+not\s+exists\s+)?(?P<name>(?:"[^"]+"|[\w$]+)'
+    r'(?:\.(?:"[^"]+"|[\w$]+))?)',
+    re.I,
+)
+
+
+def split_statements(sql):
+    """
+    Split SQL into statements, for running outside of a transaction.  A
+    string with several statements runs as a single implicit transaction, so
+    statements such as ``create index concurrently`` must be sent alone.
+
+    :param sql:  The SQL.
+    :type sql:  str
+
+    :returns:  A list of statements, without empty ones.
+
+    """
+    statements = list()
+    start = 0
+    pos = 0
+    while pos < len(sql):
+        match = _statement_re.match(sql, pos)
+        pos = match.end()
+        if match.group('dollar') is not None:
+            close = sql.find(match.group('dollar'), pos)
+            pos = len(sql) if close < 0 else close + len(match.group('dollar'))
+        elif match.group('end') is not None:
+            if sql[start:pos - 1].strip():
+                statements.append(sql[start:pos].strip())
+            start = pos
+    if sql[start:].strip():
+        statements.append(sql[start:].strip())
+    return statements
+
+
+def _split_name(name):
+    """
+    Split a table name, as written in SQL, into its schema, or ``None`` if
+    it's unqualified, and its name.  Quoted parts are unquoted, and unquoted
+    ones folded to lower case.
+
+    """
+    parts = [
+        part[1:-1].replace('""', '"') if part.startswith('"')
+        else part.lower()
+        for part in re.findall(r'"(?:[^"]|"")*"|[^."]+', name)
+    ]
+    if len(parts) == 1:
+        return None, parts[0]
+    return parts[-2], parts[-1]
+
+
+def _quote_ident(name):
+    """
+    Quote an SQL identifier.
 
-class PostgreSQLAdapter(AdapterBase):
+    """
+    return '"{0}"'.format(name.replace('"', '""'))
+
+
+class PostgreSQLAdapter(CloneMixin, AdapterBase):
     """
     A PostgreSQL adapter for Tern.
 
@@ -21,20 +123,101 @@ class PostgreSQLAdapter(AdapterBase):
     Many methods are undocumented because they're already documented in
     AdapterBase.
 
+    :param pipeline:  The number of changesets ``apply_many`` sends to the
+        server in a single request.  ``0`` or ``1`` applies them one at a
+        time.
+    :type pipeline:  int
+    :param pool_size:  If set, closed connections are kept open for reuse,
+        up to this many per set of connection settings.  See
+        ``tern.adapters.pool.ConnectionPool``.
+    :type pool_size:  int
+    :param schema:  If set, the tern table is kept in this schema, and the
+        schema is put first on the search path while the adapter is open, so
+        changesets apply to it.  This is for databases with one schema per
+        tenant, see ``list_schemas`` and ``for_schema``.
+    :type schema:  str
+    :param maintenance_dbname:  The database to connect to when creating and
+        dropping clones of the database, see ``AdapterBase.clone``.
+    :type maintenance_dbname:  str
+    :param settings:  Settings for every session, such as
+        ``{'statement_timeout': '5min'}``.  Changesets may override them, see
+        ``Changeset.settings``.
+    :type settings:  dict or list of ``(name, value)`` tuples
+    :param lock_timeout:  If set, such as ``'2s'``, changesets give up
+        waiting for a lock after this long instead of queueing every query
+        behind them on a busy table.  They're rolled back and retried after a
+        jittered, exponentially growing delay, until ``lock_retry_deadline``
+        has passed.  The sessions holding locks are logged each time.
+    :type lock_timeout:  str
+    :param lock_retry_deadline:  How long to keep retrying a changeset which
+        timed out waiting for a lock, in seconds.
+    :type lock_retry_deadline:  float
+
+    Changesets with ``transaction`` switched off are run in autocommit mode,
+    one statement at a time, and recorded as applied afterwards.  Index
+    builds among them report their progress (see ``progress_interval``),
+    and a concurrent index build which fails, leaving an invalid index, has
+    the index dropped and is retried up to ``index_retries`` times.
+
     """
 
+    # The first and largest delays between lock timeout retries, in seconds.
+    lock_retry_delay = 0.5
+    lock_retry_max_delay = 30.0
+    # How often to log the progress of index builds, in seconds.
+    progress_interval = 10.0
+    # How many times to retry a failed concurrent index build.
+    index_retries = 1
+
+    _batch = False
+    _savepoint = False
+    # Whether the tern table has the timing columns, ``None`` until known.
+    _has_timings = None
+    # Whether the digest table exists, ``None`` until known.
+    _has_digest = None
+    _pending_sql = ''
+
     def __init__(
-        self, host, dbname, username, password, port=None, tern_table='tern'
+        self, host, dbname, username, password, port=None, tern_table='tern',
+        pipeline=0, pool_size=0, schema=None, maintenance_dbname='postgres',
+        settings=None, lock_timeout=None, lock_retry_deadline=60.0,
     ):
+        self._options = dict(
+            host=host, dbname=dbname, username=username, password=password,
+            port=port, tern_table=tern_table, pipeline=pipeline,
+            pool_size=pool_size, schema=schema,
+            maintenance_dbname=maintenance_dbname, settings=settings,
+            lock_timeout=lock_timeout, lock_retry_deadline=lock_retry_deadline,
+        )
+        self.maintenance_dbname = maintenance_dbname
+        if hasattr(settings, 'items'):
+            settings = sorted(settings.items())
+        self.settings = list(settings or [])
+        self.lock_timeout = lock_timeout or None
+        self.lock_retry_deadline = float(lock_retry_deadline)
         self.host = host or None
         self.port = port or None
         self.dbname = dbname or None
         self.username = username or None
         self.password = password or None
-        self.tablename = tern_table
+        self.schema = schema or None
+        self.tern_table = tern_table
+        if self.schema is None:
+            self.tablename = tern_table
+        else:
+            self.tablename = '{0}.{1}'.format(
+                _quote_ident(self.schema), tern_table,
+            )
+        self.pipeline = int(pipeline or 0)
+        if pool_size:
+            self.pool = ConnectionPool.shared(
+                (self.host, self.port, self.dbname, self.username,
+                    self.password),
+                int(pool_size),
+            )
 
-    def open(self):
-        self.conn = psycopg2.connect(
+    def _connect(self):
+        return psycopg2.connect(
             host=self.host,
             port=self.port,
             database=self.dbname,
@@ -42,8 +225,249 @@ class PostgreSQLAdapter(AdapterBase):
             password=self.password,
         )
 
-    def close(self):
-        self.conn.close()
+    def _disconnect(self, conn):
+        conn.close()
+
+    def _alive(self, conn):
+        return conn is not None and not conn.closed
+
+    def _ping(self, conn):
+        try:
+            with conn.cursor() as c:
+                self._execute(c, 'select 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _prepare(self, conn):
+        settings = list(self.settings)
+        if self.schema is not None:
+            settings.append(
+                ('search_path', _quote_ident(self.schema) + ', public'),
+            )
+        if not settings:
+            return
+        with conn.cursor() as c:
+            self._execute(
+                c,
+                'select ' + ', '.join(['set_config(%s, %s, false)'] * len(
+                    settings
+                )),
+                [x for setting in settings for x in setting]
+            )
+        conn.commit()
+
+    def _reset(self, conn):
+        conn.rollback()
+        if self.settings or self.schema is not None:
+            with conn.cursor() as c:
+                self._execute(c, 'reset all')
+            conn.commit()
+
+    def _with_settings(self, sql, settings):
+        """
+        Return SQL which runs ``sql`` with the given settings, restoring their
+        previous values afterwards.  The settings are local to the
+        transaction, so they're also restored if the SQL fails.
+
+        """
+        if not settings:
+            return sql
+        encoding = psycopg2.extensions.encodings[self.conn.encoding]
+        before = list()
+        after = list()
+        with self.conn.cursor() as c:
+            for i, (name, value) in enumerate(settings):
+                saved = 'tern.saved_{0}'.format(i)
+                before.append(c.mogrify(
+                    'select set_config(%s, current_setting(%s), true);\n'
+                    'select set_config(%s, %s, true)',
+                    (saved, name, name, value)
+                ).decode(encoding))
+                after.insert(0, c.mogrify(
+                    'select set_config(%s, current_setting(%s), true)',
+                    (name, saved)
+                ).decode(encoding))
+        return '\n;\n'.join(before + [sql] + after)
+
+    def _changeset_settings(self, changeset):
+        """
+        Return the settings to run the changeset's SQL with.
+
+        """
+        if self.lock_timeout is None:
+            return changeset.settings
+        # Listed first, so a changeset can override it.
+        return [('lock_timeout', str(self.lock_timeout))] + list(
+            changeset.settings
+        )
+
+    def _retry_lock_timeouts(self, run):
+        """
+        Call ``run`` until it doesn't fail with a lock timeout.  After each
+        timeout, the sessions holding locks are logged and ``run`` is retried
+        after a random delay of up to ``lock_retry_delay`` seconds, doubling
+        each time up to ``lock_retry_max_delay``.  The last error is raised
+        once ``lock_retry_deadline`` has passed.
+
+        """
+        if self.lock_timeout is None:
+            return run()
+        deadline = time.time() + self.lock_retry_deadline
+        delay = self.lock_retry_delay
+        attempt = 1
+        while True:
+            start = time.time()
+            try:
+                return run()
+            except psycopg2.OperationalError as e:
+                if e.pgcode != LOCK_NOT_AVAILABLE:
+                    raise
+                self._log_lock_holders(time.time() - start)
+                pause = random.uniform(0, delay)
+                if time.time() + pause > deadline:
+                    raise
+                logger.warning(
+                    'Timed out waiting for a lock (attempt %d), retrying in '
+                    '%.1fs.', attempt, pause,
+                )
+                time.sleep(pause)
+                delay = min(delay * 2, self.lock_retry_max_delay)
+                attempt += 1
+
+    def _log_lock_holders(self, seconds):
+        """
+        Log the other sessions which have held locks on tables in this
+        database for at least ``seconds``, the ones which can have blocked a
+        changeset that just timed out.
+
+        This is a heuristic:  the statement which timed out is gone, so it's
+        not known which tables it was waiting for, and sessions holding
+        unrelated locks are listed too.
+
+        """
+        try:
+            with self.conn.cursor() as c:
+                # ``now()`` is the start of the transaction, which during a
+                # batch may be long past.
+                self._execute(
+                    c,
+                    """
+                    select l.pid, l.mode, l.relation::regclass::text,
+                        a.state, left(a.query, 200),
+                        extract(epoch from clock_timestamp() - a.xact_start)
+                    from pg_locks l
+                    join pg_stat_activity a on a.pid = l.pid
+                    where l.granted
+                        and l.locktype = 'relation'
+                        and l.pid <> pg_backend_pid()
+                        and l.database = (
+                            select oid from pg_database
+                            where datname = current_database()
+                        )
+                        and a.xact_start
+                            <= clock_timestamp() - %s * interval '1 second'
+                    order by a.xact_start, l.pid
+                    """,
+                    (seconds,)
+                )
+                rows = c.fetchall()
+        except psycopg2.Error:
+            logger.warning('Could not list the sessions holding locks.')
+            rows = ()
+        if not self._batch:
+            self.conn.rollback()
+        for pid, mode, relation, state, query, held in rows:
+            logger.warning(
+                'Possible blocker:  pid %s has held %s on %s for %.1fs '
+                '(%s) %s',
+                pid, mode, relation, held, state, query,
+            )
+
+    def for_schema(self, schema):
+        """
+        Return a new adapter with the same settings, for the given schema.
+
+        """
+        options = dict(self._options, schema=schema)
+        return type(self)(**options)
+
+    def list_schemas(self, pattern='%'):
+        """
+        Return the names of the schemas matching the given pattern, in the
+        syntax of ``LIKE``.  System schemas are excluded.
+
+        """
+        with self.conn.cursor() as c:
+            self._execute(
+                c,
+                """
+                select nspname
+                from pg_namespace
+                where nspname like %s
+                    and nspname not like 'pg\\_%%'
+                    and nspname <> 'information_schema'
+                order by nspname
+                """,
+                (pattern,)
+            )
+            return [row[0] for row in c]
+
+    @contextmanager
+    def batch(self):
+        if self._batch:
+            raise ValueError('A batch is already in progress.')
+        self._batch = True
+        try:
+            with self.conn:
+                yield
+        finally:
+            self._batch = False
+            self._savepoint = False
+            self._pending_sql = ''
+
+    @contextmanager
+    def _changeset_transaction(self):
+        """
+        Run the block in its own transaction or, during a batch, in a savepoint
+        which is rolled back if the block fails.  This keeps the batch's
+        transaction usable, so the failing changeset can be reported.
+
+        To save round trips, the savepoint is created (and the previous one
+        released) by the bookkeeping statement, see ``_take_pending_sql``.
+
+        """
+        if not self._batch:
+            with self.conn:
+                yield
+            return
+        self._pending_sql = 'savepoint tern_changeset;\n'
+        if self._savepoint:
+            self._pending_sql = (
+                'release savepoint tern_changeset;\n' + self._pending_sql
+            )
+        try:
+            yield
+        except Exception:
+            if self._pending_sql:
+                # Failed before the savepoint was created.
+                self._pending_sql = ''
+            else:
+                with self.conn.cursor() as c:
+                    self._execute(c, 'rollback to savepoint tern_changeset')
+            raise
+
+    def _take_pending_sql(self):
+        """
+        Return any SQL which should be sent ahead of the next bookkeeping
+        statement, and clear it.
+
+        """
+        sql, self._pending_sql = self._pending_sql, ''
+        if sql:
+            self._savepoint = True
+        return sql
 
     def _changeset_exists(self, changeset):
         """
@@ -51,7 +475,8 @@ class PostgreSQLAdapter(AdapterBase):
 
         """
         with self.conn.cursor() as c:
-            c.execute(
+            self._execute(
+                c,
                 """
                 select count(*)
                 from {0}
@@ -61,45 +486,137 @@ class PostgreSQLAdapter(AdapterBase):
             )
             return c.fetchone()[0] > 0
 
-    def _save_changeset(self, changeset):
+    def _save_changeset(self, changeset, applied_at=None, duration=None):
         """
-        Save changeset in the tern table.  Does not commit the change.
+        Save changeset in the tern table.  Does not commit the change.  Raises
+        ``ValueError`` if the changeset already is saved.  This takes a single
+        round trip.
+
+        If timings are recorded, ``applied_at`` defaults to the current time
+        of the database, and the duration is filled in by the SQL from
+        ``_timing_sql`` once the setup has run.
 
         """
-        if self._changeset_exists(changeset):
-            return ValueError('Changeset already exists in database.')
+        sql, params = self._insert_sql(
+            changeset, applied_at, duration, unless_exists=True,
+        )
         with self.conn.cursor() as c:
-            c.execute(
+            self._execute(c, self._take_pending_sql() + sql, params)
+            if c.rowcount == 0:
+                raise ValueError('Changeset already exists in database.')
+
+    def _insert_sql(
+        self, changeset, applied_at=None, duration=None, unless_exists=False,
+    ):
+        """
+        Return the SQL and parameters inserting the changeset into the tern
+        table, with its timing columns if they're recorded.  With
+        ``unless_exists``, nothing is inserted if the changeset is already
+        saved.  (Not ``on conflict do nothing``, which needs Postgres 9.5.)
+
+        """
+        columns = 'hash, created_at, setup, teardown, "order"'
+        values = '%s, %s, %s, %s, %s'
+        params = [
+            changeset.hex_hash, changeset.created_at, changeset.setup,
+            changeset.teardown, changeset.order,
+        ]
+        if self._timings_enabled():
+            columns += ', applied_at, duration, statements'
+            values += (
+                ', coalesce(%s, extract(epoch from clock_timestamp())), %s, %s'
+            )
+            params += [
+                applied_at, duration, len(split_statements(changeset.setup)),
+            ]
+        if unless_exists:
+            return (
+                """
+                insert into {0}({1}) select {2}
+                where not exists (select 1 from {0} where hash = %s)
+                """.format(self.tablename, columns, values),
+                params + [changeset.hex_hash],
+            )
+        return (
+            'insert into {0}({1}) values ({2})'.format(
+                self.tablename, columns, values,
+            ),
+            params,
+        )
+
+    def _timing_sql(self, changeset):
+        """
+        Return SQL to run right after the changeset's setup, in the same
+        request, recording how long it took, or ``''`` if timings aren't
+        recorded.
+
+        """
+        if not self._timings_enabled():
+            return ''
+        with self.conn.cursor() as c:
+            return '\n;\n' + c.mogrify(
                 """
-                insert into {0}(hash, created_at, setup, teardown,
-                    "order")
-                values (%s, %s, %s, %s, %s)
+                update {0}
+                set duration = extract(epoch from clock_timestamp())
+                    - applied_at
+                where hash = %s
                 """.format(self.tablename),
-                (
-                    changeset.hex_hash, changeset.created_at,
-                    changeset.setup, changeset.teardown, changeset.order
+                (changeset.hex_hash,)
+            ).decode(psycopg2.extensions.encodings[self.conn.encoding])
+
+    def _timings_enabled(self):
+        if self._has_timings is None:
+            with self.conn.cursor() as c:
+                self._execute(
+                    c,
+                    """
+                    select count(*)
+                    from information_schema.columns
+                    where table_name = %s and column_name = 'duration'
+                        and table_schema = coalesce(%s, current_schema())
+                    """,
+                    (self.tern_table, self.schema)
                 )
-            )
+                self._has_timings = c.fetchone()[0] > 0
+        return self._has_timings
 
     def _delete_changeset(self, changeset):
         """
         Delete changeset in the tern table.  Does not commit the change.
+        Raises ``ValueError`` if the changeset is not saved.  This takes a
+        single round trip.
 
         """
-        if not self._changeset_exists(changeset):
-            raise ValueError('Changeset does not exist in database.')
         with self.conn.cursor() as c:
-            c.execute(
-                """
+            self._execute(
+                c,
+                self._take_pending_sql() + """
                 delete from {0} where hash = %s
                 """.format(self.tablename),
                 (changeset.hex_hash,)
             )
+            if c.rowcount == 0:
+                raise ValueError('Changeset does not exist in database.')
+
+    def _next_order(self):
+        """
+        Return the order to assign to a new changeset.  (max(order) + 1)
+
+        """
+        with self.conn.cursor() as c:
+            self._execute(
+                c,
+                """
+                select coalesce(max("order"), 0) + 1
+                from {0}
+                """.format(self.tablename))
+            return c.fetchone()[0]
 
     def initialize_tern(self):
         with self.conn:
             with self.conn.cursor() as c:
-                c.execute(
+                self._execute(
+                    c,
                     """
                     create table {0} (
                         hash text primary key,
@@ -109,43 +626,183 @@ class PostgreSQLAdapter(AdapterBase):
                         "order" integer not null
                     )
                     """.format(self.tablename))
+        self.initialize_digest()
+        self.initialize_timings()
+
+    def initialize_timings(self):
+        with self.conn:
+            with self.conn.cursor() as c:
+                # Not ``add column if not exists``, which needs Postgres 9.6.
+                self._execute(
+                    c,
+                    """
+                    select column_name
+                    from information_schema.columns
+                    where table_name = %s
+                        and table_schema = coalesce(%s, current_schema())
+                    """,
+                    (self.tern_table, self.schema)
+                )
+                existing = set(row[0] for row in c.fetchall())
+                columns = [
+                    'add column {0} {1}'.format(column, type_)
+                    for column, type_ in [
+                        ('applied_at', 'double precision'),
+                        ('duration', 'double precision'),
+                        ('statements', 'integer'),
+                    ]
+                    if column not in existing
+                ]
+                if columns:
+                    self._execute(c, 'alter table {0} {1}'.format(
+                        self.tablename, ', '.join(columns),
+                    ))
+        self._has_timings = True
+
+    def get_timings(self, hashes=None):
+        if not self._timings_enabled():
+            return None
+        with self.conn.cursor() as c:
+            self._execute(
+                c,
+                """
+                select hash, applied_at, duration, statements
+                from {0}
+                where duration is not null
+                    and (%s is null or hash = any(%s))
+                """.format(self.tablename),
+                (None if hashes is None else True, list(hashes or ()))
+            )
+            return dict((row[0], tuple(row[1:])) for row in c)
+
+    def _digest_value_sql(self, row):
+        """
+        Return an SQL expression for ``tern.digest.changeset_value`` of the
+        given row of the tern table.
+
+        """
+        return (
+            "('x' || lpad(substr(md5({0}.\"order\" || ':' || {0}.hash), "
+            "1, 8), 16, '0'))::bit(64)::bigint"
+        ).format(row)
+
+    def initialize_digest(self):
+        # The digest is kept in a one-row table, updated by a trigger on the
+        # tern table, so applying a changeset costs no extra round trips.
+        with self.conn:
+            with self.conn.cursor() as c:
+                self._execute(
+                    c,
+                    """
+                    lock table {0} in share mode;
+                    drop table if exists {0}_digest;
+                    create table {0}_digest (
+                        applied bigint not null,
+                        digest bigint not null
+                    );
+                    insert into {0}_digest
+                    select count(*), coalesce(sum({1}), 0)
+                    from {0} t;
+                    create or replace function {0}_digest_update()
+                    returns trigger language plpgsql as $$
+                    begin
+                        if tg_op in ('INSERT', 'UPDATE') then
+                            update {0}_digest
+                            set applied = applied + 1, digest = digest + {2};
+                        end if;
+                        if tg_op in ('DELETE', 'UPDATE') then
+                            update {0}_digest
+                            set applied = applied - 1, digest = digest - {3};
+                        end if;
+                        return null;
+                    end
+                    $$;
+                    drop trigger if exists {4}_digest on {0};
+                    create trigger {4}_digest
+                    after insert or update of hash, "order" or delete on {0}
+                    for each row execute procedure {0}_digest_update();
+                    """.format(
+                        self.tablename,
+                        self._digest_value_sql('t'),
+                        self._digest_value_sql('new'),
+                        self._digest_value_sql('old'),
+                        self.tern_table,
+                    ))
+        self._has_digest = True
+
+    def _digest_enabled(self):
+        """
+        Whether the digest table exists; not if the database was initialized
+        before digests were added.  Checked rather than caught, as a failed
+        query would abort the caller's transaction.
+
+        """
+        if self._has_digest is None:
+            with self.conn.cursor() as c:
+                self._execute(
+                    c,
+                    """
+                    select count(*)
+                    from information_schema.tables
+                    where table_name = %s
+                        and table_schema = coalesce(%s, current_schema())
+                    """,
+                    (self.tern_table + '_digest', self.schema)
+                )
+                self._has_digest = c.fetchone()[0] > 0
+        return self._has_digest
+
+    def get_digest(self):
+        if not self._digest_enabled():
+            return None
+        with self.conn.cursor() as c:
+            self._execute(
+                c,
+                """
+                select applied, digest
+                from {0}_digest
+                """.format(self.tablename))
+            row = c.fetchone()
+            return None if row is None else (row[0], row[1])
 
     def verify_tern(self):
         with self.conn.cursor() as c:
-            c.execute(
+            self._execute(
+                c,
                 """
                 SELECT EXISTS(
                     SELECT *
                     FROM information_schema.tables
-                    WHERE table_name = '{0}'
+                    WHERE table_name = %s
+                        AND table_schema = COALESCE(%s, current_schema())
                 );
-                """.format(self.tablename))
+                """,
+                (self.tern_table, self.schema)
+            )
             if c.fetchone()[0] == 0:
                 raise NotInitialized()
 
     def apply(self, changeset):
-        if self._changeset_exists(changeset):
-            raise ValueError('Changeset has already been applied.')
-
+        # The hash depends on the order, so it must be assigned before the
+        # changeset is saved.  This costs an extra round trip, but changesets
+        # loaded from the tern directory always have an order.
         if changeset.order is None:
-            with self.conn.cursor() as c:
-                c.execute(
-                    """
-                    select max("order")
-                    from {0}
-                    """.format(self.tablename))
-                order = c.fetchone()[0]
-                if order is None:
-                    order = 1
-                else:
-                    order += 1
-                changeset.order = order
+            changeset.order = self._next_order()
+        if not changeset.transaction:
+            self._apply_autocommit(changeset)
+            return
+        self._retry_lock_timeouts(lambda: self._apply(changeset))
 
-        with self.conn:
+    def _apply(self, changeset):
+        with self._changeset_transaction():
+            # Saving first fails before any SQL is run if the changeset has
+            # already been applied, and it's rolled back if the setup fails.
+            self._save_changeset(changeset)
             try:
                 with self.conn.cursor() as c:
-                    c.execute(changeset.setup)
-                self._save_changeset(changeset)
+                    self._execute(c, self._with_settings(
+                        changeset.setup, self._changeset_settings(changeset),
+                    ) + self._timing_sql(changeset))
             except psycopg2.ProgrammingError:
                 print('An error occurred while applying {}'.format(
                     changeset.hex_hash
@@ -155,38 +812,534 @@ class PostgreSQLAdapter(AdapterBase):
                 print()
                 raise
 
+    def apply_many(self, changesets, progress=None):
+        """
+        With ``pipeline`` set, the setup SQL and bookkeeping of up to
+        ``pipeline`` changesets are sent in one request, in a single
+        transaction (or savepoint, during a batch).  If the request fails, it
+        is rolled back and its changesets are applied one at a time, to find
+        and report the failing changeset.
+
+        """
+        if self.pipeline < 2:
+            return super(PostgreSQLAdapter, self).apply_many(
+                changesets, progress,
+            )
+        for i in range(0, len(changesets), self.pipeline):
+            group = changesets[i:i + self.pipeline]
+            if len(group) < 2 or any(
+                cs.order is None or not cs.transaction for cs in group
+            ):
+                super(PostgreSQLAdapter, self).apply_many(group, progress)
+                continue
+            try:
+                self._apply_pipelined(group)
+            except psycopg2.Error:
+                super(PostgreSQLAdapter, self).apply_many(group, progress)
+                continue
+            if progress is not None:
+                for changeset in group:
+                    progress(changeset)
+
+    def _apply_pipelined(self, changesets):
+        """
+        Apply the changesets in a single request.  Nothing is applied if it
+        fails.
+
+        """
+        encoding = psycopg2.extensions.encodings[self.conn.encoding]
+        with self.conn.cursor() as c:
+            statements = list()
+            for changeset in changesets:
+                # A plain insert, so a changeset which has already been
+                # applied fails the request.
+                statements.append(
+                    c.mogrify(*self._insert_sql(changeset)).decode(encoding)
+                )
+                statements.append(self._with_settings(
+                    changeset.setup, self._changeset_settings(changeset),
+                ) + self._timing_sql(changeset))
+            sql = '\n;\n'.join(statements)
+
+        if not self._batch:
+            with self.conn:
+                with self.conn.cursor() as c:
+                    self._execute(c, sql)
+            return
+        sql = (
+            'savepoint tern_pipeline;\n' + sql +
+            '\n;\nrelease savepoint tern_pipeline;'
+        )
+        try:
+            with self.conn.cursor() as c:
+                self._execute(c, sql)
+        except psycopg2.Error:
+            with self.conn.cursor() as c:
+                self._execute(c, 'rollback to savepoint tern_pipeline')
+            raise
+
+    def apply_baseline(self, baseline, changesets):
+        # The baseline and the bookkeeping go in a single request.
+        encoding = psycopg2.extensions.encodings[self.conn.encoding]
+        statements = [baseline.setup]
+        with self.conn.cursor() as c:
+            if changesets:
+                statements.append(
+                    """
+                    insert into {0}(hash, created_at, setup, teardown,
+                        "order")
+                    values
+                    """.format(self.tablename) + ',\n'.join(
+                        c.mogrify('(%s, %s, %s, %s, %s)', (
+                            cs.hex_hash, cs.created_at, cs.setup,
+                            cs.teardown, cs.order,
+                        )).decode(encoding) for cs in changesets
+                    )
+                )
+        with self._changeset_transaction():
+            with self.conn.cursor() as c:
+                self._execute(
+                    c, self._take_pending_sql() + '\n;\n'.join(statements),
+                )
+
     def revert(self, changeset):
-        if not self._changeset_exists(changeset):
-            raise ValueError('Changeset has not yet been applied.')
+        if not changeset.transaction:
+            self._revert_autocommit(changeset)
+            return
+        self._retry_lock_timeouts(lambda: self._revert(changeset))
 
-        with self.conn:
+    def _revert(self, changeset):
+        with self._changeset_transaction():
+            self._delete_changeset(changeset)
             if changeset.teardown:
                 with self.conn.cursor() as c:
-                    c.execute(changeset.teardown)
-            self._delete_changeset(changeset)
+                    self._execute(c, self._with_settings(
+                        changeset.teardown,
+                        self._changeset_settings(changeset),
+                    ))
 
     def test(self, changeset):
+        """
+        Changesets with ``transaction`` switched off can't be rolled back, so
+        they're tested on a clone of the database, see ``test_clone``.
+
+        """
+        if not changeset.transaction:
+            return self.test_clone(changeset)
         try:
             with self.conn.cursor() as c:
-                c.execute(changeset.setup)
+                self._execute(c, self._with_settings(
+                    changeset.setup, changeset.settings,
+                ))
                 if changeset.teardown:
-                    c.execute(changeset.teardown)
+                    self._execute(c, self._with_settings(
+                        changeset.teardown, changeset.settings,
+                    ))
         finally:
             self.conn.rollback()
 
+    def _apply_autocommit(self, changeset):
+        """
+        Apply a changeset outside of a transaction, recording it once the
+        setup has succeeded.
+
+        """
+        self._check_autocommit(changeset)
+        if self._changeset_exists(changeset):
+            raise ValueError('Changeset already exists in database.')
+        self.conn.rollback()
+        start = time.time()
+        self._run_autocommit(changeset.setup, changeset)
+        with self._changeset_transaction():
+            self._save_changeset(changeset, start, time.time() - start)
+
+    def _revert_autocommit(self, changeset):
+        """
+        Revert a changeset outside of a transaction, deleting its record
+        once the teardown has succeeded.
+
+        """
+        self._check_autocommit(changeset)
+        if not self._changeset_exists(changeset):
+            raise ValueError('Changeset does not exist in database.')
+        self.conn.rollback()
+        self._run_autocommit(changeset.teardown, changeset)
+        with self._changeset_transaction():
+            self._delete_changeset(changeset)
+
+    def _check_autocommit(self, changeset):
+        if self._batch:
+            raise ValueError(
+                'Changeset {0} runs outside of a transaction, so it can\'t '
+                'be run in a batch.'.format(changeset.hex_hash)
+            )
+
+    def _run_autocommit(self, sql, changeset):
+        """
+        Run the statements of a changeset in autocommit mode, with its
+        settings applied to the session and restored afterwards.
+
+        """
+        settings = self._changeset_settings(changeset)
+        self.conn.autocommit = True
+        try:
+            with self.conn.cursor() as c:
+                previous = list()
+                for name, value in settings:
+                    self._execute(
+                        c,
+                        'select current_setting(%s), '
+                        'set_config(%s, %s, false)',
+                        (name, name, value)
+                    )
+                    previous.append((name, c.fetchone()[0]))
+                try:
+                    for statement in split_statements(sql):
+                        self._run_statement(c, statement)
+                finally:
+                    for name, value in reversed(previous):
+                        self._execute(
+                            c, 'select set_config(%s, %s, false)',
+                            (name, value),
+                        )
+        finally:
+            self.conn.autocommit = False
+
+    def _run_statement(self, cursor, statement):
+        """
+        Run one statement in autocommit mode.  Lock timeouts are retried (see
+        ``_retry_lock_timeouts``), as are concurrent index builds which fail
+        and leave an invalid index behind, once it's dropped.
+
+        """
+        index = _concurrent_index_re.match(statement)
+        retries = self.index_retries if index else 0
+        while True:
+            try:
+                with self._index_progress(statement):
+                    self._retry_lock_timeouts(
+                        lambda: self._execute(cursor, statement),
+                    )
+                return
+            except psycopg2.Error:
+                # The invalid index is dropped even when giving up, so the
+                # changeset can be applied again.
+                if not index or not self._drop_invalid_index(
+                    cursor, index.group('name'),
+                ) or retries <= 0:
+                    raise
+                retries -= 1
+                logger.warning(
+                    'Building index %s failed, retrying.', index.group('name'),
+                )
+
+    def _drop_invalid_index(self, cursor, name):
+        """
+        Drop the index if a failed concurrent build left it invalid.  Returns
+        whether it was dropped.
+
+        """
+        try:
+            # Not ``to_regclass``, which needs Postgres 9.4.  The cursor
+            # autocommits, so an error doesn't abort a transaction.
+            self._execute(
+                cursor,
+                """
+                select not indisvalid
+                from pg_index
+                where indexrelid = %s::regclass
+                """,
+                (name,)
+            )
+        except psycopg2.ProgrammingError:
+            # The index doesn't exist.
+            return False
+        row = cursor.fetchone()
+        if row is None or not row[0]:
+            return False
+        logger.warning('Dropping invalid index %s.', name)
+        self._execute(cursor, 'drop index concurrently if exists ' + name)
+        return True
+
+    @contextmanager
+    def _index_progress(self, statement):
+        """
+        While the block runs an index build, log its progress from
+        ``pg_stat_progress_create_index`` every ``progress_interval`` seconds,
+        using a second connection.
+
+        """
+        if not self.progress_interval or not _index_build_re.match(statement):
+            yield
+            return
+        pid = self.conn.get_backend_pid()
+        done = threading.Event()
+
+        def poll():
+            conn = self._connect()
+            try:
+                conn.autocommit = True
+                while not done.wait(self.progress_interval):
+                    with conn.cursor() as c:
+                        c.execute(
+                            """
+                            select phase, blocks_done, blocks_total,
+                                tuples_done, tuples_total
+                            from pg_stat_progress_create_index
+                            where pid = %s
+                            """,
+                            (pid,)
+                        )
+                        row = c.fetchone()
+                    if row is not None:
+                        logger.info(
+                            'Index build:  %s, %s of %s blocks, %s of %s '
+                            'tuples.', *row
+                        )
+            except psycopg2.Error:
+                # Before Postgres 12, or the statement has finished.
+                pass
+            finally:
+                conn.close()
+
+        thread = threading.Thread(target=poll)
+        thread.daemon = True
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    @contextmanager
+    def _maintenance_cursor(self):
+        """
+        Yield an autocommitting cursor on the maintenance database, for
+        creating and dropping clones.
+
+        """
+        conn = psycopg2.connect(
+            host=self.host,
+            port=self.port,
+            database=self.maintenance_dbname,
+            user=self.username,
+            password=self.password,
+        )
+        try:
+            conn.autocommit = True
+            with conn.cursor() as c:
+                yield c
+        finally:
+            conn.close()
+
+    def _clone_prefix(self):
+        source = hashlib.md5(str(self.dbname).encode('utf-8')).hexdigest()
+        return 'tern_{0}_'.format(source[:8])
+
+    def _list_clones(self):
+        with self._maintenance_cursor() as c:
+            self._execute(
+                c,
+                """
+                select datname
+                from pg_database
+                where datname like %s
+                """,
+                (self._clone_prefix().replace('_', '\\_') + '%',)
+            )
+            return [row[0] for row in c]
+
+    def _create_clone(self, name):
+        # The template must have no other sessions, so close the pooled
+        # connections to it.
+        if self.pool is not None:
+            for conn in self.pool.drain():
+                self._discard(conn)
+        with self._maintenance_cursor() as c:
+            self._execute(
+                c,
+                'create database {0} template {1}'.format(
+                    _quote_ident(name), _quote_ident(self.dbname),
+                )
+            )
+
+    def _rename_clone(self, name, new_name):
+        with self._maintenance_cursor() as c:
+            try:
+                self._execute(
+                    c,
+                    'alter database {0} rename to {1}'.format(
+                        _quote_ident(name), _quote_ident(new_name),
+                    )
+                )
+                return True
+            except psycopg2.Error:
+                return False
+
+    def _drop_clone(self, name):
+        with self._maintenance_cursor() as c:
+            self._execute(
+                c, 'drop database if exists {0}'.format(_quote_ident(name)),
+            )
+
+    def _clone_adapter(self, name):
+        return type(self)(**dict(self._options, dbname=name, pool_size=0))
+
+    def _execute_script(self, sql, settings=()):
+        # On a clone, so statements which can't run in a transaction block,
+        # such as ``create index concurrently``, can be tested, and the
+        # settings can be left for the session.
+        self.conn.autocommit = True
+        try:
+            with self.conn.cursor() as c:
+                for name, value in settings:
+                    self._execute(
+                        c, 'select set_config(%s, %s, false)', (name, value),
+                    )
+                for statement in split_statements(sql):
+                    self._execute(c, statement)
+        finally:
+            self.conn.autocommit = False
+
     def get_applied(self):
-        applied = list()
         with self.conn.cursor() as c:
-            c.execute(
+            self._execute(
+                c,
                 """
                 select setup, teardown, "order", created_at
                 from {0}
                 """.format(self.tablename))
-            for row in c:
-                applied.append(Changeset(
-                    setup=row[0],
-                    teardown=row[1],
-                    order=row[2],
-                    created_at=row[3],
-                ))
-        return applied
+            return self._changesets_from_rows(c)
+
+    def get_applied_hashes(self, low=None, high=None):
+        with self.conn.cursor() as c:
+            self._execute(
+                c,
+                """
+                select hash, "order"
+                from {0}
+                where (%s is null or "order" >= %s)
+                    and (%s is null or "order" < %s)
+                """.format(self.tablename),
+                (low, low, high, high)
+            )
+            return c.fetchall()
+
+    def get_order_range(self):
+        with self.conn.cursor() as c:
+            self._execute(
+                c,
+                """
+                select min("order"), max("order")
+                from {0}
+                """.format(self.tablename))
+            row = c.fetchone()
+            return None if row[0] is None else (row[0], row[1])
+
+    def get_range_digests(self, low, width, count):
+        with self.conn.cursor() as c:
+            self._execute(
+                c,
+                """
+                select ("order" - %s) / %s, count(*), sum({1})
+                from {0} t
+                where "order" >= %s and "order" < %s
+                group by 1
+                """.format(self.tablename, self._digest_value_sql('t')),
+                (low, width, low, low + width * count)
+            )
+            digests = [(0, 0)] * count
+            for bucket, applied, total in c:
+                digests[bucket] = (applied, int(total))
+            return digests
+
+    def get_changesets(self, hashes):
+        hashes = list(hashes)
+        if not hashes:
+            return list()
+        with self.conn.cursor() as c:
+            self._execute(
+                c,
+                """
+                select setup, teardown, "order", created_at
+                from {0}
+                where hash = any(%s)
+                """.format(self.tablename),
+                (hashes,)
+            )
+            return self._changesets_from_rows(c)
+
+    def split_statements(self, sql):
+        return split_statements(sql)
+
+    def get_table_sizes(self, tables):
+        if not tables:
+            return dict()
+        names = [_split_name(table) for table in tables]
+        with self.conn.cursor() as c:
+            # Names are resolved here rather than with ``to_regclass``, which
+            # needs Postgres 9.4.  Unqualified names must be visible on the
+            # search path.
+            self._execute(
+                c,
+                """
+                select t.name, pg_total_relation_size(c.oid),
+                    case when c.reltuples < 0 then null
+                        else c.reltuples::bigint end
+                from (
+                    select (%s::text[])[i] as name,
+                        (%s::text[])[i] as nspname,
+                        (%s::text[])[i] as relname
+                    from generate_subscripts(%s::text[], 1) i
+                ) t
+                join pg_class c on c.relname = t.relname
+                join pg_namespace n on n.oid = c.relnamespace
+                where case when t.nspname is null
+                    then pg_table_is_visible(c.oid)
+                    else n.nspname = t.nspname end
+                """,
+                (
+                    list(tables), [schema for schema, _ in names],
+                    [name for _, name in names], list(tables),
+                )
+            )
+            sizes = dict((row[0], (row[1], row[2])) for row in c)
+        self.conn.rollback()
+        return sizes
+
+    def explain(self, statement):
+        try:
+            with self.conn.cursor() as c:
+                self._execute(c, 'explain (format json) ' + statement)
+                plan = c.fetchone()[0]
+        except psycopg2.Error:
+            # Such as a table created by an earlier changeset.
+            return None
+        finally:
+            self.conn.rollback()
+        if not isinstance(plan, list):
+            # Older versions of psycopg2 don't decode the JSON.
+            plan = json.loads(plan)
+        # The modifying node of DML may not estimate rows, its input does.
+        nodes = [plan[0]['Plan']]
+        rows = 0
+        while nodes:
+            node = nodes.pop()
+            rows = max(rows, int(node.get('Plan Rows', 0)))
+            nodes.extend(node.get('Plans', ()))
+        return rows
+
+    def _changesets_from_rows(self, rows):
+        """
+        Create Changeset objects from ``(setup, teardown, order, created_at)``
+        rows.
+
+        """
+        return [
+            Changeset(
+                setup=row[0],
+                teardown=row[1],
+                order=row[2],
+                created_at=row[3],
+            ) for row in rows
+        ]
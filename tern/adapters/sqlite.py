@@ -1,21 +1,166 @@
 from __future__ import absolute_import
-from contextlib import closing
+from contextlib import closing, contextmanager
+import logging
+import os
+import os.path
+import re
 import sqlite3
+import tempfile
+from time import time
 
 from ..exceptions import NotInitialized
 from .adapterbase import AdapterBase
+from .clones import CloneMixin
+from ..changeset import Changeset
+from ..digest import changeset_value, digest
 
+logger = logging.getLogger(__name__)
+
+# Matches a full table scan in the output of ``explain query plan``.
+_scan_re = re.compile(r'^SCAN (?:TABLE )?(\S+)$')
+
+
+# Splits SQL into tokens, skipping over the semicolons in string literals,
+# quoted identifiers and comments.  Keywords are captured to find trigger
+# bodies.
+_token_re = re.compile(
+    r"""
+    '[^']*(?:''[^']*)*'?
+    | "[^"]*(?:""[^"]*)*"?
+    | `[^`]*(?:``[^`]*)*`?
+    | \[[^\]]*\]?
+    | (?P<skip>\s+|--[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<end>;)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | [^'"`\[\sA-Za-z_;/-]+
+    | .
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def _is_trigger(words):
+    """
+    Whether the leading keywords of a statement create a trigger.
+
+    """
+    if words[:1] == ['explain']:
+        words = words[1:]
+    if words[1:2] in (['temp'], ['temporary']):
+        words = words[:1] + words[2:]
+    return words[:2] == ['create', 'trigger']
+
+
+def split_statements(sql):
+    """
+    Split SQL into its statements, in a single pass.  Semicolons in strings,
+    quoted identifiers and comments are skipped, and a trigger ends only at
+    ``; END;``, as with ``sqlite3.complete_statement``.  Empty statements are
+    dropped.
+
+    :param sql:  The SQL to split.
+    :type sql:  str
+
+    :returns:  A list of statements.
 
-class SQLiteAdapter(AdapterBase):
+    """
+    statements = list()
+    start = 0
+    pos = 0
+    # The leading keywords of the current statement, and within a trigger,
+    # how much of ``; END`` the last tokens were.
+    words = list()
+    state = None
+    while pos < len(sql):
+        match = _token_re.match(sql, pos)
+        pos = match.end()
+        word = match.group('word')
+        if match.group('skip') is not None:
+            continue
+        elif match.group('end') is not None:
+            if state == 'end' or not _is_trigger(words):
+                statement = sql[start:pos]
+                if statement.strip(' \t\r\n;'):
+                    statements.append(statement)
+                start = pos
+                words = list()
+                state = None
+            else:
+                state = ';'
+        elif word is not None:
+            word = word.lower()
+            if len(words) < 4:
+                words.append(word)
+            state = 'end' if state == ';' and word == 'end' else None
+        else:
+            state = None
+    if sql[start:].strip():
+        statements.append(sql[start:])
+    return statements
+
+
+def _controls_transaction(statements):
+    """
+    Whether any of the statements begins or ends a transaction, as changesets
+    written for ``executescript`` may do.  Savepoints don't count.
+
+    """
+    for statement in statements:
+        words = list()
+        for match in _token_re.finditer(statement):
+            if match.group('skip') is not None:
+                continue
+            word = match.group('word')
+            if word is None or len(words) == 3:
+                break
+            words.append(word.lower())
+        if words[:1] in (['begin'], ['commit'], ['end']):
+            return True
+        if words[:1] == ['rollback'] and 'to' not in words:
+            return True
+    return False
+
+
+class SQLiteAdapter(CloneMixin, AdapterBase):
     """
     This allows Tern to work on SQLite databases.
 
     Many methods are undocumented because they're already documented in
     AdapterBase.
 
+    :param test_snapshot:  Where ``test`` copies the database to before
+        running the changeset:  ``'memory'``, or ``'file'`` for a temporary
+        file, for databases too large to copy into memory.
+    :type test_snapshot:  str
+    :param settings:  Pragmas set on every connection, such as
+        ``{'foreign_keys': 'on'}``.  Changesets may override them, see
+        ``Changeset.settings``.
+    :type settings:  dict or list of ``(name, value)`` tuples
+
     """
 
-    def __init__(self, host, dbname, username, password, tern_table='tern'):
+    # The maximum number of bound parameters to use in one statement.
+    max_variables = 500
+    # Whether the database keeps a digest, checked when the adapter is opened.
+    _has_digest = False
+    # Whether the tern table has the timing columns, likewise.
+    _has_timings = False
+    _batch = False
+    _pragma_name_re = re.compile(
+        r'^[a-z_][a-z0-9_]*(\.[a-z_][a-z0-9_]*)?$', re.I,
+    )
+    _pragma_value_re = re.compile(r'^(-?\d+|[a-z_][a-z0-9_]*)$', re.I)
+    # Pragmas which can't be changed inside a transaction.
+    _transaction_pragmas = frozenset([
+        'foreign_keys', 'journal_mode', 'synchronous',
+    ])
+
+    def __init__(
+        self, host, dbname, username, password, tern_table='tern',
+        test_snapshot='memory', settings=None,
+    ):
+        if test_snapshot not in ('memory', 'file'):
+            raise ValueError('test_snapshot must be "memory" or "file".')
         if dbname is not None:
             raise ValueError('``dbname`` is not supported.')
         if username is not None:
@@ -24,12 +169,132 @@ class SQLiteAdapter(AdapterBase):
             raise ValueError('``password`` is not supported.')
         self.host = host
         self.tablename = tern_table
+        self.test_snapshot = test_snapshot
+        if hasattr(settings, 'items'):
+            settings = sorted(settings.items())
+        self.settings = list(settings or [])
 
-    def open(self):
-        self.conn = sqlite3.connect(self.host)
+    def _connect(self):
+        # Transactions are begun explicitly, see ``_transaction``.
+        return sqlite3.connect(self.host, isolation_level=None)
 
-    def close(self):
-        self.conn.close()
+    def _disconnect(self, conn):
+        conn.close()
+
+    def _prepare(self, conn):
+        # Used to compute digests in queries; SQLite has no MD5 function.
+        conn.create_function('tern_digest_value', 2, changeset_value)
+        with closing(conn.cursor()) as c:
+            self._execute(
+                c,
+                """
+                select count(*)
+                from sqlite_master
+                where type = 'trigger' and name = '{0}_digest_insert'
+                """.format(self.tablename))
+            self._has_digest = c.fetchone()[0] > 0
+            # Not ``pragma_table_info``, which needs SQLite 3.16.
+            self._execute(c, 'pragma table_info({0})'.format(self.tablename))
+            self._has_timings = 'duration' in set(
+                row[1] for row in c.fetchall()
+            )
+            self._set_pragmas(c, self.settings)
+
+    def _set_pragmas(self, cursor, settings):
+        """
+        Set pragmas with the given cursor, returning their previous values as
+        ``(name, value)`` tuples.  Pragmas can't take bound parameters, so
+        names and values are checked instead.
+
+        """
+        settings = [(name, str(value)) for name, value in settings]
+        for name, value in settings:
+            if not self._pragma_name_re.match(name):
+                raise ValueError('Invalid pragma: {0}'.format(name))
+            if not self._pragma_value_re.match(value):
+                raise ValueError(
+                    'Invalid value for pragma {0}: {1}'.format(name, value)
+                )
+        previous = list()
+        for name, value in settings:
+            self._execute(cursor, 'pragma {0}'.format(name))
+            row = cursor.fetchone()
+            if row is not None:
+                previous.append((name, row[0]))
+            self._execute(cursor, 'pragma {0} = {1}'.format(name, value))
+        return previous
+
+    @contextmanager
+    def _pragmas(self, settings):
+        """
+        Run the block with the given pragmas, restoring their previous values
+        when it exits.  Some pragmas, such as ``foreign_keys``, can't be
+        changed inside a transaction, so they're skipped with a warning during
+        a batch.
+
+        """
+        if self._batch:
+            for name, value in settings:
+                if name.lower() in self._transaction_pragmas:
+                    logger.warning(
+                        'Skipping pragma %s = %s, which can\'t be changed '
+                        'during a batch.', name, value,
+                    )
+            settings = [
+                (name, value) for name, value in settings
+                if name.lower() not in self._transaction_pragmas
+            ]
+        if not settings:
+            yield
+            return
+        with self._cursor() as c:
+            previous = self._set_pragmas(c, settings)
+        try:
+            yield
+        finally:
+            with self._cursor() as c:
+                for name, value in reversed(previous):
+                    self._execute(
+                        c, 'pragma {0} = {1}'.format(name, value),
+                    )
+
+    def _update_digest(self, changesets, sign):
+        """
+        Add (``sign=1``) or remove (``sign=-1``) changesets from the digest,
+        once their rows have been written.  SQLite has no MD5 function, so
+        unlike Postgres it's computed here.
+
+        Triggers on the tern table count the rows written since the digest
+        was last updated.  If other rows were written, such as by an older
+        version of Tern or by hand, the digest is recomputed instead.
+
+        """
+        if not self._has_digest:
+            return
+        count, total = digest(
+            (changeset.hex_hash, changeset.order) for changeset in changesets
+        )
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                update {0}_digest
+                set applied = applied + ?, digest = digest + ?, unsynced = 0
+                where unsynced = ?
+                """.format(self.tablename),
+                (sign * count, sign * total, count)
+            )
+            if c.rowcount > 0:
+                return
+            count, total = digest(self.get_applied_hashes())
+            self._execute(
+                c,
+                """
+                update {0}_digest
+                set applied = ?, digest = ?, unsynced = 0
+                """.format(self.tablename),
+                (count, total)
+            )
 
     def _cursor(self):
         """
@@ -44,7 +309,8 @@ class SQLiteAdapter(AdapterBase):
 
         """
         with self._cursor() as c:
-            c.execute(
+            self._execute(
+                c,
                 """
                 select count(*)
                 from {0}
@@ -56,15 +322,15 @@ class SQLiteAdapter(AdapterBase):
 
     def _save_changeset(self, changeset):
         """
-        Save changeset in the tern table.  Does not commit the change.
+        Save changeset in the tern table.  Does not commit the change.  Raises
+        ``ValueError`` if the changeset already is saved.
 
         """
-        if self._changeset_exists(changeset):
-            return ValueError('Changeset already exists in database.')
         with self._cursor() as c:
-            c.execute(
+            self._execute(
+                c,
                 """
-                insert into {0}(hash, created_at, setup, teardown,
+                insert or ignore into {0}(hash, created_at, setup, teardown,
                     "order")
                 values (?, ?, ?, ?, ?)
                 """.format(self.tablename),
@@ -73,26 +339,163 @@ class SQLiteAdapter(AdapterBase):
                     changeset.setup, changeset.teardown, changeset.order
                 )
             )
+            if c.rowcount == 0:
+                raise ValueError('Changeset already exists in database.')
+        self._update_digest([changeset], 1)
 
     def _delete_changeset(self, changeset):
         """
         Delete changeset in the tern table.  Does not commit the change.
+        Raises ``ValueError`` if the changeset is not saved.
 
         """
-        if not self._changeset_exists(changeset):
-            raise ValueError('Changeset does not exist in database.')
         with self._cursor() as c:
-            c.execute(
+            self._execute(
+                c,
                 """
                 delete from {0} where hash = ?
                 """.format(self.tablename),
                 (changeset.hex_hash,)
             )
+            if c.rowcount == 0:
+                raise ValueError('Changeset does not exist in database.')
+        self._update_digest([changeset], -1)
+
+    def _next_order(self):
+        """
+        Return the order to assign to a new changeset.  (max(order) + 1)
+
+        """
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                select coalesce(max("order"), 0) + 1
+                from {0}
+                """.format(self.tablename))
+            return c.fetchone()[0]
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run the block in a transaction, committed when it exits or rolled back
+        if it raises.  During a batch, the block is part of the batch's
+        transaction.
+
+        """
+        if self._batch:
+            yield
+            return
+        with self._cursor() as c:
+            self._execute(c, 'begin')
+        try:
+            yield
+        except Exception:
+            self.conn.rollback()
+            raise
+        with self._cursor() as c:
+            self._execute(c, 'commit')
+
+    @contextmanager
+    def _changeset_transaction(self):
+        """
+        Run the block in its own transaction or, during a batch, in a savepoint
+        which is rolled back if the block fails.
+
+        """
+        if not self._batch:
+            with self._transaction():
+                yield
+            return
+        with self._cursor() as c:
+            self._execute(c, 'savepoint tern_changeset')
+        try:
+            yield
+        except Exception:
+            with self._cursor() as c:
+                self._execute(c, 'rollback to savepoint tern_changeset')
+                self._execute(c, 'release savepoint tern_changeset')
+            raise
+        with self._cursor() as c:
+            self._execute(c, 'release savepoint tern_changeset')
+
+    @contextmanager
+    def batch(self):
+        if self._batch:
+            raise ValueError('A batch is already in progress.')
+        with self._transaction():
+            self._batch = True
+            try:
+                yield
+            finally:
+                self._batch = False
+
+    def _run_statements(self, statements):
+        """
+        Execute the statements split from a script (see ``split_statements``)
+        one at a time, within the current transaction.  Unlike
+        ``executescript``, this doesn't commit.
+
+        """
+        with self._cursor() as c:
+            for statement in statements:
+                self._execute(c, statement)
+
+    def _in_transaction(self, changeset, statements):
+        """
+        Whether to run the changeset's statements in a transaction.  Those
+        which begin or commit transactions themselves, as was possible with
+        ``executescript``, are run outside of one, like changesets with
+        ``transaction`` switched off.
+
+        """
+        if not changeset.transaction:
+            return False
+        if not _controls_transaction(statements):
+            return True
+        if self._batch:
+            raise ValueError(
+                'Changeset {0} begins or ends a transaction itself, so it '
+                'can\'t be run in a batch.  Set "Transaction: off" on it to '
+                'run it between batches.'.format(changeset.hex_hash)
+            )
+        return False
+
+    def _record_timing(self, changeset, applied_at, statements):
+        """
+        Record when the changeset's setup started, and how long it took,
+        from ``applied_at`` until now.
+
+        """
+        if not self._has_timings:
+            return
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                update {0}
+                set applied_at = ?, duration = ?, statements = ?
+                where hash = ?
+                """.format(self.tablename),
+                (
+                    applied_at, time() - applied_at, statements,
+                    changeset.hex_hash,
+                )
+            )
+
+    def _executescript(self, cursor, sql):
+        """
+        Execute a script with the given cursor, counting the round trip.
+
+        """
+        self.round_trips += 1
+        return cursor.executescript(sql)
 
     def initialize_tern(self):
         with self.conn:
             with self._cursor() as c:
-                c.execute(
+                self._execute(
+                    c,
                     """
                     create table {0} (
                         hash text primary key,
@@ -102,10 +505,106 @@ class SQLiteAdapter(AdapterBase):
                         "order" integer not null
                     )
                     """.format(self.tablename))
+        self.initialize_digest()
+        self.initialize_timings()
+
+    def initialize_timings(self):
+        with self._transaction():
+            with self._cursor() as c:
+                self._execute(c, 'pragma table_info({0})'.format(
+                    self.tablename,
+                ))
+                existing = set(row[1] for row in c.fetchall())
+                for column, type_ in [
+                    ('applied_at', 'real'), ('duration', 'real'),
+                    ('statements', 'integer'),
+                ]:
+                    if column not in existing:
+                        self._execute(
+                            c, 'alter table {0} add column {1} {2}'.format(
+                                self.tablename, column, type_,
+                            )
+                        )
+        self._has_timings = True
+
+    def get_timings(self, hashes=None):
+        if not self._has_timings:
+            return None
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                select hash, applied_at, duration, statements
+                from {0}
+                where duration is not null
+                """.format(self.tablename))
+            rows = c.fetchall()
+        if hashes is not None:
+            hashes = set(hashes)
+            rows = [row for row in rows if row[0] in hashes]
+        return dict((row[0], tuple(row[1:])) for row in rows)
+
+    def initialize_digest(self):
+        with self._transaction():
+            count, total = digest(self.get_applied_hashes())
+            with self._cursor() as c:
+                self._execute(
+                    c,
+                    """
+                    drop table if exists {0}_digest
+                    """.format(self.tablename))
+                self._execute(
+                    c,
+                    """
+                    create table {0}_digest (
+                        applied integer not null,
+                        digest integer not null,
+                        unsynced integer not null
+                    )
+                    """.format(self.tablename))
+                self._execute(
+                    c,
+                    """
+                    insert into {0}_digest values (?, ?, 0)
+                    """.format(self.tablename),
+                    (count, total)
+                )
+                # Count the rows written, see ``_update_digest``.  These run
+                # on any connection, so they can't compute the digest.
+                for event in ['insert', 'delete', 'update of hash, "order"']:
+                    name = '{0}_digest_{1}'.format(
+                        self.tablename, event.split()[0],
+                    )
+                    self._execute(c, 'drop trigger if exists {0}'.format(name))
+                    self._execute(
+                        c,
+                        """
+                        create trigger {0} after {1} on {2}
+                        begin
+                            update {2}_digest set unsynced = unsynced + 1;
+                        end
+                        """.format(name, event, self.tablename))
+        self._has_digest = True
+
+    def get_digest(self):
+        if not self._has_digest:
+            return None
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                select applied, digest
+                from {0}_digest
+                where unsynced = 0
+                """.format(self.tablename))
+            row = c.fetchone()
+            # No row while the tern table has been changed other than by Tern.
+            return None if row is None else (row[0], row[1])
 
     def verify_tern(self):
         with self._cursor() as c:
-            c.execute(
+            self._execute(
+                c,
                 """
                 select count(*)
                 from sqlite_master
@@ -115,49 +614,321 @@ class SQLiteAdapter(AdapterBase):
                 raise NotInitialized()
 
     def apply(self, changeset):
-        if self._changeset_exists(changeset):
-            raise ValueError('Changeset has already been applied.')
-
         if changeset.order is None:
-            with self._cursor() as c:
-                c.execute(
-                    """
-                    select max("order")
-                    from {0}
-                    """.format(self.tablename))
-                order = c.fetchone()[0]
-                if order is None:
-                    order = 1
-                else:
-                    order += 1
-                changeset.order = order
+            changeset.order = self._next_order()
 
-        with self.conn:
+        statements = split_statements(changeset.setup)
+        transaction = self._in_transaction(changeset, statements)
+        with self._pragmas(changeset.settings):
+            start = time()
+            if not transaction:
+                # Such as ``vacuum``, which can't run in a transaction.
+                self._check_autocommit(changeset)
+                if self._changeset_exists(changeset):
+                    raise ValueError('Changeset already exists in database.')
+                self._run_statements(statements)
+            with self._changeset_transaction():
+                self._save_changeset(changeset)
+                if transaction:
+                    self._run_statements(statements)
+                self._record_timing(changeset, start, len(statements))
+
+    def apply_baseline(self, baseline, changesets):
+        with self._transaction():
+            self._run_statements(split_statements(baseline.setup))
             with self._cursor() as c:
-                c.executescript(changeset.setup)
-            self._save_changeset(changeset)
+                self.round_trips += 1
+                c.executemany(
+                    """
+                    insert into {0}(hash, created_at, setup, teardown,
+                        "order")
+                    values (?, ?, ?, ?, ?)
+                    """.format(self.tablename),
+                    [
+                        (
+                            cs.hex_hash, cs.created_at, cs.setup,
+                            cs.teardown, cs.order,
+                        ) for cs in changesets
+                    ]
+                )
+            self._update_digest(changesets, 1)
 
     def revert(self, changeset):
-        if not self._changeset_exists(changeset):
-            raise ValueError('Changeset has not yet been applied.')
+        statements = split_statements(changeset.teardown)
+        transaction = self._in_transaction(changeset, statements)
+        with self._pragmas(changeset.settings):
+            if not transaction:
+                self._check_autocommit(changeset)
+                if not self._changeset_exists(changeset):
+                    raise ValueError('Changeset does not exist in database.')
+                self._run_statements(statements)
+            with self._changeset_transaction():
+                self._delete_changeset(changeset)
+                if transaction:
+                    self._run_statements(statements)
 
-        with self.conn:
-            with self._cursor() as c:
-                c.executescript(changeset.teardown)
-            self._delete_changeset(changeset)
+    def _check_autocommit(self, changeset):
+        if self._batch:
+            raise ValueError(
+                'Changeset {0} runs outside of a transaction, so it can\'t '
+                'be run in a batch.'.format(changeset.hex_hash)
+            )
 
     def test(self, changeset):
         """
-        Although SQLite supports transactions on most operations, a "feature"
-        in the Python SQLite library prevents transactions on many commands.
+        ``executescript`` commits, so the changeset can't be rolled back.
+        Instead, it's run on a snapshot of the database, copied with the
+        backup API into memory or a temporary file (see ``test_snapshot``).
+
+        :returns:  A dictionary of timings in seconds:  ``snapshot``, the
+            time taken to copy the database, ``setup`` and ``teardown``.
 
         """
+        timings = dict()
+        start = time()
+        path = None
+        if self.test_snapshot == 'file':
+            fd, path = tempfile.mkstemp(suffix='.db', prefix='tern-test-')
+            os.close(fd)
         try:
-            with self._cursor() as c:
-                c.executescript(changeset.setup)
-                c.executescript(changeset.teardown)
+            with closing(sqlite3.connect(path or ':memory:')) as snapshot:
+                self._backup(self.conn, snapshot)
+                timings['snapshot'] = time() - start
+                with closing(snapshot.cursor()) as c:
+                    self._set_pragmas(c, self.settings + changeset.settings)
+                    for name in ('setup', 'teardown'):
+                        start = time()
+                        self._executescript(c, getattr(changeset, name))
+                        timings[name] = time() - start
         finally:
-            self.conn.rollback()
+            if path is not None:
+                os.remove(path)
+        return timings
+
+    def _backup(self, source, target):
+        """
+        Copy the database of the ``source`` connection into ``target``.
+
+        """
+        self.round_trips += 1
+        if hasattr(source, 'backup'):
+            source.backup(target)
+        else:
+            # Python before 3.7 has no backup API.
+            target.executescript('\n'.join(source.iterdump()))
+
+    def _clone_prefix(self):
+        if self.host == ':memory:':
+            raise ValueError('In-memory databases can\'t be cloned.')
+        return '{0}.tern_'.format(self.host)
+
+    def _list_clones(self):
+        directory, prefix = os.path.split(self._clone_prefix())
+        return [
+            os.path.join(directory, fn)
+            for fn in os.listdir(directory or '.') if fn.startswith(prefix)
+        ]
+
+    def _create_clone(self, name):
+        # Copy to a temporary file, so a partial clone is never seen.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(name) or '.')
+        os.close(fd)
+        try:
+            with closing(sqlite3.connect(self.host)) as source:
+                with closing(sqlite3.connect(tmp)) as target:
+                    self._backup(source, target)
+            os.rename(tmp, name)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def _rename_clone(self, name, new_name):
+        try:
+            os.rename(name, new_name)
+            return True
+        except OSError:
+            return False
+
+    def _drop_clone(self, name):
+        for path in [name, name + '-journal', name + '-wal', name + '-shm']:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _clone_adapter(self, name):
+        return SQLiteAdapter(
+            name, None, None, None, tern_table=self.tablename,
+            settings=self.settings,
+        )
+
+    def _execute_script(self, sql, settings=()):
+        with self._cursor() as c:
+            self._set_pragmas(c, settings)
+            self._executescript(c, sql)
+        self.conn.commit()
 
     def get_applied(self):
-        pass
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                select setup, teardown, "order", created_at
+                from {0}
+                """.format(self.tablename))
+            return self._changesets_from_rows(c)
+
+    def get_applied_hashes(self, low=None, high=None):
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                select hash, "order"
+                from {0}
+                where (? is null or "order" >= ?)
+                    and (? is null or "order" < ?)
+                """.format(self.tablename),
+                (low, low, high, high)
+            )
+            return c.fetchall()
+
+    def get_order_range(self):
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                select min("order"), max("order")
+                from {0}
+                """.format(self.tablename))
+            row = c.fetchone()
+            return None if row[0] is None else (row[0], row[1])
+
+    def get_range_digests(self, low, width, count):
+        with self._cursor() as c:
+            self._execute(
+                c,
+                """
+                select ("order" - ?) / ?, count(*),
+                    sum(tern_digest_value(hash, "order"))
+                from {0}
+                where "order" >= ? and "order" < ?
+                group by 1
+                """.format(self.tablename),
+                (low, width, low, low + width * count)
+            )
+            digests = [(0, 0)] * count
+            for bucket, applied, total in c:
+                digests[bucket] = (applied, total)
+            return digests
+
+    def get_changesets(self, hashes):
+        hashes = list(hashes)
+        changesets = list()
+        # Stay well below SQLITE_MAX_VARIABLE_NUMBER.
+        for i in range(0, len(hashes), self.max_variables):
+            chunk = hashes[i:i + self.max_variables]
+            with self._cursor() as c:
+                self._execute(
+                    c,
+                    """
+                    select setup, teardown, "order", created_at
+                    from {0}
+                    where hash in ({1})
+                    """.format(self.tablename, ', '.join('?' * len(chunk))),
+                    chunk
+                )
+                changesets.extend(self._changesets_from_rows(c))
+        return changesets
+
+    def split_statements(self, sql):
+        return split_statements(sql)
+
+    def get_table_sizes(self, tables):
+        """
+        Sizes come from the ``dbstat`` virtual table, if SQLite was compiled
+        with it, and row counts from ``sqlite_stat1``, if ``analyze`` has
+        been run.
+
+        """
+        sizes = dict()
+        with self._cursor() as c:
+            for table in tables:
+                name = table.strip('"[]`')
+                self._execute(
+                    c,
+                    """
+                    select count(*) from sqlite_master
+                    where type = 'table' and name = ?
+                    """,
+                    (name,)
+                )
+                if not c.fetchone()[0]:
+                    continue
+                size = rows = None
+                try:
+                    self._execute(
+                        c,
+                        """
+                        select sum(pgsize) from dbstat
+                        where name = ?1 or name in (
+                            select name from sqlite_master
+                            where type = 'index' and tbl_name = ?1
+                        )
+                        """,
+                        (name,)
+                    )
+                    size = c.fetchone()[0]
+                except sqlite3.OperationalError:
+                    pass
+                try:
+                    self._execute(
+                        c,
+                        """
+                        select stat from sqlite_stat1
+                        where tbl = ?
+                        limit 1
+                        """,
+                        (name,)
+                    )
+                    row = c.fetchone()
+                    if row is not None:
+                        rows = int(row[0].split()[0])
+                except sqlite3.OperationalError:
+                    pass
+                sizes[table] = (size, rows)
+        return sizes
+
+    def explain(self, statement):
+        """
+        SQLite doesn't estimate rows.  The statement is checked with
+        ``explain query plan``, and the rows of the tables it scans in full
+        are counted from ``sqlite_stat1``, if ``analyze`` has been run.
+
+        """
+        with self._cursor() as c:
+            try:
+                self._execute(c, 'explain query plan ' + statement)
+            except sqlite3.Error:
+                return None
+            scanned = [
+                m.group(1) for m in (_scan_re.match(row[-1]) for row in c)
+                if m is not None
+            ]
+        sizes = self.get_table_sizes(scanned)
+        rows = [r for _, r in sizes.values() if r is not None]
+        return sum(rows) if rows and len(rows) == len(scanned) else None
+
+    def _changesets_from_rows(self, rows):
+        """
+        Create Changeset objects from ``(setup, teardown, order, created_at)``
+        rows.
+
+        """
+        return [
+            Changeset(
+                setup=row[0],
+                teardown=row[1],
+                order=row[2],
+                created_at=row[3],
+            ) for row in rows
+        ]
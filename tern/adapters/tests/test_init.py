@@ -1,8 +1,20 @@
 from __future__ import absolute_import
+from nose.tools import eq_
 
 from .. import extract_adapter
+from ..mock import MockAdapter
 from ..postgresql import PostgreSQLAdapter
+from ...changeset import Changeset
 
 
 def test_extract_adapter():
     assert extract_adapter('tern.adapters.postgresql') is PostgreSQLAdapter
+
+
+def test_clone_unsupported():
+    adapter = MockAdapter(None, None, None, None)
+    try:
+        adapter.test_clone(Changeset('create table foo(x);', ''))
+        raise AssertionError('test_clone did not throw exception.')
+    except NotImplementedError as e:
+        eq_(str(e), 'MockAdapter does not support clones.')
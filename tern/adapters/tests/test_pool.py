@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+from nose.tools import eq_
+
+from ..sqlite import SQLiteAdapter
+from ..pool import ConnectionPool
+
+
+class CountingAdapter(SQLiteAdapter):
+    """
+    A SQLite adapter which counts connections, and whose connections can be
+    marked as broken.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CountingAdapter, self).__init__(*args, **kwargs)
+        self.connects = 0
+        self.broken = set()
+
+    def _connect(self):
+        self.connects += 1
+        return super(CountingAdapter, self)._connect()
+
+    def _ping(self, conn):
+        return conn not in self.broken
+
+
+def make_adapter():
+    return CountingAdapter(
+        host=':memory:',
+        dbname=None,
+        username=None,
+        password=None,
+    )
+
+
+def test_nested_open():
+    adapter = make_adapter()
+    adapter.open()
+    conn = adapter.conn
+    with adapter:
+        with adapter:
+            assert adapter.conn is conn
+        assert adapter.conn is conn
+    assert adapter.conn is conn
+    adapter.close()
+    assert adapter.conn is None
+    eq_(adapter.connects, 1)
+
+
+def test_pool_reuse():
+    adapter = make_adapter()
+    adapter.pool = ConnectionPool(1)
+    with adapter:
+        conn = adapter.conn
+    with adapter:
+        assert adapter.conn is conn
+    eq_(adapter.connects, 1)
+
+
+def test_pool_size():
+    pool = ConnectionPool(1)
+    first = make_adapter()
+    second = make_adapter()
+    first.pool = second.pool = pool
+    first.open()
+    second.open()
+    first.close()
+    second.close()
+    eq_(len(pool.drain()), 1)
+
+
+def test_pool_ping():
+    adapter = make_adapter()
+    adapter.pool = ConnectionPool(1)
+    adapter.ping_after = -1
+    with adapter:
+        conn = adapter.conn
+    adapter.broken.add(conn)
+    with adapter:
+        assert adapter.conn is not conn
+    eq_(adapter.connects, 2)
+
+
+def test_shared_pool():
+    pool = ConnectionPool.shared(('test_shared_pool',), 2)
+    assert ConnectionPool.shared(('test_shared_pool',), 5) is pool
+    eq_(pool.size, 2)
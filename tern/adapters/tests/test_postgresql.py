@@ -1,11 +1,39 @@
 from __future__ import absolute_import
 from nose.tools import eq_
 from testconfig import config
+import logging
+import time
 import psycopg2
 
-from ..postgresql import PostgreSQLAdapter
-from ...exceptions import NotInitialized
+from ..postgresql import PostgreSQLAdapter, split_statements, _split_name
+from ...api import Tern
+from ...exceptions import NotInitialized, ChangesetError
+from ...baseline import Baseline
 from ...changeset import Changeset
+from ...digest import digest
+
+
+def test_split_statements():
+    eq_(split_statements(' ; '), [])
+    eq_(
+        split_statements(
+            "create index concurrently a on b(c); select 'x;', \"y;\" -- ;\n"
+            "; create function f() returns int as $f$ select 1; $f$ "
+            "language sql /* ; */"
+        ),
+        [
+            'create index concurrently a on b(c);',
+            'select \'x;\', "y;" -- ;\n;',
+            'create function f() returns int as $f$ select 1; $f$ '
+            'language sql /* ; */',
+        ],
+    )
+
+
+def test_split_name():
+    eq_(_split_name('Foo'), (None, 'foo'))
+    eq_(_split_name('public.foo'), ('public', 'foo'))
+    eq_(_split_name('"My"".Schema".Foo'), ('My".Schema', 'foo'))
 
 
 class TestPostgreSQLAdapter(object):
@@ -31,6 +59,15 @@ class TestPostgreSQLAdapter(object):
             except psycopg2.Error:
                 self._rollback()
 
+        with self._cursor() as c:
+            c.execute(
+                """
+                drop table if exists tern_digest;
+                drop function if exists tern_digest_update();
+                """
+            )
+            self._commit()
+
         # Drop other tables that may have been created.
         with self._cursor() as c:
             try:
@@ -122,6 +159,27 @@ class TestPostgreSQLAdapter(object):
             eq_(data[1][0], 2)
             eq_(data[2][0], 3)
 
+    def test_postgresql_apply_round_trips(self):
+        """
+        Applying a changeset with an order costs two round trips, including
+        the setup SQL.  Applying it again fails.
+
+        """
+        changeset = Changeset(
+            setup='create table foo(id integer primary key);',
+            teardown='drop table foo;',
+            order=1,
+            created_at=123,
+        )
+        self.adapter.round_trips = 0
+        self.adapter.apply(changeset)
+        eq_(self.adapter.round_trips, 2)
+        try:
+            self.adapter.apply(changeset)
+            raise AssertionError('No error was thrown.')
+        except ValueError:
+            pass
+
     def test_postgresql_apply_no_order(self):
         """
         Test ``PostgreSQLAdapter.apply`` with a changeset with no order
@@ -161,6 +219,48 @@ class TestPostgreSQLAdapter(object):
                 """, (changeset.hex_hash,))
             eq_(c.fetchone()[0], 4)
 
+    def test_postgresql_apply_many_pipeline(self):
+        """
+        Test ``PostgreSQLAdapter.apply_many`` with pipelining.
+
+        """
+        self.adapter.pipeline = 2
+        changesets = [
+            Changeset(
+                setup='create table foo(id integer primary key);',
+                teardown='drop table foo;',
+                order=1,
+            ),
+            Changeset(
+                setup='insert into foo values (1);',
+                teardown='delete from foo where id = 1;',
+                order=2,
+            ),
+            Changeset(
+                setup='insert into foo values (2);',
+                teardown='delete from foo where id = 2;',
+                order=3,
+            ),
+            Changeset(
+                setup='badsql',
+                teardown='',
+                order=4,
+            ),
+        ]
+        self.adapter.round_trips = 0
+        self.adapter.apply_many(changesets[:2])
+        eq_(self.adapter.round_trips, 1)
+
+        try:
+            self.adapter.apply_many(changesets[2:])
+            raise AssertionError('No error was thrown.')
+        except ChangesetError as e:
+            eq_(e.changeset, changesets[3])
+
+        applied = self.adapter.get_applied()
+        eq_(len(applied), 3)
+        assert changesets[3] not in applied
+
     def test_postgresql_revert(self):
         """
         Test ``PostgreSQLAdapter.revert``.
@@ -267,3 +367,303 @@ class TestPostgreSQLAdapter(object):
         eq_(len(applied), 2)
         assert cs1 in applied
         assert cs2 in applied
+
+        eq_(
+            sorted(self.adapter.get_applied_hashes()),
+            sorted([(cs1.hex_hash, 1), (cs2.hex_hash, 2)]),
+        )
+        eq_(self.adapter.get_changesets([cs2.hex_hash, 'abc']), [cs2])
+        eq_(self.adapter.get_changesets([]), [])
+
+    def test_postgresql_digest(self):
+        cs1 = Changeset(setup='sqlsql', teardown='pizza', order=1)
+        cs2 = Changeset(setup='wowsql', teardown='such', order=2)
+        eq_(self.adapter.get_digest(), (0, 0))
+        self.adapter._save_changeset(cs1)
+        self.adapter._save_changeset(cs2)
+        expected = digest([(cs1.hex_hash, 1), (cs2.hex_hash, 2)])
+        eq_(self.adapter.get_digest(), expected)
+        self.adapter._delete_changeset(cs2)
+        eq_(self.adapter.get_digest(), digest([(cs1.hex_hash, 1)]))
+        self._commit()
+
+        # Recomputing the digest from the table gives the same result.
+        self.adapter.initialize_digest()
+        eq_(self.adapter.get_digest(), digest([(cs1.hex_hash, 1)]))
+
+        # Databases without a digest fall back to ``None``, without aborting
+        # the transaction in progress.  Dropping the function drops the
+        # trigger with it.
+        with self._cursor() as c:
+            c.execute(
+                'drop table tern_digest;\n'
+                'drop function tern_digest_update() cascade;'
+            )
+        self._commit()
+        self.adapter._has_digest = None
+        self.adapter._save_changeset(cs2)
+        eq_(self.adapter.get_digest(), None)
+        eq_(self.adapter._changeset_exists(cs2), True)
+
+    def test_postgresql_schemas(self):
+        with self._cursor() as c:
+            c.execute('create schema tern_tenant_a')
+            c.execute('create schema tern_tenant_b')
+        self._commit()
+        try:
+            eq_(
+                self.adapter.list_schemas('tern\\_tenant\\_%'),
+                ['tern_tenant_a', 'tern_tenant_b'],
+            )
+            tenant = self.adapter.for_schema('tern_tenant_a')
+            with tenant:
+                try:
+                    tenant.verify_tern()
+                    raise AssertionError('Verify did not throw exception.')
+                except NotInitialized:
+                    pass
+                tenant.initialize_tern()
+                tenant.verify_tern()
+                tenant.apply(Changeset(
+                    setup='create table foo(id integer);',
+                    teardown='drop table foo;',
+                ))
+                eq_(len(tenant.get_applied()), 1)
+
+            # The changeset was applied within the tenant's schema.
+            eq_(self.adapter.get_applied(), [])
+            with self._cursor() as c:
+                c.execute(
+                    "select table_schema from information_schema.tables "
+                    "where table_name = 'foo'"
+                )
+                eq_([row[0] for row in c], ['tern_tenant_a'])
+
+            # The tenant's digest isn't taken for the default schema's.
+            with self._cursor() as c:
+                c.execute(
+                    'drop table tern_digest;\n'
+                    'drop function tern_digest_update() cascade;'
+                )
+            self._commit()
+            self.adapter._has_digest = None
+            eq_(self.adapter.get_digest(), None)
+        finally:
+            self._rollback()
+            with self._cursor() as c:
+                c.execute('drop schema tern_tenant_a cascade')
+                c.execute('drop schema tern_tenant_b cascade')
+            self._commit()
+
+    def test_postgresql_apply_baseline(self):
+        changesets = [
+            Changeset('create table foo(id integer);', 'drop table foo;', 1),
+            Changeset('insert into foo values (1);', 'delete from foo;', 2),
+        ]
+        baseline = Baseline(
+            2, 'create table foo(id integer); insert into foo values (1);',
+            [cs.hex_hash for cs in changesets],
+        )
+        self.adapter.round_trips = 0
+        self.adapter.apply_baseline(baseline, changesets)
+        eq_(self.adapter.round_trips, 1)
+        eq_(set(self.adapter.get_applied()), set(changesets))
+        eq_(
+            self.adapter.get_digest(),
+            digest((cs.hex_hash, cs.order) for cs in changesets),
+        )
+        with self._cursor() as c:
+            c.execute('select id from foo')
+            eq_(c.fetchall(), [(1,)])
+
+    def test_postgresql_settings(self):
+        changeset = Changeset(
+            setup="create table foo as "
+            "select current_setting('statement_timeout') as timeout;",
+            teardown='drop table foo;',
+            settings=[('statement_timeout', '42s')],
+        )
+        self.adapter.apply(changeset)
+        with self._cursor() as c:
+            c.execute('select timeout from foo')
+            eq_(c.fetchall(), [('42s',)])
+            c.execute('show statement_timeout')
+            eq_(c.fetchone()[0], '0')
+
+    def test_postgresql_lock_timeout(self):
+        with self._cursor() as c:
+            c.execute('create table foo(id integer)')
+        self._commit()
+        self.adapter.lock_timeout = '50ms'
+        self.adapter.lock_retry_deadline = 0.2
+        self.adapter.lock_retry_delay = 0.05
+        changeset = Changeset(
+            'alter table foo add column name text;',
+            'alter table foo drop column name;',
+            1,
+        )
+        blocker = psycopg2.connect(self.adapter.conn.dsn)
+        try:
+            with blocker.cursor() as c:
+                c.execute('lock table foo in access share mode')
+            try:
+                self.adapter.apply(changeset)
+                raise AssertionError('Apply did not throw exception.')
+            except psycopg2.OperationalError as e:
+                eq_(e.pgcode, '55P03')
+            eq_(self.adapter.get_applied(), [])
+        finally:
+            blocker.close()
+        self.adapter.apply(changeset)
+        eq_(self.adapter.get_applied(), [changeset])
+
+    def test_postgresql_lock_holders(self):
+        with self._cursor() as c:
+            c.execute('create table foo(id integer)')
+        self._commit()
+        self.adapter.lock_timeout = '50ms'
+        self.adapter.lock_retry_deadline = 0
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('tern.adapters.postgresql')
+        logger.addHandler(handler)
+        blocker = psycopg2.connect(self.adapter.conn.dsn)
+        pid = blocker.get_backend_pid()
+        try:
+            try:
+                with self.adapter.batch():
+                    self.adapter.get_applied()
+                    # The blocker's lock is taken after the batch began.
+                    with blocker.cursor() as c:
+                        c.execute('lock table foo in access share mode')
+                    time.sleep(0.1)
+                    self.adapter.apply(Changeset(
+                        'alter table foo add column name text;', '', 1,
+                    ))
+                raise AssertionError('Apply did not throw exception.')
+            except psycopg2.OperationalError:
+                pass
+        finally:
+            logger.removeHandler(handler)
+            blocker.close()
+        messages = [record.getMessage() for record in records]
+        assert any(
+            'pid {0} has held AccessShareLock on foo'.format(pid) in message
+            for message in messages
+        ), messages
+
+    def test_postgresql_apply_autocommit(self):
+        with self._cursor() as c:
+            c.execute('create table foo(id integer)')
+            c.execute('insert into foo values (1), (1)')
+        self._commit()
+        changeset = Changeset(
+            'create index concurrently foo_id on foo(id);\n'
+            'create unique index concurrently foo_id_unique on foo(id);',
+            'drop index concurrently foo_id;',
+            1,
+            transaction=False,
+        )
+        try:
+            self.adapter.apply(changeset)
+            raise AssertionError('Apply did not throw exception.')
+        except psycopg2.IntegrityError:
+            pass
+        # Not recorded, and the invalid unique index was dropped.
+        eq_(self.adapter.get_applied(), [])
+        with self._cursor() as c:
+            c.execute(
+                "select indexrelid::regclass::text from pg_index "
+                "where indrelid = 'foo'::regclass order by 1"
+            )
+            eq_(c.fetchall(), [('foo_id',)])
+        self._rollback()
+
+        with self._cursor() as c:
+            c.execute('drop index foo_id')
+            c.execute('delete from foo')
+        self._commit()
+        self.adapter.apply(changeset)
+        eq_(self.adapter.get_applied(), [changeset])
+        self.adapter.revert(changeset)
+        eq_(self.adapter.get_applied(), [])
+
+    def test_postgresql_test_autocommit(self):
+        # Tested on a clone through ``Tern.test``, with the adapter open.
+        with self._cursor() as c:
+            c.execute('create table foo(id integer)')
+        self._commit()
+        tern = Tern(self.adapter, None)
+        tern.test(Changeset(
+            'create index concurrently foo_id on foo(id);',
+            'drop index concurrently foo_id;',
+            1,
+            transaction=False,
+        ))
+        # The adapter was reconnected, and the index was never made here.
+        eq_(self.adapter._refs, 1)
+        with self._cursor() as c:
+            c.execute(
+                "select count(*) from pg_index "
+                "where indrelid = 'foo'::regclass"
+            )
+            eq_(c.fetchone()[0], 0)
+        self._rollback()
+        try:
+            tern.test(Changeset(
+                'create index concurrently foo_id on faux(id);', '', 1,
+                transaction=False,
+            ))
+            raise AssertionError('No error was thrown.')
+        except psycopg2.Error:
+            pass
+        eq_(self.adapter._refs, 1)
+        for name in self.adapter._list_clones():
+            self.adapter._drop_clone(name)
+
+    def test_postgresql_plan(self):
+        with self._cursor() as c:
+            c.execute('create table foo(id integer)')
+            c.execute('insert into foo select generate_series(1, 1000)')
+            c.execute('analyze foo')
+        self._commit()
+        sizes = self.adapter.get_table_sizes(['foo', 'bar'])
+        eq_(list(sizes), ['foo'])
+        assert sizes['foo'][0] > 0
+        eq_(sizes['foo'][1], 1000)
+        eq_(self.adapter.explain('update foo set id = id + 1'), 1000)
+        eq_(self.adapter.explain('update bar set id = 1'), None)
+        with self._cursor() as c:
+            c.execute('select max(id) from foo')
+            eq_(c.fetchone()[0], 1000)
+
+    def test_postgresql_timings(self):
+        changesets = [
+            Changeset(
+                'create table foo(id integer); select pg_sleep(0.1);',
+                'drop table foo;',
+                1,
+            ),
+            Changeset('insert into foo values (1);', 'delete from foo;', 2),
+            Changeset('', '', 3, 123),
+        ]
+        self.adapter.round_trips = 0
+        self.adapter.apply(changesets[0])
+        eq_(self.adapter.round_trips, 2)
+        self.adapter.pipeline = 2
+        self.adapter.apply_many(changesets[1:])
+        timings = self.adapter.get_timings()
+        eq_(len(timings), 3)
+        applied_at, duration, statements = timings[changesets[0].hex_hash]
+        assert duration >= 0.1
+        eq_(statements, 2)
+        eq_(
+            list(self.adapter.get_timings([changesets[1].hex_hash])),
+            [changesets[1].hex_hash],
+        )
+        # The digest isn't touched by recording the timings.
+        eq_(
+            self.adapter.get_digest(),
+            digest((cs.hex_hash, cs.order) for cs in changesets),
+        )
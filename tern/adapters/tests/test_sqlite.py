@@ -1,10 +1,16 @@
 from __future__ import absolute_import
 from nose.tools import eq_
+import os
+import os.path
+import shutil
 import sqlite3
+import tempfile
 
-from ..sqlite import SQLiteAdapter
+from ..sqlite import SQLiteAdapter, split_statements
+from ...api import Tern
 from ...exceptions import NotInitialized
 from ...changeset import Changeset
+from ...digest import digest
 
 
 def test_sqlite_initialize():
@@ -25,6 +31,35 @@ def test_sqlite_initialize():
         adapter.verify_tern()
 
 
+def test_split_statements():
+    eq_(split_statements(''), [])
+    eq_(
+        split_statements('create table a(x); insert into a values (\';\');'),
+        ['create table a(x);', " insert into a values (';');"],
+    )
+    trigger = (
+        'create trigger t after insert on a begin\n'
+        '    delete from a; -- ;\n'
+        'end;'
+    )
+    eq_(split_statements(trigger + '\n;\nselect 1'), [trigger, '\nselect 1'])
+    trigger = (
+        'create temp trigger t after insert on a begin\n'
+        '    update a set x = case when x then 1 end;\n'
+        'end;'
+    )
+    eq_(
+        split_statements(trigger + ' select [a;b], `c;d`, "e;f" /* ; */;'),
+        [trigger, ' select [a;b], `c;d`, "e;f" /* ; */;'],
+    )
+
+
+def test_split_statements_large_literal():
+    # Splitting is linear, whatever the number of semicolons in a literal.
+    insert = "insert into a values ('{0}');".format('x; ' * 1000000)
+    eq_(split_statements(insert + 'select 1;'), [insert, 'select 1;'])
+
+
 class TestSQLiteAdapter(object):
     def setup(self):
         self.adapter = SQLiteAdapter(
@@ -91,6 +126,60 @@ class TestSQLiteAdapter(object):
             eq_(data[1][0], 2)
             eq_(data[2][0], 3)
 
+    def test_sqlite_apply_round_trips(self):
+        """
+        Applying a changeset with an order costs six statements:  beginning
+        the transaction, the bookkeeping, updating the digest, the setup SQL,
+        recording its timing and the commit.  Applying it again fails.
+
+        """
+        changeset = Changeset(
+            setup='create table foo(id integer primary key);',
+            teardown='drop table foo;',
+            order=1,
+            created_at=123,
+        )
+        self.adapter.round_trips = 0
+        self.adapter.apply(changeset)
+        eq_(self.adapter.round_trips, 6)
+        try:
+            self.adapter.apply(changeset)
+            raise AssertionError('No error was thrown.')
+        except ValueError:
+            pass
+
+    def test_sqlite_batch(self):
+        """
+        A batch runs in a single transaction, and is rolled back entirely if
+        a changeset fails.
+
+        """
+        changesets = [
+            Changeset('create table foo(id integer);', 'drop table foo;', 1),
+            Changeset('insert into foo values (1);', 'delete from foo;', 2),
+        ]
+        self.adapter.round_trips = 0
+        with self.adapter.batch():
+            for changeset in changesets:
+                self.adapter.apply(changeset)
+        # One begin and one commit, plus a savepoint, its release and four
+        # statements per changeset.
+        eq_(self.adapter.round_trips, 2 + 6 * 2)
+        eq_(len(self.adapter.get_applied()), 2)
+
+        try:
+            with self.adapter.batch():
+                self.adapter.revert(changesets[1])
+                self.adapter.apply(Changeset('create table x(;', '', 3))
+            raise AssertionError('No error was thrown.')
+        except sqlite3.Error:
+            pass
+        eq_(set(self.adapter.get_applied()), set(changesets))
+        eq_(
+            self.adapter.conn.execute('select id from foo').fetchall(),
+            [(1,)],
+        )
+
     def test_sqlite_apply_no_order(self):
         """
         Test ``SQLiteAdapter.apply`` with a changeset with no order defined.
@@ -175,7 +264,35 @@ class TestSQLiteAdapter(object):
 
         assert self.adapter._changeset_exists(changeset) is False
 
-    def _test_sqlite_test(self):
+    def test_sqlite_get_applied(self):
+        cs1 = Changeset(
+            order=1,
+            setup='sqlsql',
+            teardown='pizzapizza',
+            created_at=123,
+        )
+        cs2 = Changeset(
+            order=2,
+            setup='wowsql',
+            teardown='suchsql',
+            created_at=124,
+        )
+        self.adapter._save_changeset(cs1)
+        self.adapter._save_changeset(cs2)
+
+        applied = self.adapter.get_applied()
+        eq_(len(applied), 2)
+        assert cs1 in applied
+        assert cs2 in applied
+
+        eq_(
+            sorted(self.adapter.get_applied_hashes()),
+            sorted([(cs1.hex_hash, 1), (cs2.hex_hash, 2)]),
+        )
+        eq_(self.adapter.get_changesets([cs2.hex_hash, 'abc']), [cs2])
+        eq_(self.adapter.get_changesets([]), [])
+
+    def test_sqlite_test(self):
         """
         Test ``SQLiteAdapter.test``.
 
@@ -214,4 +331,278 @@ class TestSQLiteAdapter(object):
             teardown='drop table foo;',
             created_at=123,
         )
+        timings = self.adapter.test(changeset)
+        eq_(sorted(timings), ['setup', 'snapshot', 'teardown'])
+
+        # Nothing was changed in the database.
+        changeset = Changeset(
+            setup='create table bar(id integer);',
+            teardown='',
+        )
         self.adapter.test(changeset)
+        self.adapter.test(changeset)
+        eq_(self.adapter.conn.execute(
+            "select count(*) from sqlite_master where name = 'bar'"
+        ).fetchone()[0], 0)
+
+    def test_sqlite_digest(self):
+        cs1 = Changeset(setup='', teardown='', order=1)
+        cs2 = Changeset(setup='create table foo(id integer);', teardown='')
+        eq_(self.adapter.get_digest(), (0, 0))
+        self.adapter.apply(cs1)
+        self.adapter.apply(cs2)
+        eq_(
+            self.adapter.get_digest(),
+            digest([(cs1.hex_hash, 1), (cs2.hex_hash, 2)]),
+        )
+        self.adapter.revert(cs1)
+        eq_(self.adapter.get_digest(), digest([(cs2.hex_hash, 2)]))
+
+        # Recomputing the digest from the table gives the same result.
+        self.adapter.initialize_digest()
+        eq_(self.adapter.get_digest(), digest([(cs2.hex_hash, 2)]))
+
+        # Changes made other than by Tern, such as by an older version, make
+        # the digest unknown until Tern next writes to the table.
+        self.adapter.conn.execute(
+            'insert into tern(hash, created_at, setup, teardown, "order") '
+            "values ('abc', 0, '', '', 3)"
+        )
+        eq_(self.adapter.get_digest(), None)
+        self.adapter.revert(cs2)
+        eq_(self.adapter.get_digest(), digest([('abc', 3)]))
+
+    def test_sqlite_apply_autocommit(self):
+        changeset = Changeset(
+            setup='create table foo(id integer); vacuum;',
+            teardown='drop table foo; vacuum;',
+            transaction=False,
+        )
+        self.adapter.apply(changeset)
+        eq_(self.adapter._changeset_exists(changeset), True)
+        try:
+            with self.adapter.batch():
+                self.adapter.revert(changeset)
+            raise AssertionError('Revert did not throw exception.')
+        except ValueError:
+            pass
+        self.adapter.revert(changeset)
+        eq_(self.adapter._changeset_exists(changeset), False)
+
+    def test_sqlite_apply_own_transaction(self):
+        # Written for ``executescript``, which let changesets begin and
+        # commit their own transactions.
+        changeset = Changeset(
+            setup='BEGIN;\ncreate table foo(id integer);\nCOMMIT;',
+            teardown='begin transaction; drop table foo; end;',
+            order=1,
+        )
+        self.adapter.apply(changeset)
+        eq_(self.adapter._changeset_exists(changeset), True)
+        try:
+            with self.adapter.batch():
+                self.adapter.revert(changeset)
+            raise AssertionError('Revert did not throw exception.')
+        except ValueError as e:
+            assert 'Transaction: off' in str(e), str(e)
+        self.adapter.revert(changeset)
+        eq_(self.adapter._changeset_exists(changeset), False)
+
+        # Savepoints are fine in a transaction.
+        changeset = Changeset(
+            setup='savepoint a; create table foo(id integer); '
+            'rollback to a; release a;',
+            teardown='',
+            order=1,
+        )
+        with self.adapter.batch():
+            self.adapter.apply(changeset)
+        eq_(self.adapter._changeset_exists(changeset), True)
+
+    def test_sqlite_settings(self):
+        def cache_size():
+            return self.adapter.conn.execute('pragma cache_size').fetchone()[0]
+
+        default = cache_size()
+        changeset = Changeset(
+            setup='create table foo as select * from pragma_cache_size();',
+            teardown='drop table foo;',
+            settings=[('cache_size', '1234')],
+        )
+        self.adapter.apply(changeset)
+        eq_(self.adapter.conn.execute('select * from foo').fetchone()[0], 1234)
+        eq_(cache_size(), default)
+
+        try:
+            self.adapter.apply(Changeset(
+                setup='', teardown='', settings=[('cache_size', '1; drop')],
+            ))
+            raise AssertionError('Apply did not throw exception.')
+        except ValueError:
+            pass
+        eq_(cache_size(), default)
+
+
+def test_sqlite_batch_settings():
+    """
+    Pragmas which can't be changed in a transaction are skipped in a batch.
+
+    """
+    directory = tempfile.mkdtemp(prefix='terntest-')
+    adapter = SQLiteAdapter(
+        host=os.path.join(directory, 'test.db'),
+        dbname=None,
+        username=None,
+        password=None,
+    )
+    try:
+        with adapter:
+            adapter.initialize_tern()
+            synchronous = adapter.conn.execute(
+                'pragma synchronous'
+            ).fetchone()[0]
+            changeset = Changeset(
+                setup='create table foo as select * from pragma_cache_size();',
+                teardown='drop table foo;',
+                settings=[
+                    ('synchronous', 'off'), ('journal_mode', 'wal'),
+                    ('cache_size', '1234'),
+                ],
+            )
+            with adapter.batch():
+                adapter.apply(changeset)
+            eq_(adapter._changeset_exists(changeset), True)
+            eq_(adapter.conn.execute('select * from foo').fetchone()[0], 1234)
+            eq_(
+                adapter.conn.execute('pragma synchronous').fetchone()[0],
+                synchronous,
+            )
+            eq_(
+                adapter.conn.execute('pragma journal_mode').fetchone()[0],
+                'delete',
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_sqlite_run_settings():
+    adapter = SQLiteAdapter(
+        host=':memory:',
+        dbname=None,
+        username=None,
+        password=None,
+        settings={'cache_size': 500},
+    )
+    with adapter:
+        eq_(adapter.conn.execute('pragma cache_size').fetchone()[0], 500)
+
+
+def test_sqlite_no_digest():
+    """
+    Databases initialized before digests were added have no digest until
+    ``initialize_digest`` is called.
+
+    """
+    adapter = SQLiteAdapter(
+        host=':memory:',
+        dbname=None,
+        username=None,
+        password=None,
+    )
+    with adapter:
+        adapter.conn.execute(
+            'create table tern (hash text primary key, created_at integer, '
+            'setup text, teardown text, "order" integer)'
+        )
+        changeset = Changeset(setup='', teardown='', order=1)
+        adapter.apply(changeset)
+        eq_(adapter.get_digest(), None)
+        adapter.initialize_digest()
+        eq_(adapter.get_digest(), digest([(changeset.hex_hash, 1)]))
+
+
+class TestSQLiteClone(object):
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix='terntest-')
+        self.adapter = SQLiteAdapter(
+            host=os.path.join(self.root, 'test.db'),
+            dbname=None,
+            username=None,
+            password=None,
+        )
+        with self.adapter:
+            self.adapter.initialize_tern()
+            self.adapter.apply(Changeset(
+                'create table foo(id integer);', 'drop table foo;', 1,
+            ))
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def _tables(self):
+        with self.adapter:
+            return sorted(row[0] for row in self.adapter.conn.execute(
+                "select name from sqlite_master where type = 'table'"
+            ))
+
+    def test_sqlite_test_clone(self):
+        tables = self._tables()
+        changeset = Changeset(
+            'create table bar(id integer); insert into foo values (1);',
+            'drop table bar; delete from foo;',
+        )
+        self.adapter.test_clone(changeset)
+        eq_(self._tables(), tables)
+        # A spare clone has been made for the next test.
+        spares = self.adapter._list_clones()
+        eq_(len(spares), 1)
+
+        # The spare is used, and replaced.
+        self.adapter.test_clone(changeset)
+        eq_(len(self.adapter._list_clones()), 1)
+        assert self.adapter._list_clones() != spares
+
+        # Errors are raised, and the clone is dropped.
+        try:
+            self.adapter.test_clone(Changeset('create table foo(x);', ''))
+            raise AssertionError('No error was thrown.')
+        except sqlite3.OperationalError:
+            pass
+        eq_(len(self.adapter._list_clones()), 1)
+
+        # After the database changes, the stale spare is replaced.
+        with self.adapter:
+            self.adapter.apply(Changeset('create table baz(id);', '', 2))
+        with self.adapter.clone() as clone:
+            assert 'baz' in [row[0] for row in clone.conn.execute(
+                "select name from sqlite_master where type = 'table'"
+            )]
+        eq_(len(self.adapter._list_clones()), 1)
+        assert self.adapter._list_clones() != spares
+
+    def test_sqlite_test_clone_open(self):
+        # ``Tern.test`` on a clone with the adapter open, as ``tern test``
+        # does; the adapter is reconnected afterwards.
+        tern = Tern(self.adapter, None, verify=False)
+        with self.adapter:
+            tern.test(Changeset('create table bar(id integer);', ''), True)
+            eq_(self.adapter._refs, 1)
+            eq_(self.adapter.conn.execute(
+                "select count(*) from sqlite_master where name = 'bar'"
+            ).fetchone()[0], 0)
+        eq_(self.adapter._refs, 0)
+
+    def test_sqlite_test_file_snapshot(self):
+        adapter = SQLiteAdapter(
+            host=os.path.join(self.root, 'big.db'),
+            dbname=None,
+            username=None,
+            password=None,
+            test_snapshot='file',
+        )
+        with adapter:
+            adapter.initialize_tern()
+            adapter.test(Changeset('create table bar(id integer);', ''))
+            eq_(adapter.conn.execute(
+                "select count(*) from sqlite_master where name = 'bar'"
+            ).fetchone()[0], 0)
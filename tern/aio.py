@@ -0,0 +1,142 @@
+"""
+An asyncio API for Tern.  Requires Python 3.7 or later.
+
+"""
+import os.path
+import asyncio
+
+from .api import Tern
+from .baseline import Baseline
+from .exceptions import ChangesetError
+
+
+class AsyncTern(object):
+    """
+    The asyncio counterpart of ``tern.Tern``, for use with an adapter from
+    ``tern.adapters.aio``.  Reading the tern directory runs in the event
+    loop's default executor.
+
+    Unlike ``Tern``, the constructor does not verify that the database has
+    been initialized; await ``verify`` to do so.
+
+    :param adapter:  The adapter for Tern to interact with the database.
+    :type adapter:  Object implementing
+        ``tern.adapters.aio.AsyncAdapterBase``.
+    :param directory:  The directory storing the tern objects.
+    :type directory:  str
+    :param options:  Other keyword arguments are passed to ``Tern``, which is
+        used to read the tern directory.
+
+    """
+
+    def __init__(self, adapter, directory, **options):
+        self.adapter = adapter
+        self.directory = directory
+        self._tern = Tern(None, directory, verify=False, **options)
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def verify(self):
+        """
+        Raise ``tern.exceptions.NotInitialized`` if the database has not been
+        initialized.
+
+        """
+        async with self.adapter:
+            await self.adapter.verify_tern()
+
+    async def apply(self, changeset):
+        """
+        See ``Tern.apply``.
+
+        """
+        async with self.adapter:
+            await self.adapter.apply(changeset)
+            fn = os.path.join(self.directory, changeset.hex_hash)
+            await self._run(changeset.save, fn)
+
+    async def test(self, changeset):
+        """
+        See ``AdapterBase.test``.
+
+        """
+        async with self.adapter:
+            await self.adapter.test(changeset)
+
+    async def diff(self):
+        """
+        See ``Tern.diff``.
+
+        """
+        applied = dict(await self.adapter.get_applied_hashes())
+        revert_hashes, to_apply = await self._run(
+            self._tern._diff_saved, applied,
+        )
+        to_revert = sorted(
+            await self.adapter.get_changesets(revert_hashes),
+            key=lambda x: x.order,
+            reverse=True,
+        )
+        return to_revert, to_apply
+
+    async def update(self, batch=False, batch_size=None):
+        """
+        See ``Tern.update``.
+
+        """
+        async with self.adapter:
+            saved = await self._run(self._tern._saved_digest)
+            if saved is not None:
+                applied = await self.adapter.get_digest()
+                if applied is not None and tuple(applied) == saved:
+                    return [], []
+            baselined = await self._apply_baseline()
+            to_revert, to_apply = await self.diff()
+            if not batch:
+                await self._update(to_revert, to_apply)
+                return to_revert, baselined + to_apply
+            steps = [(True, cs) for cs in to_revert]
+            steps += [(False, cs) for cs in to_apply]
+            for chunk, in_batch in self._tern._batch_chunks(steps, batch_size):
+                to_run = (
+                    [cs for revert, cs in chunk if revert],
+                    [cs for revert, cs in chunk if not revert],
+                )
+                if not in_batch:
+                    await self._update(*to_run)
+                    continue
+                async with self.adapter.batch():
+                    await self._update(*to_run)
+            return to_revert, baselined + to_apply
+
+    async def _apply_baseline(self):
+        """
+        See ``Tern._apply_baseline``.
+
+        """
+        baseline = await self._run(Baseline.open, self.directory)
+        if baseline is None:
+            return []
+        if await self.adapter.get_order_range() is not None:
+            return []
+        changesets = await self._run(
+            self._tern._baseline_changesets, baseline,
+        )
+        try:
+            await self.adapter.apply_baseline(baseline, changesets)
+        except NotImplementedError:
+            return []
+        return changesets
+
+    async def _update(self, to_revert, to_apply):
+        """
+        Revert and then apply the given changesets.
+
+        """
+        for cs in to_revert:
+            try:
+                await self.adapter.revert(cs)
+            except Exception as e:
+                raise ChangesetError(cs, e)
+        await self.adapter.apply_many(to_apply)
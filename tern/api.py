@@ -2,8 +2,29 @@ from __future__ import absolute_import
 import os
 import os.path
 import re
+import stat
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
+from .baseline import Baseline
 from .changeset import Changeset
+from .digest import digest
+from .events import emitting
+from .index import ChangesetIndex
+from .pack import ChangesetPack
+from .exceptions import InvalidChangesetFile, ChangesetError
+
+
+def _load_changeset(path):
+    """
+    Parse the changeset file and compute its hash.  This is a module-level
+    function so it can be used with a process pool.
+
+    """
+    changeset = Changeset.from_file(path)
+    # The hash is cached on the changeset, so it's computed in the worker.
+    changeset.hash
+    return changeset
 
 
 class Tern(object):
@@ -14,14 +35,49 @@ class Tern(object):
     :type adapter:  Object implementing ``tern.adapters.AdapterBase``.
     :param directory:  The directory storing the tern objects.
     :type directory:  str
+    :param index:  If true, keep a persistent index of changeset metadata in
+        the tern directory, so unchanged files are not parsed again.  See
+        ``tern.index.ChangesetIndex``.
+    :type index:  bool
+    :param workers:  The number of workers used to load changeset files.  If
+        ``None`` or less than 2, files are loaded serially.
+    :type workers:  int
+    :param worker_type:  ``'thread'`` or ``'process'``.  Threads are cheaper
+        to start, and suffice when loading is dominated by I/O and hashing;
+        processes also parallelize parsing.
+    :type worker_type:  str
+    :param parallel_threshold:  Directories with fewer files to load than this
+        are loaded serially, as starting a pool wouldn't pay off.
+    :type parallel_threshold:  int
+    :param hooks:  Callables called with a ``tern.events.Event`` before and
+        after each diff, apply, revert and test, such as the sinks in
+        ``tern.events``.  With hooks, ``update`` applies changesets one at a
+        time, so each gets its own events; without any, nothing is measured.
+    :type hooks:  list
 
     """
 
     _changeset_file_re = re.compile(r'^[0-9a-f]{40}$')
 
-    def __init__(self, adapter, directory, verify=True):
+    def __init__(
+        self, adapter, directory, verify=True, index=False, workers=None,
+        worker_type='thread', parallel_threshold=64, hooks=None,
+    ):
+        if worker_type not in ('thread', 'process'):
+            raise ValueError('worker_type must be "thread" or "process".')
         self.adapter = adapter
         self.directory = directory
+        self.index = index
+        self.workers = workers
+        self.worker_type = worker_type
+        self.parallel_threshold = parallel_threshold
+        self.hooks = list(hooks or [])
+        # (listing, changesets) loaded by ``preload``.
+        self._preloaded = None
+        # The pack found by the last ``_list_saved``, and the ``os.stat`` of
+        # its file, to tell whether it has changed since.
+        self._pack = None
+        self._pack_stat = None
         # Make sure everything has been set up.
         if verify:
             self.adapter.verify_tern()
@@ -33,30 +89,180 @@ class Tern(object):
 
         """
         with self.adapter:
-            self.adapter.apply(changeset)
+            if self.hooks:
+                with emitting(self.hooks, 'apply', self.adapter, changeset):
+                    self.adapter.apply(changeset)
+            else:
+                self.adapter.apply(changeset)
             fn = os.path.join(self.directory, changeset.hex_hash)
             changeset.save(fn)
 
-    def _get_saved_changesets(self):
+    def preload(self):
+        """
+        Load all the saved changesets, including their SQL, and keep them in
+        memory.  From then on, the tern directory is not read again, and Tern
+        objects created with ``Tern.for_adapter`` share the loaded changesets.
+
+        """
+        self._preloaded = None
+        listing = self._list_saved()
+        changesets = self._load_saved(listing, listing)
+        for changeset in changesets.values():
+            # Load the SQL of lazy changesets now, so it's only read once.
+            changeset.setup
+            changeset.teardown
+        self._preloaded = (listing, changesets)
+
+    def for_adapter(self, adapter, verify=True):
+        """
+        Return a Tern object for another database, with the same settings
+        and sharing any changesets loaded by ``Tern.preload``.
+
+        :param adapter:  The adapter for the other database.
+        :type adapter:  Object implementing ``tern.adapters.AdapterBase``.
+
+        """
+        tern = Tern(
+            adapter, self.directory, verify=verify, index=self.index,
+            workers=self.workers, worker_type=self.worker_type,
+            parallel_threshold=self.parallel_threshold, hooks=self.hooks,
+        )
+        tern._preloaded = self._preloaded
+        return tern
+
+    def _list_saved(self):
         """
-        Get a set of the changesets saved to the local filesystem.
+        List the changesets in the tern directory, both loose files and those
+        in the pack.
+
+        :returns:  A dictionary mapping the filename, which is the hex hash of
+            the changeset, to the result of ``os.stat`` on the file, or
+            ``None`` for changesets in the pack.
 
         """
-        changesets = set()
+        if self._preloaded is not None:
+            return self._preloaded[0]
+        self._open_pack()
+        listing = dict()
+        if self._pack is not None:
+            listing.update((fn, None) for fn in self._pack.hashes())
         for fn in os.listdir(self.directory):
+            if not self._changeset_file_re.match(fn):
+                continue
             path = os.path.join(self.directory, fn)
-            if not os.path.isfile(path):
+            try:
+                st = os.stat(path)
+            except OSError:
                 continue
-            if not self._changeset_file_re.match(fn):
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            listing[fn] = st
+        return listing
+
+    def _open_pack(self):
+        """
+        Open the pack, if there is one, reusing the pack already open unless
+        its file has changed.
+
+        """
+        path = os.path.join(self.directory, ChangesetPack.filename)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is not None and not stat.S_ISREG(st.st_mode):
+            st = None
+        key = None if st is None else (st.st_ino, st.st_size, st.st_mtime)
+        if key == self._pack_stat:
+            return
+        # The previous pack isn't closed, as changesets loaded from it may
+        # still read their SQL from it; it's unmapped once they're gone.
+        self._pack = None if st is None else ChangesetPack(path)
+        self._pack_stat = key
+
+    def _get_saved_changesets(self):
+        """
+        Get a set of the changesets saved to the local filesystem.  If the
+        index is enabled, changesets with a valid index entry are returned as
+        ``tern.changeset.LazyChangeset`` objects, whose SQL is read only when
+        needed.
+
+        """
+        listing = self._list_saved()
+        return set(self._load_saved(listing, listing).values())
+
+    def _load_saved(self, listing, filenames):
+        """
+        Load some of the changesets saved to the local filesystem.
+
+        :param listing:  The directory listing, from ``Tern._list_saved``.
+        :param filenames:  The filenames to load.
+
+        :returns:  A dictionary mapping filenames to changesets.
+
+        """
+        if self._preloaded is not None:
+            preloaded = self._preloaded[1]
+            return dict((fn, preloaded[fn]) for fn in filenames)
+        index = ChangesetIndex(self.directory) if self.index else None
+        changesets = dict()
+        to_load = list()
+        for fn in filenames:
+            st = listing[fn]
+            if st is None:
+                changesets[fn] = self._pack.lookup(fn)
                 continue
-            changesets.add(Changeset.from_file(path))
+            changeset = index.lookup(fn, st) if index is not None else None
+            if changeset is None:
+                to_load.append((fn, st))
+            else:
+                changesets[fn] = changeset
+
+        loaded = self._load_changesets([
+            os.path.join(self.directory, fn) for fn, _ in to_load
+        ])
+        for (fn, st), changeset in zip(to_load, loaded):
+            if index is not None:
+                index.add(fn, st, changeset)
+            changesets[fn] = changeset
+
+        if index is not None:
+            index.prune(listing)
+            index.save()
         return changesets
 
+    def _load_changesets(self, paths):
+        """
+        Load the given changeset files, using a worker pool if configured and
+        there are enough files to make it worthwhile.
+
+        :returns:  A list of changesets, in the same order as ``paths``.
+
+        """
+        workers = self.workers or 1
+        if workers < 2 or len(paths) < self.parallel_threshold:
+            return [_load_changeset(path) for path in paths]
+        if self.worker_type == 'process':
+            pool = multiprocessing.Pool(workers)
+        else:
+            pool = ThreadPool(workers)
+        try:
+            chunksize = max(1, len(paths) // (workers * 4))
+            return pool.map(_load_changeset, paths, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+
     def diff(self):
         """
         Find out how the current state of the database differs from the state
         defined in the tern directory.
 
+        The comparison uses only the hashes of the changesets:  the hashes of
+        applied changesets are fetched from the database, and those of saved
+        changesets are taken from their filenames.  Only the changesets that
+        need to be applied or reverted are then loaded in full.
+
         :returns:  A 2-element tuple:  The first element is a list of
         changesets that exist in the database but not in the repository
         (changesets to be reverted), the second changesets in the repository
@@ -65,25 +271,311 @@ class Tern(object):
         sequence.
 
         """
-        applied = self.adapter.get_applied()
-        saved = self._get_saved_changesets()
+        if self.hooks:
+            with emitting(self.hooks, 'diff', self.adapter):
+                return self._diff()
+        return self._diff()
+
+    def _diff(self):
+        applied = dict(self.adapter.get_applied_hashes())
+        revert_hashes, to_apply = self._diff_saved(applied)
         to_revert = sorted(
-            (x for x in applied if x not in saved),
+            self.adapter.get_changesets(revert_hashes),
             key=lambda x: x.order,
             reverse=True,
         )
-        to_apply = sorted(
-            (x for x in saved if x not in applied),
+        return to_revert, to_apply
+
+    def digest(self):
+        """
+        Return the digest of the changesets in the tern directory, see
+        ``tern.digest``.  When the index is enabled, or after ``preload``, no
+        unchanged changeset files are parsed.
+
+        """
+        listing = self._list_saved()
+        changesets = self._load_saved(listing, listing)
+        return digest((fn, cs.order) for fn, cs in changesets.items())
+
+    def _saved_digest(self):
+        """
+        Return the digest of the tern directory if it's cheap to compute, or
+        ``None``.  Without the index or ``preload``, it would mean parsing
+        every file, which costs more than the full diff.
+
+        """
+        if not self.index and self._preloaded is None:
+            return None
+        return self.digest()
+
+    def _up_to_date(self):
+        """
+        Return ``True`` if the digest kept by the database matches the tern
+        directory, so there's nothing to update.
+
+        """
+        saved = self._saved_digest()
+        if saved is None:
+            return False
+        applied = self.adapter.get_digest()
+        return applied is not None and tuple(applied) == saved
+
+    def _check_filename(self, fn, changeset):
+        """
+        Raise ``tern.exceptions.InvalidChangesetFile`` if the hash of the
+        changeset loaded from the file doesn't match the filename.
+
+        """
+        if changeset.hex_hash != fn:
+            raise InvalidChangesetFile(
+                'Contents of {0} do not match its filename.'.format(
+                    os.path.join(self.directory, fn),
+                )
+            )
+
+    def pack(self):
+        """
+        Move the loose changeset files in the tern directory into its pack,
+        see ``tern.pack.ChangesetPack``.  Changesets already in the pack are
+        kept.
+
+        :returns:  The number of changeset files packed.
+
+        """
+        self._preloaded = None
+        listing = self._list_saved()
+        changesets = self._load_saved(listing, listing)
+        entries = list()
+        loose = list()
+        for fn, st in listing.items():
+            changeset = changesets[fn]
+            if st is None:
+                data = self._pack.read(fn)
+            else:
+                self._check_filename(fn, changeset)
+                with open(os.path.join(self.directory, fn), 'rb') as fh:
+                    data = fh.read()
+                loose.append(fn)
+            entries.append(
+                (fn, changeset.order, changeset.created_at, data),
+            )
+        if not loose:
+            return 0
+        ChangesetPack.write(
+            os.path.join(self.directory, ChangesetPack.filename), entries,
+        )
+        for fn in loose:
+            os.remove(os.path.join(self.directory, fn))
+        return len(loose)
+
+    def make_baseline(self, order, setup=None):
+        """
+        Squash the changesets up to the given order into a baseline, saved
+        in the tern directory, see ``tern.baseline.Baseline``.  ``update``
+        loads it into fresh databases instead of applying those changesets
+        one by one; databases which have any changesets applied are not
+        affected.
+
+        :param order:  The highest order to squash.
+        :type order:  int
+        :param setup:  The SQL bringing a fresh database to the state after
+            the squashed changesets, such as a schema dump of a database at
+            that order.  Defaults to their setup SQL, concatenated; this only
+            saves round trips, as data migrations which were later undone
+            still run.
+        :type setup:  str
+
+        :returns:  The ``Baseline``.
+
+        """
+        listing = self._list_saved()
+        changesets = self._load_saved(listing, listing)
+        squashed = sorted(
+            (cs for cs in changesets.values() if cs.order <= order),
             key=lambda x: x.order,
         )
-        return to_revert, to_apply
+        if not squashed:
+            raise ValueError('No changesets up to order {0}.'.format(order))
+        if setup is None:
+            setup = '\n;\n'.join(cs.setup for cs in squashed)
+        baseline = Baseline(order, setup, [cs.hex_hash for cs in squashed])
+        baseline.save(self.directory)
+        return baseline
+
+    def _apply_baseline(self):
+        """
+        Load the baseline, if there is one, into a fresh database.
+
+        :returns:  The changesets recorded as applied, in order.
+
+        """
+        baseline = Baseline.open(self.directory)
+        if baseline is None or self.adapter.get_order_range() is not None:
+            return []
+        changesets = self._baseline_changesets(baseline)
+        try:
+            self.adapter.apply_baseline(baseline, changesets)
+        except NotImplementedError:
+            return []
+        return changesets
+
+    def _baseline_changesets(self, baseline):
+        """
+        Load the changesets squashed by the given baseline.
+
+        :returns:  The changesets, in order.
 
-    def update(self):
         """
-        Generate the diff and apply it.
+        listing = self._list_saved()
+        missing = [x for x in baseline.hashes if x not in listing]
+        if missing:
+            raise InvalidChangesetFile(
+                'The baseline squashes {0} changesets which are not in {1}, '
+                'such as {2}.'.format(len(missing), self.directory, missing[0])
+            )
+        loaded = self._load_saved(listing, baseline.hashes)
+        for fn, changeset in loaded.items():
+            self._check_filename(fn, changeset)
+        return sorted(loaded.values(), key=lambda x: x.order)
+
+    def _diff_saved(self, applied):
+        """
+        Compare the applied changesets with the saved ones.
+
+        :param applied:  A dictionary mapping the hashes of the applied
+            changesets to their order.
+
+        :returns:  A 2-element tuple:  The hashes of the changesets to be
+            reverted, and the correctly ordered changesets to be applied.
+
+        """
+        listing = self._list_saved()
+        revert_hashes = [x for x in applied if x not in listing]
+        loaded = self._load_saved(
+            listing, [x for x in listing if x not in applied],
+        )
+        for fn, changeset in loaded.items():
+            self._check_filename(fn, changeset)
+        to_apply = sorted(loaded.values(), key=lambda x: x.order)
+        return revert_hashes, to_apply
+
+    def update(self, batch=False, batch_size=None, progress=None):
+        """
+        Generate the diff and apply it.  If a changeset fails to revert or
+        apply, a ``tern.exceptions.ChangesetError`` is raised.
+
+        If the database keeps a digest of its applied changesets and the
+        index is enabled (or the changesets are preloaded), a database that's
+        already up to date is recognized from the digest alone.
+
+        A fresh database is first brought to the baseline, if there is one,
+        see ``Tern.make_baseline``.  This happens in its own transaction,
+        even in batch mode.  The squashed changesets are included in the
+        changesets applied.
+
+        :returns:  The diff which was applied, see ``Tern.diff``.
+
+        :param batch:  If true, run all the reverts and applies in a single
+            transaction, so a failure leaves the database in its previous
+            state rather than half-updated.  Requires adapter support, see
+            ``AdapterBase.batch``.  Changesets with ``transaction`` switched
+            off are run between batches.
+        :type batch:  bool
+        :param batch_size:  In batch mode, commit after every ``batch_size``
+            changesets rather than once at the end.
+        :type batch_size:  int
+        :param progress:  Called as ``progress(changeset)`` after each
+            changeset is reverted or applied, such as a
+            ``tern.stats.Progress``.
+        :type progress:  callable
 
         """
         with self.adapter:
+            if self._up_to_date():
+                return [], []
+            baselined = self._apply_baseline()
             to_revert, to_apply = self.diff()
-            [self.adapter.revert(cs) for cs in to_revert]
-            [self.adapter.apply(cs) for cs in to_apply]
+            if not batch:
+                self._run(to_revert, to_apply, progress)
+                return to_revert, baselined + to_apply
+            steps = [(True, cs) for cs in to_revert]
+            steps += [(False, cs) for cs in to_apply]
+            for chunk, in_batch in self._batch_chunks(steps, batch_size):
+                to_run = (
+                    [cs for revert, cs in chunk if revert],
+                    [cs for revert, cs in chunk if not revert],
+                )
+                if not in_batch:
+                    self._run(*to_run, progress=progress)
+                    continue
+                with self.adapter.batch():
+                    self._run(*to_run, progress=progress)
+            return to_revert, baselined + to_apply
+
+    def _batch_chunks(self, steps, batch_size):
+        """
+        Split ``(revert, changeset)`` steps into ``(steps, in_batch)`` chunks
+        of up to ``batch_size`` steps.  Changesets which run outside of a
+        transaction (see ``Changeset.transaction``) get chunks of their own,
+        run outside of a batch.
+
+        """
+        size = batch_size or len(steps) or 1
+        chunk = list()
+        for step in steps:
+            if not getattr(step[1], 'transaction', True):
+                if chunk:
+                    yield chunk, True
+                    chunk = list()
+                yield [step], False
+                continue
+            chunk.append(step)
+            if len(chunk) >= size:
+                yield chunk, True
+                chunk = list()
+        if chunk:
+            yield chunk, True
+
+    def _run(self, to_revert, to_apply, progress=None):
+        """
+        Revert and then apply the given changesets.
+
+        """
+        for cs in to_revert:
+            try:
+                if self.hooks:
+                    with emitting(self.hooks, 'revert', self.adapter, cs):
+                        self.adapter.revert(cs)
+                else:
+                    self.adapter.revert(cs)
+            except Exception as e:
+                raise ChangesetError(cs, e)
+            if progress is not None:
+                progress(cs)
+        if self.hooks:
+            for cs in to_apply:
+                with emitting(self.hooks, 'apply', self.adapter, cs):
+                    self.adapter.apply_many([cs], progress)
+        elif progress is None:
+            self.adapter.apply_many(to_apply)
+        else:
+            self.adapter.apply_many(to_apply, progress)
+
+    def test(self, changeset, clone=False):
+        """
+        Test the given changeset, see ``AdapterBase.test``.  The adapter
+        must be open, unless testing on a clone, see
+        ``AdapterBase.test_clone``; an open adapter is reconnected after
+        cloning.
+
+        :param clone:  If true, test on a disposable clone of the database.
+        :type clone:  bool
+
+        :returns:  What the adapter returns, such as a dictionary of timings.
+
+        """
+        test = self.adapter.test_clone if clone else self.adapter.test
+        if not self.hooks:
+            return test(changeset)
+        with emitting(self.hooks, 'test', self.adapter, changeset):
+            return test(changeset)
@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+import io
+import os.path
+import re
+import six
+
+from .exceptions import InvalidChangesetFile
+
+
+class Baseline(object):
+    """
+    The state of the database after every changeset up to an order, so a
+    fresh database can be created in one step instead of replaying the whole
+    history.  See ``Tern.make_baseline``.
+
+    The squashed changesets stay in the tern directory:  existing databases
+    still need them, and they're recorded as applied when the baseline is
+    loaded, so they can be reverted like any other changeset.
+
+    The baseline is stored in the tern directory as a text file:
+
+    * ``--- Baseline order: XX`` marks the order of the last squashed
+      changeset.
+    * ``--- Squashed: XXXX`` lines list the hashes of the squashed changesets.
+    * The setup SQL is begun by ``--- Begin setup`` and runs to the final
+      ``--- End``.
+
+    :param order:  The highest order of the squashed changesets.
+    :type order:  int
+    :param setup:  The SQL bringing a fresh database to the state after the
+        squashed changesets.
+    :type setup:  str
+    :param hashes:  The hex hashes of the squashed changesets.
+    :type hashes:  list of str
+
+    """
+
+    filename = 'tern.baseline'
+    _order_re = re.compile(r'^--- Baseline order: (-?\d+)$', re.I | re.M)
+    _squashed_re = re.compile(r'^--- Squashed: ([0-9a-f]{40})$', re.I | re.M)
+    _begin = '--- Begin setup\n'
+    _end = '\n--- End'
+
+    def __init__(self, order, setup, hashes):
+        self.order = order
+        self.setup = setup
+        self.hashes = list(hashes)
+
+    @classmethod
+    def open(cls, directory):
+        """
+        Return the baseline in the given tern directory, or ``None`` if there
+        is none.
+
+        """
+        path = os.path.join(directory, cls.filename)
+        if not os.path.isfile(path):
+            return None
+        with io.open(path, encoding='utf-8') as fh:
+            data = fh.read()
+        begin = data.find(cls._begin)
+        end = data.rfind(cls._end)
+        order = cls._order_re.search(data, 0, max(begin, 0))
+        if begin < 0 or end < begin or order is None:
+            raise InvalidChangesetFile(
+                '{0} is not a valid baseline.'.format(path)
+            )
+        return cls(
+            int(order.group(1)),
+            data[begin + len(cls._begin):end],
+            [h.lower() for h in cls._squashed_re.findall(data, 0, begin)],
+        )
+
+    def save(self, directory):
+        """
+        Save the baseline to the given tern directory.
+
+        """
+        path = os.path.join(directory, self.filename)
+        setup = self.setup
+        if not isinstance(setup, six.text_type):
+            setup = setup.decode('utf-8')
+        with io.open(path, 'w', encoding='utf-8') as fh:
+            fh.write(u'--- Baseline order: {0}\n'.format(self.order))
+            for hex_hash in self.hashes:
+                fh.write(u'--- Squashed: {0}\n'.format(hex_hash))
+            fh.write(u'--- Begin setup\n')
+            fh.write(setup)
+            fh.write(u'\n--- End\n')
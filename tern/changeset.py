@@ -1,11 +1,40 @@
 from __future__ import unicode_literals
+import os
 import re
+import mmap
+import itertools
 import hashlib
+import binascii
 from time import time as unix_timestamp
 
 from .exceptions import InvalidChangesetFile
 
 
+def _decode(block):
+    """
+    Decode a block of SQL read from a changeset file, normalizing newlines as
+    a file opened in text mode would.
+
+    """
+    text = block.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+_marker_pattern = (
+    br'[ \t]*-{2,}[ \t]*(?:'
+    br'(?P<end>end)'
+    br'|created at[ \t]*:[ \t]*(?P<created_at>[0-9]+)'
+    br'|order[ \t]*:[ \t]*(?P<order>[0-9]+)'
+    br'|transaction[ \t]*:[ \t]*(?P<transaction>on|off)'
+    br'|set[ \t]*:[ \t]*(?P<set_name>[a-z_][a-z0-9_.]*)[ \t]*=[ \t]*'
+    br'(?P<set_value>[^\r\n]*?)'
+    br'|begin (?P<begin>setup|teardown)'
+    br')[ \t\r]*$'
+)
+
+
 class Changeset(object):
     """
     This class represents a database changeset, which is the following:
@@ -19,29 +48,46 @@ class Changeset(object):
     :type teardown: str
     :param created_at:  The unix timestamp when the changeset was created.
     :type created_at:  int
+    :param settings:  Session settings to use while the changeset is applied
+        or reverted, as ``(name, value)`` tuples, such as
+        ``('maintenance_work_mem', '1GB')`` on Postgres or
+        ``('cache_size', '-200000')`` on SQLite.  They tune how the changeset
+        runs rather than what it does, so they aren't part of the hash, and
+        they aren't stored in the database.
+    :type settings:  list
+    :param transaction:  If false, the changeset's SQL is run outside of a
+        transaction, one statement at a time, for statements such as
+        ``create index concurrently`` which can't run in one.  It is recorded
+        as applied only once its setup succeeds; a failure part way through
+        leaves the earlier statements applied.  Like the settings, this isn't
+        part of the hash or stored in the database.
+    :type transaction:  bool
 
     """
 
-    file_end_regex = re.compile(
-        r'^-{2,}\s*end$', flags=re.IGNORECASE
+    # Matches the marker lines of a changeset file, including the newline
+    # before them.  Anchoring on a literal newline rather than ``^`` lets the
+    # regex engine skip quickly through large blocks of SQL.  Compiled for
+    # bytes, so a file can be scanned in place without decoding it first.
+    file_marker_regex = re.compile(
+        br'\n' + _marker_pattern, flags=re.IGNORECASE | re.MULTILINE,
     )
-    file_created_at_regex = re.compile(
-        r'^-{2,}\s*created at\s*:\s*([0-9]+)$', flags=re.IGNORECASE
-    )
-    file_order_regex = re.compile(
-        r'^-{2,}\s*order\s*:\s*([0-9]+)$', flags=re.IGNORECASE
-    )
-    file_begin_setup_regex = re.compile(
-        r'^-{2,}\s*begin setup$', flags=re.IGNORECASE
-    )
-    file_begin_teardown_regex = re.compile(
-        r'^-{2,}\s*begin teardown$', flags=re.IGNORECASE
+    # The same, for a marker on the first line of the file.
+    file_first_marker_regex = re.compile(
+        _marker_pattern, flags=re.IGNORECASE | re.MULTILINE,
     )
 
-    def __init__(self, setup, teardown, order=None, created_at=None):
+    _hash = None
+
+    def __init__(
+        self, setup, teardown, order=None, created_at=None, settings=None,
+        transaction=True,
+    ):
         self.setup = setup
         self.teardown = teardown
         self.order = order
+        self.settings = list(settings or [])
+        self.transaction = transaction
         if created_at is None:
             self.created_at = int(unix_timestamp())
         else:
@@ -55,61 +101,86 @@ class Changeset(object):
 
         * Created at marked by ``--- Created at: XXXXXX``
         * Order marked by ``--- Order: XX``.
+        * Settings marked by ``--- Set: name = value``, one per line.
+        * ``--- Transaction: off`` runs the changeset outside of a
+            transaction.
         * Setup SQL begun by ``--- Begin setup`` and ended with ``--- End``.
         * Teardown SQL begun by ``--- Begin teardown`` and ended with
             ``--- End``.
         * Any lines outside of these are ignored.
 
+        """
+        with open(filename, 'rb') as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size == 0:
+                return cls.from_bytes(b'')
+            data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return cls.from_bytes(data)
+            finally:
+                data.close()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Create a Changeset object from the UTF-8 encoded contents of a
+        changeset file.  See ``Changeset.from_file`` for the format.
+
+        The data is scanned once for marker lines, and the setup and teardown
+        SQL are sliced out of it directly.
+
+        :param data:  The file contents.
+        :type data:  bytes or mmap.mmap
+
         """
         created_at = None
         order = None
-        setup = None
-        teardown = None
-
-        def read_block(fh):
-            """
-            Read the file up until the ``--- End`` line and return the contents
-            as a string.
-
-            """
-            content = ''
-            for line in fh:
-                if cls.file_end_regex.match(line.strip()) is not None:
-                    break
-                else:
-                    content += line
-            return content
-
-        with open(filename) as fh:
-            for line in fh:
-                line = line.strip()
-
-                # Check for created at and order
-                created_re = cls.file_created_at_regex.match(line)
-                order_re = cls.file_order_regex.match(line)
-                if order_re is not None:
-                    order = int(order_re.group(1))
-                elif created_re is not None:
-                    created_at = int(created_re.group(1))
-
-                # Check for setup
-                elif cls.file_begin_setup_regex.match(line) is not None:
-                    setup = read_block(fh)
-
-                # Check for teardown
-                elif cls.file_begin_teardown_regex.match(line) is not None:
-                    teardown = read_block(fh)
+        settings = list()
+        transaction = True
+        blocks = dict()
+        begin = None  # (block name, start offset) of the current block
+        first = cls.file_first_marker_regex.match(data)
+        matches = cls.file_marker_regex.finditer(data)
+        for match in itertools.chain([first] if first else [], matches):
+            if begin is not None:
+                # Inside a block, only the end marker is meaningful.
+                if match.group('end') is not None:
+                    blocks[begin[0]] = data[begin[1]:match.start()]
+                    begin = None
+            elif match.group('order') is not None:
+                order = int(match.group('order'))
+            elif match.group('created_at') is not None:
+                created_at = int(match.group('created_at'))
+            elif match.group('transaction') is not None:
+                transaction = match.group('transaction').lower() == b'on'
+            elif match.group('set_name') is not None:
+                value = _decode(match.group('set_value')).strip()
+                if len(value) > 1 and value[0] == value[-1] and value[0] in (
+                    '"', "'",
+                ):
+                    value = value[1:-1]
+                settings.append((_decode(match.group('set_name')), value))
+            elif match.group('begin') is not None:
+                start = data.find(b'\n', match.end())
+                start = len(data) if start == -1 else start + 1
+                begin = (match.group('begin').lower(), start)
+        if begin is not None:
+            # An unterminated block runs to the end of the file.
+            blocks[begin[0]] = data[begin[1]:]
 
         if order is None:
             raise InvalidChangesetFile('File did not define order.')
-        if setup is None:
+        if b'setup' not in blocks:
             raise InvalidChangesetFile('File did not define setup SQL.')
-        if teardown is None:
+        if b'teardown' not in blocks:
             raise InvalidChangesetFile('File did not define teardown SQL.')
         if created_at is None:
             raise InvalidChangesetFile('File did not define created at.')
 
-        return cls(setup, teardown, order, created_at)
+        return cls(
+            _decode(blocks[b'setup']), _decode(blocks[b'teardown']),
+            order, created_at, settings, transaction,
+        )
 
     def save(self, filename):
         """
@@ -122,6 +193,11 @@ class Changeset(object):
         with open(filename, 'w') as fh:
             fh.write('--- Created at: {0}\n'.format(self.created_at))
             fh.write('--- Order: {0}\n'.format(self.order))
+            for name, value in self.settings:
+                # Quoted, as surrounding quotes are stripped when parsed.
+                fh.write("--- Set: {0} = '{1}'\n".format(name, value))
+            if not self.transaction:
+                fh.write('--- Transaction: off\n')
             fh.write('--- Begin setup\n')
             fh.write(self.setup)
             fh.write('\n')
@@ -138,6 +214,7 @@ class Changeset(object):
     @setup.setter
     def setup(self, value):
         self._setup = value.strip()
+        self._hash = None
 
     @property
     def teardown(self):
@@ -146,6 +223,41 @@ class Changeset(object):
     @teardown.setter
     def teardown(self, value):
         self._teardown = value.strip()
+        self._hash = None
+
+    @property
+    def settings(self):
+        return self._settings
+
+    @settings.setter
+    def settings(self, value):
+        self._settings = value
+
+    @property
+    def transaction(self):
+        return self._transaction
+
+    @transaction.setter
+    def transaction(self, value):
+        self._transaction = value
+
+    @property
+    def order(self):
+        return self._order
+
+    @order.setter
+    def order(self, value):
+        self._order = value
+        self._hash = None
+
+    @property
+    def created_at(self):
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, value):
+        self._created_at = value
+        self._hash = None
 
     def _quintessence(self):
         """
@@ -156,10 +268,13 @@ class Changeset(object):
         return self.created_at, self.order, self.setup, self.teardown
 
     def __hash__(self):
-        return hash(self._quintessence())
+        return hash(self.hash)
 
     def __eq__(self, other):
-        return self._quintessence() == other._quintessence()
+        return self.hash == other.hash
+
+    def __ne__(self, other):
+        return not self == other
 
     def _make_hash(self):
         h = hashlib.sha1()
@@ -173,20 +288,85 @@ class Changeset(object):
         """
         Returns a hash as a binary string of the object, which is the SHA-1
         hash of the quintessence (created at, order, setup, teardown) joined
-        by colons.
+        by colons.  The hash is cached until one of those attributes changes.
 
         """
-        return self._make_hash().digest()
+        if self._hash is None:
+            self._hash = self._make_hash().digest()
+        return self._hash
 
     @property
     def hex_hash(self):
         """
-        Returns a hash as a binary string of the object, which is the SHA-1
-        hash of the quintessence (created at, order, setup, teardown) joined
-        by colons.
+        Returns the hash as a hexadecimal string.  See ``Changeset.hash``.
 
         """
-        return self._make_hash().hexdigest()
+        return binascii.hexlify(self.hash).decode('ascii')
 
     def __repr__(self):
         return 'Changeset{0!r}'.format(self._quintessence())
+
+
+class LazyChangeset(Changeset):
+    """
+    A changeset whose metadata (order, created at and hash) is already known,
+    but whose SQL has not been read yet.  The SQL is loaded the first time
+    ``setup`` or ``teardown`` is accessed.
+
+    :param hex_hash:  The hash of the changeset, as a hexadecimal string.
+    :type hex_hash:  str
+    :param order:  The order of the changeset.
+    :type order:  int
+    :param created_at:  The unix timestamp when the changeset was created.
+    :type created_at:  int
+    :param loader:  A callable returning the full ``Changeset``.
+    :type loader:  callable
+
+    """
+
+    def __init__(self, hex_hash, order, created_at, loader):
+        self._loader = loader
+        self._setup = None
+        self._teardown = None
+        self._settings = None
+        self._transaction = None
+        self._order = order
+        self._created_at = created_at
+        self._hash = binascii.unhexlify(hex_hash)
+
+    def _load(self):
+        changeset = self._loader()
+        if self._setup is None:
+            self._setup = changeset.setup
+        if self._teardown is None:
+            self._teardown = changeset.teardown
+        if self._settings is None:
+            self._settings = changeset.settings
+        if self._transaction is None:
+            self._transaction = changeset.transaction
+        self._loader = None
+
+    def _get_setup(self):
+        if self._setup is None:
+            self._load()
+        return self._setup
+
+    def _get_teardown(self):
+        if self._teardown is None:
+            self._load()
+        return self._teardown
+
+    def _get_settings(self):
+        if self._settings is None:
+            self._load()
+        return self._settings
+
+    def _get_transaction(self):
+        if self._transaction is None:
+            self._load()
+        return self._transaction
+
+    setup = property(_get_setup, Changeset.setup.fset)
+    teardown = property(_get_teardown, Changeset.teardown.fset)
+    settings = property(_get_settings, Changeset.settings.fset)
+    transaction = property(_get_transaction, Changeset.transaction.fset)
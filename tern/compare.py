@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+
+
+class Comparison(object):
+    """
+    The differences between the changesets applied to two databases.
+
+    :param only_left:  ``(hash, order)`` tuples of the changesets applied only
+        to the left database, sorted by order.
+    :type only_left:  list
+    :param only_right:  Likewise for the right database.
+    :type only_right:  list
+    :param queries:  The number of queries the comparison took.
+    :type queries:  int
+
+    """
+
+    def __init__(self, only_left, only_right, queries):
+        self.only_left = only_left
+        self.only_right = only_right
+        self.queries = queries
+
+    @property
+    def same(self):
+        return not self.only_left and not self.only_right
+
+    def __repr__(self):
+        return 'Comparison(only_left={0!r}, only_right={1!r})'.format(
+            self.only_left, self.only_right,
+        )
+
+
+def compare(left, right, buckets=16, leaf_size=64):
+    """
+    Compare the changesets applied to two databases without fetching either
+    tern table.  The range of orders is split into ``buckets`` ranges, whose
+    digests are computed by each database (see
+    ``AdapterBase.get_range_digests``).  Ranges with matching digests are
+    identical; the others are split again, until they're small enough to
+    list their hashes.  Finding a handful of differences among ``n``
+    changesets takes about ``log(n) / log(buckets)`` rounds of queries.
+
+    Both adapters must be open.
+
+    :param left:  The adapter of one database.
+    :type left:  Object implementing ``tern.adapters.AdapterBase``.
+    :param right:  The adapter of the other database.
+    :type right:  Object implementing ``tern.adapters.AdapterBase``.
+    :param buckets:  The number of ranges to split a range into.
+    :type buckets:  int
+    :param leaf_size:  Ranges with at most this many changesets in both
+        databases are compared by listing their hashes.
+    :type leaf_size:  int
+
+    :returns:  A ``Comparison``.
+
+    """
+    if buckets < 2:
+        raise ValueError('buckets must be at least 2.')
+    bounds = [
+        x for x in (left.get_order_range(), right.get_order_range())
+        if x is not None
+    ]
+    queries = 2
+    only_left = list()
+    only_right = list()
+    if not bounds:
+        return Comparison(only_left, only_right, queries)
+
+    # ``(low, high, size)`` ranges which differ, where ``size`` is the larger
+    # of the two changeset counts, if known.
+    ranges = [(
+        min(low for low, _ in bounds), max(high for _, high in bounds) + 1,
+        None,
+    )]
+    while ranges:
+        next_ranges = list()
+        for low, high, size in ranges:
+            if high - low <= buckets or (
+                size is not None and size <= leaf_size
+            ):
+                left_hashes = dict(left.get_applied_hashes(low, high))
+                right_hashes = dict(right.get_applied_hashes(low, high))
+                queries += 2
+                only_left.extend(
+                    x for x in left_hashes.items() if x[0] not in right_hashes
+                )
+                only_right.extend(
+                    x for x in right_hashes.items() if x[0] not in left_hashes
+                )
+                continue
+            width = -(-(high - low) // buckets)
+            left_digests = left.get_range_digests(low, width, buckets)
+            right_digests = right.get_range_digests(low, width, buckets)
+            queries += 2
+            for i, (a, b) in enumerate(zip(left_digests, right_digests)):
+                if a != b:
+                    next_ranges.append((
+                        low + i * width, min(high, low + (i + 1) * width),
+                        max(a[0], b[0]),
+                    ))
+        ranges = next_ranges
+
+    only_left.sort(key=lambda x: x[1])
+    only_right.sort(key=lambda x: x[1])
+    return Comparison(only_left, only_right, queries)
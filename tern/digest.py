@@ -0,0 +1,39 @@
+"""
+Digests of sets of changesets.
+
+A digest is a ``(count, total)`` tuple:  the number of changesets, and the
+sum of a 32-bit value derived from the order and hash of each one.  Because
+it's a sum, a database can keep the digest of its applied changesets up to
+date as they're applied and reverted, and two sets can be compared without
+listing them.
+
+"""
+from __future__ import absolute_import
+import hashlib
+
+
+def changeset_value(hex_hash, order):
+    """
+    Return the digest value of one changeset:  the first eight hex digits of
+    the MD5 of ``"<order>:<hex hash>"``, as an integer.  Adapters which compute
+    it in SQL must match this exactly.
+
+    """
+    data = '{0}:{1}'.format(order, hex_hash).encode('ascii')
+    return int(hashlib.md5(data).hexdigest()[:8], 16)
+
+
+def digest(pairs):
+    """
+    Return the digest of the given changesets.
+
+    :param pairs:  ``(hex_hash, order)`` tuples, as returned by
+        ``AdapterBase.get_applied_hashes``.
+
+    """
+    count = 0
+    total = 0
+    for hex_hash, order in pairs:
+        count += 1
+        total += changeset_value(hex_hash, order)
+    return count, total
@@ -0,0 +1,203 @@
+from __future__ import absolute_import
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+from .utils import atomic_write
+
+try:
+    _cpu_time = time.process_time
+except AttributeError:
+    # Python 2.
+    _cpu_time = time.clock
+
+
+class Event(object):
+    """
+    Something tern did, passed to hooks twice:  once before it starts, with
+    ``phase`` set to ``'before'``, and once after it finishes, with
+    ``phase`` set to ``'after'`` and the measurements filled in.
+
+    :param name:  What's being done:  ``'diff'``, ``'apply'``, ``'revert'``
+        or ``'test'``.
+    :type name:  str
+    :param phase:  ``'before'`` or ``'after'``.
+    :type phase:  str
+    :param hex_hash:  The hash of the changeset, if there is one.
+    :type hex_hash:  str
+    :param wall:  The elapsed time, in seconds.
+    :type wall:  float
+    :param cpu:  The CPU time used by this process, in seconds.  The time
+        spent by the database isn't included.
+    :type cpu:  float
+    :param round_trips:  The number of round trips to the database.
+    :type round_trips:  int
+    :param error:  The exception raised, if it failed.
+    :type error:  Exception
+
+    """
+
+    def __init__(
+        self, name, phase, hex_hash=None, wall=None, cpu=None,
+        round_trips=None, error=None,
+    ):
+        self.name = name
+        self.phase = phase
+        self.hex_hash = hex_hash
+        self.wall = wall
+        self.cpu = cpu
+        self.round_trips = round_trips
+        self.error = error
+        self.timestamp = time.time()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return dict(
+            name=self.name, phase=self.phase, hash=self.hex_hash,
+            wall=self.wall, cpu=self.cpu, round_trips=self.round_trips,
+            error=None if self.error is None else repr(self.error),
+            timestamp=self.timestamp,
+        )
+
+    def __repr__(self):
+        return 'Event({0!r}, {1!r}, hex_hash={2!r})'.format(
+            self.name, self.phase, self.hex_hash,
+        )
+
+
+@contextmanager
+def emitting(hooks, name, adapter, changeset=None):
+    """
+    Call each hook with an ``Event`` before and after the block.  Hooks are
+    called synchronously, so they should be quick.
+
+    :param hooks:  The hooks, callables taking an ``Event``.
+    :type hooks:  list
+    :param name:  The name of the events.
+    :type name:  str
+    :param adapter:  The adapter, whose round trips are counted.
+    :type adapter:  Object implementing ``tern.adapters.AdapterBase``.
+    :param changeset:  The changeset, if there is one.
+    :type changeset:  tern.Changeset
+
+    """
+    hex_hash = None if changeset is None else changeset.hex_hash
+    for hook in hooks:
+        hook(Event(name, 'before', hex_hash))
+    round_trips = adapter.round_trips
+    cpu = _cpu_time()
+    wall = time.time()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        event = Event(
+            name, 'after', hex_hash, time.time() - wall, _cpu_time() - cpu,
+            adapter.round_trips - round_trips, error,
+        )
+        for hook in hooks:
+            hook(event)
+
+
+class JSONLinesSink(object):
+    """
+    A hook appending the events to a file, one JSON object per line.  Each
+    line is written with a single ``write``, so several processes can share
+    the file.
+
+    :param path:  The path of the file.
+    :type path:  str
+    :param phases:  The phases of the events to write.
+    :type phases:  tuple
+
+    """
+
+    def __init__(self, path, phases=('after',)):
+        self.path = path
+        self.phases = phases
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.phase not in self.phases:
+            return
+        line = json.dumps(event.as_dict(), sort_keys=True) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as fh:
+                fh.write(line)
+
+
+class PrometheusSink(object):
+    """
+    A hook exporting totals of the events in the Prometheus text format, to
+    a file read by node_exporter's textfile collector.  The file is rewritten
+    after each event, through a temporary file so the collector never reads
+    a partial one.
+
+    :param path:  The path of the file, which should end with ``.prom``.
+    :type path:  str
+    :param labels:  Labels to add to every metric, such as
+        ``{'database': 'main'}``.
+    :type labels:  dict
+
+    """
+
+    _metrics = [
+        ('tern_events_total', 'counter', 'Events completed.'),
+        ('tern_errors_total', 'counter', 'Events which failed.'),
+        ('tern_wall_seconds_total', 'counter', 'Elapsed time.'),
+        ('tern_cpu_seconds_total', 'counter', 'CPU time of tern.'),
+        ('tern_round_trips_total', 'counter', 'Round trips to the database.'),
+        (
+            'tern_last_event_timestamp_seconds', 'gauge',
+            'When an event last completed.',
+        ),
+    ]
+
+    def __init__(self, path, labels=None):
+        self.path = path
+        self.labels = dict(labels or {})
+        self._totals = dict()
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.phase != 'after':
+            return
+        with self._lock:
+            totals = self._totals.setdefault(
+                event.name, [0, 0, 0.0, 0.0, 0, 0.0],
+            )
+            totals[0] += 1
+            totals[1] += 0 if event.ok else 1
+            totals[2] += event.wall
+            totals[3] += event.cpu
+            totals[4] += event.round_trips
+            totals[5] = event.timestamp
+            self._write()
+
+    def _format_labels(self, name):
+        labels = dict(self.labels, event=name)
+        return ','.join(
+            '{0}="{1}"'.format(key, str(value).replace('\\', '\\\\').replace(
+                '"', '\\"',
+            ))
+            for key, value in sorted(labels.items())
+        )
+
+    def _write(self):
+        lines = list()
+        for i, (metric, type_, help_) in enumerate(self._metrics):
+            lines.append('# HELP {0} {1}'.format(metric, help_))
+            lines.append('# TYPE {0} {1}'.format(metric, type_))
+            for name, totals in sorted(self._totals.items()):
+                lines.append('{0}{{{1}}} {2}'.format(
+                    metric, self._format_labels(name), totals[i],
+                ))
+        with atomic_write(self.path) as fh:
+            fh.write('\n'.join(lines) + '\n')
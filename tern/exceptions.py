@@ -4,3 +4,24 @@ class InvalidChangesetFile(Exception):
 
 class NotInitialized(Exception):
     pass
+
+
+class ChangesetError(Exception):
+    """
+    A changeset failed to apply or revert during an update.
+
+    :param changeset:  The failing changeset.
+    :type changeset:  tern.Changeset
+    :param error:  The error raised by the adapter.
+    :type error:  Exception
+
+    """
+
+    def __init__(self, changeset, error):
+        super(ChangesetError, self).__init__(
+            'Changeset {0} failed:  {1}'.format(changeset.hex_hash, error)
+        )
+        self.changeset = changeset
+        self.error = error
+        # Chain the adapter's error, as ``raise ... from error`` would.
+        self.__cause__ = error
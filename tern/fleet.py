@@ -0,0 +1,175 @@
+from __future__ import absolute_import
+import threading
+from multiprocessing.pool import ThreadPool
+from time import time
+
+from .api import Tern
+from .exceptions import NotInitialized
+
+
+def schema_targets(adapter, pattern='%'):
+    """
+    Return fleet targets for each schema in a database with one schema per
+    tenant.  The targets share the adapter's connection pool, if it has one,
+    so connections are reused from schema to schema.
+
+    :param adapter:  An adapter for the database, supporting ``list_schemas``
+        and ``for_schema``, such as
+        ``tern.adapters.postgresql.PostgreSQLAdapter``.
+    :param pattern:  Only schemas matching this ``LIKE`` pattern are included.
+    :type pattern:  str
+
+    :returns:  A list of ``(schema, adapter)`` tuples.
+
+    """
+    with adapter:
+        schemas = adapter.list_schemas(pattern)
+    return [(schema, adapter.for_schema(schema)) for schema in schemas]
+
+
+class TargetResult(object):
+    """
+    The outcome of updating one database in a fleet.
+
+    :param name:  The name of the target.
+    :type name:  str
+    :param reverted:  The number of changesets reverted.
+    :type reverted:  int
+    :param applied:  The number of changesets applied.
+    :type applied:  int
+    :param seconds:  How long the update took.
+    :type seconds:  float
+    :param error:  The exception raised, if the update failed.
+    :type error:  Exception
+
+    """
+
+    def __init__(self, name, reverted=0, applied=0, seconds=0.0, error=None):
+        self.name = name
+        self.reverted = reverted
+        self.applied = applied
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return (
+            'TargetResult({0!r}, reverted={1}, applied={2}, error={3!r})'
+        ).format(self.name, self.reverted, self.applied, self.error)
+
+
+class FleetReport(object):
+    """
+    The outcome of updating a fleet, a list of ``TargetResult`` objects in
+    the order the targets were given.
+
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok]
+
+    def summary(self):
+        """
+        Return a human-readable summary of the update.
+
+        """
+        lines = ['{0} targets:  {1} updated, {2} failed.'.format(
+            len(self.results), len(self.succeeded), len(self.failed),
+        )]
+        for result in self.failed:
+            lines.append('  {0}:  {1}'.format(result.name, result.error))
+        return '\n'.join(lines)
+
+
+class Fleet(object):
+    """
+    Brings many databases in sync with one tern directory concurrently.  The
+    tern directory is read and parsed once, and shared by all targets.  A
+    failure on one target does not affect the others.
+
+    :param targets:  The databases to update, as ``(name, adapter)`` tuples.
+        Adapters are opened and closed by the fleet.
+    :type targets:  list
+    :param directory:  The directory storing the tern objects.
+    :type directory:  str
+    :param jobs:  The maximum number of databases to update at once.
+    :type jobs:  int
+    :param initialize:  If true, targets which have not been initialized are
+        initialized before they're updated.
+    :type initialize:  bool
+    :param options:  Other keyword arguments are passed to ``Tern``.
+
+    An interrupted update can be resumed by running it again:  the diff of
+    each target is computed from its own tern table, and with the default,
+    unbatched update every changeset is committed as it's applied.
+
+    """
+
+    def __init__(
+        self, targets, directory, jobs=8, initialize=False, **options
+    ):
+        self.targets = list(targets)
+        self.directory = directory
+        self.jobs = jobs
+        self.initialize = initialize
+        self.options = options
+
+    def update(self, batch=False, batch_size=None, progress=None):
+        """
+        Update every target, see ``Tern.update``.
+
+        :param progress:  Called as ``progress(result)`` with the
+            ``TargetResult`` of each target as it finishes.  Calls are
+            serialized, but come from worker threads.
+        :type progress:  callable
+
+        :returns:  A ``FleetReport``.
+
+        """
+        template = Tern(None, self.directory, verify=False, **self.options)
+        template.preload()
+        lock = threading.Lock()
+
+        def update_target(target):
+            name, adapter = target
+            start = time()
+            result = TargetResult(name)
+            try:
+                with adapter:
+                    if self.initialize:
+                        try:
+                            adapter.verify_tern()
+                        except NotInitialized:
+                            adapter.initialize_tern()
+                    tern = template.for_adapter(adapter)
+                    to_revert, to_apply = tern.update(
+                        batch=batch, batch_size=batch_size,
+                    )
+                result.reverted = len(to_revert)
+                result.applied = len(to_apply)
+            except Exception as e:
+                result.error = e
+            result.seconds = time() - start
+            if progress is not None:
+                with lock:
+                    progress(result)
+            return result
+
+        pool = ThreadPool(max(1, min(self.jobs, len(self.targets))))
+        try:
+            results = pool.map(update_target, self.targets, 1)
+        finally:
+            pool.close()
+            pool.join()
+        return FleetReport(results)
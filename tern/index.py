@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+import os
+import os.path
+import json
+
+from .changeset import Changeset, LazyChangeset
+from .utils import atomic_write
+
+
+def _stat_key(st):
+    """
+    Return the part of a ``stat`` result used to detect changes to a file.
+
+    """
+    mtime = getattr(st, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = st.st_mtime
+    return [mtime, st.st_size, st.st_ino]
+
+
+class ChangesetIndex(object):
+    """
+    A persistent cache of changeset metadata, stored in the tern directory,
+    so that unchanged changeset files do not need to be read and parsed
+    again.
+
+    Entries are keyed by filename and validated against the file's mtime, size
+    and inode.  Like git's index, an entry for a file modified at or after the
+    index was written is not trusted, since the file may have changed again
+    within the timestamp resolution of the filesystem.
+
+    The index is only a cache:  if it is missing, corrupt or unwritable, it is
+    rebuilt or ignored.  It's written to a temporary file and renamed into
+    place, so concurrent processes will never see a partially written index.
+
+    :param directory:  The directory storing the tern objects.
+    :type directory:  str
+
+    """
+
+    filename = '.tern-index'
+    version = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, self.filename)
+        self.entries = dict()
+        self._written_at = None
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """
+        Read the index from disk, discarding it if it is unreadable or of a
+        different version.
+
+        """
+        self.entries = dict()
+        self._written_at = None
+        try:
+            with open(self.path) as fh:
+                written_at = os.fstat(fh.fileno()).st_mtime
+                data = json.load(fh)
+        except (IOError, OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get('version') != self.version:
+            return
+        self.entries = data.get('entries') or dict()
+        self._written_at = written_at
+
+    def lookup(self, fn, st):
+        """
+        Return the metadata for the given file as a ``LazyChangeset``, or
+        ``None`` if there is no valid entry.
+
+        :param fn:  The filename, relative to the tern directory.
+        :type fn:  str
+        :param st:  The result of ``os.stat`` on the file.
+
+        """
+        entry = self.entries.get(fn)
+        if entry is None or entry[:3] != _stat_key(st):
+            return None
+        if self._written_at is None or st.st_mtime >= self._written_at:
+            return None
+        order, created_at, hex_hash = entry[3:]
+        path = os.path.join(self.directory, fn)
+        return LazyChangeset(
+            hex_hash, order, created_at, lambda: Changeset.from_file(path),
+        )
+
+    def add(self, fn, st, changeset):
+        """
+        Add or replace the entry for the given file.
+
+        :param fn:  The filename, relative to the tern directory.
+        :type fn:  str
+        :param st:  The result of ``os.stat`` on the file.
+        :param changeset:  The changeset parsed from the file.
+        :type changeset:  tern.Changeset
+
+        """
+        self.entries[fn] = _stat_key(st) + [
+            changeset.order, changeset.created_at, changeset.hex_hash,
+        ]
+        self._dirty = True
+
+    def prune(self, filenames):
+        """
+        Remove entries for files not in ``filenames``.
+
+        """
+        for fn in set(self.entries) - set(filenames):
+            del self.entries[fn]
+            self._dirty = True
+
+    def save(self):
+        """
+        Write the index to disk if it has changed.  Errors are ignored, since
+        the index is only a cache.
+
+        """
+        if not self._dirty:
+            return
+        try:
+            with atomic_write(self.path) as fh:
+                json.dump({
+                    'version': self.version,
+                    'entries': self.entries,
+                }, fh)
+        except (IOError, OSError):
+            return
+        self._dirty = False
@@ -0,0 +1,181 @@
+from __future__ import absolute_import
+import binascii
+import os
+import os.path
+import mmap
+import struct
+
+from .changeset import Changeset, LazyChangeset
+from .exceptions import InvalidChangesetFile
+from .utils import atomic_write
+
+
+class ChangesetPack(object):
+    """
+    A single file holding many changesets, with an index to find them, so a
+    large history doesn't need a file per changeset.  Like git's packfiles,
+    the pack is memory-mapped and the SQL of a changeset is only read when
+    it's needed.  Packs are written by ``Tern.pack``.
+
+    The layout of the file, with big-endian integers:
+
+    * A header:  the magic bytes ``TERNPACK``, the version (4 bytes) and the
+      number of changesets (4 bytes).
+    * The index, one entry per changeset sorted by hash:  the hash (20
+      bytes), order (8 bytes), created at (8 bytes), and the offset (8 bytes)
+      and length (4 bytes) of its data.
+    * The data, the changeset files as written by ``Changeset.save``.
+
+    :param path:  The path of the pack file.
+    :type path:  str
+
+    """
+
+    filename = 'tern.pack'
+    magic = b'TERNPACK'
+    version = 1
+    _header = struct.Struct('>8sII')
+    _entry = struct.Struct('>20sqqQI')
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size < self._header.size:
+                raise InvalidChangesetFile(
+                    '{0} is not a tern pack.'.format(path)
+                )
+            self._data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = self._header.unpack_from(self._data)
+        if magic != self.magic or version != self.version:
+            raise InvalidChangesetFile(
+                '{0} is not a tern pack of version {1}.'.format(
+                    path, self.version,
+                )
+            )
+        if self._header.size + self.count * self._entry.size > size:
+            raise InvalidChangesetFile('{0} is truncated.'.format(path))
+
+    @classmethod
+    def open(cls, directory):
+        """
+        Return the pack in the given tern directory, or ``None`` if there is
+        none.
+
+        """
+        path = os.path.join(directory, cls.filename)
+        if not os.path.isfile(path):
+            return None
+        return cls(path)
+
+    def close(self):
+        self._data.close()
+
+    def __len__(self):
+        return self.count
+
+    def _entry_at(self, i):
+        return self._entry.unpack_from(
+            self._data, self._header.size + i * self._entry.size,
+        )
+
+    def _find(self, hex_hash):
+        """
+        Binary search the index, returning the entry for the given hash or
+        ``None``.
+
+        """
+        key = binascii.unhexlify(hex_hash)
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            entry = self._entry_at(mid)
+            if entry[0] < key:
+                low = mid + 1
+            elif entry[0] > key:
+                high = mid
+            else:
+                return entry
+        return None
+
+    def _lazy(self, entry):
+        _, order, created_at, offset, length = entry
+        data = self._data
+        return LazyChangeset(
+            binascii.hexlify(entry[0]).decode('ascii'), order, created_at,
+            lambda: Changeset.from_bytes(data[offset:offset + length]),
+        )
+
+    def lookup(self, hex_hash):
+        """
+        Return the changeset with the given hash as a ``LazyChangeset``, or
+        ``None`` if it isn't in the pack.
+
+        """
+        entry = self._find(hex_hash)
+        return None if entry is None else self._lazy(entry)
+
+    def hashes(self):
+        """
+        Return the hex hashes of the changesets in the pack, in sorted order.
+
+        """
+        hashes = list()
+        for i in range(self.count):
+            position = self._header.size + i * self._entry.size
+            hashes.append(binascii.hexlify(
+                self._data[position:position + 20]
+            ).decode('ascii'))
+        return hashes
+
+    def changesets(self):
+        """
+        Return a dictionary mapping the hex hashes of all the changesets in
+        the pack to ``LazyChangeset`` objects.
+
+        """
+        changesets = dict()
+        for i in range(self.count):
+            changeset = self._lazy(self._entry_at(i))
+            changesets[changeset.hex_hash] = changeset
+        return changesets
+
+    def read(self, hex_hash):
+        """
+        Return the raw data of the changeset with the given hash, as written
+        by ``Changeset.save``.  Raises ``KeyError`` if it isn't in the pack.
+
+        """
+        entry = self._find(hex_hash)
+        if entry is None:
+            raise KeyError(hex_hash)
+        offset, length = entry[3:]
+        return self._data[offset:offset + length]
+
+    @classmethod
+    def write(cls, path, entries):
+        """
+        Write a pack file.  It's written to a temporary file and renamed into
+        place, so readers never see a partially written pack.
+
+        :param path:  The path of the pack file.
+        :type path:  str
+        :param entries:  ``(hex_hash, order, created_at, data)`` tuples, where
+            ``data`` is the changeset file as written by ``Changeset.save``.
+        :type entries:  list
+
+        """
+        entries = sorted(
+            (binascii.unhexlify(hex_hash), order, created_at, data)
+            for hex_hash, order, created_at, data in entries
+        )
+        offset = cls._header.size + len(entries) * cls._entry.size
+        with atomic_write(path, 'wb') as fh:
+            fh.write(cls._header.pack(cls.magic, cls.version, len(entries)))
+            for key, order, created_at, data in entries:
+                fh.write(cls._entry.pack(
+                    key, order, created_at, offset, len(data),
+                ))
+                offset += len(data)
+            for entry in entries:
+                fh.write(entry[3])
@@ -0,0 +1,271 @@
+from __future__ import absolute_import
+import re
+
+
+# String literals and comments, which are blanked out before looking for
+# table names.
+_noise_re = re.compile(
+    r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL,
+)
+
+_name = r'(?P<name>(?:"[^"]+"|[\w$]+)(?:\.(?:"[^"]+"|[\w$]+))?)'
+
+# The tables a statement reads or writes, by the clause naming them.
+_table_res = [
+    re.compile(
+        pattern + r'\s+(?:if\s+(?:not\s+)?exists\s+)?(?:only\s+)?' + _name,
+        re.I,
+    )
+    for pattern in [
+        r'\balter\s+table',
+        r'\bdrop\s+table',
+        r'\btruncate(?:\s+table)?',
+        r'\block(?:\s+table)?',
+        r'\bvacuum(?:\s+full)?(?:\s+analyze)?',
+        r'\bcluster',
+        r'\breindex\s+table(?:\s+concurrently)?',
+        r'\brefresh\s+materialized\s+view(?:\s+concurrently)?',
+        r'\binsert\s+into',
+        r'\bdelete\s+from',
+        r'^\s*update',
+        r'\bmerge\s+into',
+        r'\breferences',
+        r'\bcreate\s+(?:unique\s+)?index\b[^;]*?\bon',
+    ]
+]
+
+_dml_re = re.compile(r'^\s*(?:with|insert|update|delete|merge)\b', re.I)
+
+# Statements which finish quickly whatever the size of the tables they name.
+_cheap_re = re.compile(
+    r'^\s*(?:drop|truncate|lock|comment|grant|revoke|create\s+(?:view|'
+    r'function|or\s+replace|type|schema|sequence|extension|'
+    # Not ``create table ... as select``.
+    r'table(?![^(]*\bas\b)))\b',
+    re.I,
+)
+
+
+def touched_tables(statement):
+    """
+    Return the names of the tables a statement reads or writes, as written
+    in the statement, in the order they appear.  This is a heuristic based
+    on the clauses naming tables, it doesn't parse the SQL.
+
+    """
+    statement = _noise_re.sub(' ', statement)
+    tables = list()
+    for table_re in _table_res:
+        for match in table_re.finditer(statement):
+            name = match.group('name')
+            if name not in tables:
+                tables.append(name)
+    return tables
+
+
+class StatementPlan(object):
+    """
+    The estimated cost of one statement.
+
+    :param statement:  The SQL statement.
+    :type statement:  str
+    :param tables:  The tables it touches, see ``touched_tables``.
+    :type tables:  list of str
+    :param rows:  The number of rows the database expects the statement to
+        process, if it's DML the database could explain.
+    :type rows:  int
+    :param seconds:  The predicted duration.
+    :type seconds:  float
+
+    """
+
+    def __init__(self, statement, tables, rows=None, seconds=0.0):
+        self.statement = statement
+        self.tables = tables
+        self.rows = rows
+        self.seconds = seconds
+
+
+class ChangesetPlan(object):
+    """
+    The estimated cost of applying or reverting a changeset.
+
+    :param changeset:  The changeset.
+    :type changeset:  tern.Changeset
+    :param revert:  Whether the changeset is to be reverted.
+    :type revert:  bool
+    :param statements:  A ``StatementPlan`` per statement of the SQL run.
+    :type statements:  list
+
+    """
+
+    def __init__(self, changeset, revert, statements):
+        self.changeset = changeset
+        self.revert = revert
+        self.statements = statements
+
+    @property
+    def seconds(self):
+        return sum(s.seconds for s in self.statements)
+
+    @property
+    def tables(self):
+        tables = list()
+        for statement in self.statements:
+            tables.extend(t for t in statement.tables if t not in tables)
+        return tables
+
+
+class Plan(object):
+    """
+    The estimated cost of a diff, see ``plan``.
+
+    :param changesets:  A ``ChangesetPlan`` per changeset, in the order they
+        would run.
+    :type changesets:  list
+    :param table_sizes:  The sizes of the existing tables touched, mapping
+        their names to ``(bytes, rows)`` tuples.
+    :type table_sizes:  dict
+
+    """
+
+    def __init__(self, changesets, table_sizes):
+        self.changesets = changesets
+        self.table_sizes = table_sizes
+
+    @property
+    def seconds(self):
+        """
+        The predicted duration of the whole diff.
+
+        """
+        return sum(cs.seconds for cs in self.changesets)
+
+    def report(self):
+        """
+        Return a human-readable report of the plan.
+
+        """
+        lines = list()
+        for cs in self.changesets:
+            lines.append('{0} {1} (order {2}):  {3}'.format(
+                'Revert' if cs.revert else 'Apply', cs.changeset.hex_hash,
+                cs.changeset.order, _format_seconds(cs.seconds),
+            ))
+            for statement in cs.statements:
+                line = ' '.join(statement.statement.split())
+                if len(line) > 60:
+                    line = line[:57] + '...'
+                details = list()
+                if statement.tables:
+                    details.append(', '.join(statement.tables))
+                if statement.rows is not None:
+                    details.append('~{0} rows'.format(statement.rows))
+                details.append(_format_seconds(statement.seconds))
+                lines.append('    {0}  [{1}]'.format(
+                    line, '; '.join(details),
+                ))
+        if self.table_sizes:
+            lines.append('Tables:')
+            for name, (size, rows) in sorted(self.table_sizes.items()):
+                lines.append('    {0}:  {1}{2}'.format(
+                    name, _format_bytes(size),
+                    '' if rows is None else ', ~{0} rows'.format(rows),
+                ))
+        lines.append('{0} changesets, predicted duration:  {1}'.format(
+            len(self.changesets), _format_seconds(self.seconds),
+        ))
+        return '\n'.join(lines)
+
+
+def _format_seconds(seconds):
+    if seconds < 60:
+        return '{0:.1f}s'.format(seconds)
+    minutes, seconds = divmod(int(seconds), 60)
+    if minutes < 60:
+        return '{0}m{1:02}s'.format(minutes, seconds)
+    return '{0}h{1:02}m'.format(*divmod(minutes, 60))
+
+
+def _format_bytes(size):
+    if size is None:
+        return 'unknown size'
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1024:
+            return '{0:.0f} {1}'.format(size, unit)
+        size /= 1024.0
+    return '{0:.1f} TB'.format(size)
+
+
+def plan(
+    adapter, to_revert, to_apply, bytes_per_second=100 * 1024 ** 2,
+    rows_per_second=100000,
+):
+    """
+    Estimate the cost of reverting and applying changesets, such as the diff
+    returned by ``Tern.diff``, without running any of their SQL.
+
+    The sizes of the tables each statement touches are fetched from the
+    database (see ``AdapterBase.get_table_sizes``), and DML is explained
+    (see ``AdapterBase.explain``) for the number of rows it processes.  The
+    duration of DML is predicted from its rows if known, and that of other
+    statements from the size of their tables, as if they rewrote them.  This
+    is pessimistic for DDL which only changes the catalog.
+
+    The adapter must be open.
+
+    :param adapter:  The adapter of the database.
+    :type adapter:  Object implementing ``tern.adapters.AdapterBase``.
+    :param to_revert:  The changesets to revert, in order.
+    :type to_revert:  list
+    :param to_apply:  The changesets to apply, in order.
+    :type to_apply:  list
+    :param bytes_per_second:  How fast the database scans or rewrites tables.
+    :type bytes_per_second:  float
+    :param rows_per_second:  How fast DML processes rows.
+    :type rows_per_second:  float
+
+    :returns:  A ``Plan``.
+
+    """
+    steps = [(True, cs) for cs in to_revert]
+    steps += [(False, cs) for cs in to_apply]
+    statements = [
+        (revert, cs, adapter.split_statements(
+            cs.teardown if revert else cs.setup
+        ))
+        for revert, cs in steps
+    ]
+    tables = set()
+    for _, _, sqls in statements:
+        for sql in sqls:
+            tables.update(touched_tables(sql))
+    try:
+        table_sizes = adapter.get_table_sizes(sorted(tables))
+    except NotImplementedError:
+        table_sizes = dict()
+
+    changesets = list()
+    for revert, cs, sqls in statements:
+        plans = list()
+        for sql in sqls:
+            statement = StatementPlan(sql, touched_tables(sql))
+            if _cheap_re.match(sql):
+                plans.append(statement)
+                continue
+            if _dml_re.match(sql):
+                try:
+                    statement.rows = adapter.explain(sql)
+                except NotImplementedError:
+                    pass
+            if statement.rows is not None:
+                statement.seconds = statement.rows / float(rows_per_second)
+            else:
+                size = sum(
+                    table_sizes[t][0] or 0
+                    for t in statement.tables if t in table_sizes
+                )
+                statement.seconds = size / float(bytes_per_second)
+            plans.append(statement)
+        changesets.append(ChangesetPlan(cs, revert, plans))
+    return Plan(changesets, table_sizes)
@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+from datetime import datetime
+from time import time
+
+from .plan import plan, _format_seconds
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def estimate_durations(adapter, to_revert, to_apply, sources=()):
+    """
+    Predict how long each changeset of a diff will take.  Applies take the
+    median of the durations recorded for the same changeset on the other
+    databases (see ``AdapterBase.get_timings``); reverts, and applies which
+    haven't run anywhere yet, are estimated from the sizes of the tables
+    they touch, see ``tern.plan.plan``.
+
+    The adapters must be open.
+
+    :param adapter:  The adapter of the database to update.
+    :type adapter:  Object implementing ``tern.adapters.AdapterBase``.
+    :param to_revert:  The changesets to revert, in order.
+    :type to_revert:  list
+    :param to_apply:  The changesets to apply, in order.
+    :type to_apply:  list
+    :param sources:  Adapters of other databases, such as the rest of a
+        fleet, which may have applied the changesets already.
+    :type sources:  list
+
+    :returns:  A dictionary mapping the hex hashes of the changesets to
+        their predicted durations in seconds.
+
+    """
+    hashes = [cs.hex_hash for cs in to_apply]
+    durations = dict()
+    for source in sources:
+        for hex_hash, timing in (source.get_timings(hashes) or {}).items():
+            durations.setdefault(hex_hash, list()).append(timing[1])
+    estimates = dict(
+        (hex_hash, _median(values)) for hex_hash, values in durations.items()
+    )
+    missing = [cs for cs in to_apply if cs.hex_hash not in estimates]
+    for cs_plan in plan(adapter, to_revert, missing).changesets:
+        estimates[cs_plan.changeset.hex_hash] = cs_plan.seconds
+    return estimates
+
+
+class Progress(object):
+    """
+    Reports the progress of an update with an ETA.  Pass it as the
+    ``progress`` of ``Tern.update``, which calls it with each changeset as
+    it's reverted or applied.
+
+    The ETA is the predicted duration of the remaining changesets, scaled by
+    how the ones done so far compared with their predictions.
+
+    :param changesets:  The changesets to revert and apply, in order.
+    :type changesets:  list
+    :param estimates:  Their predicted durations, see
+        ``estimate_durations``.
+    :type estimates:  dict
+    :param write:  Called with each line of the report.
+    :type write:  callable
+
+    """
+
+    def __init__(self, changesets, estimates, write):
+        self.total = len(changesets)
+        self.remaining = sum(
+            estimates.get(cs.hex_hash, 0.0) for cs in changesets
+        )
+        self.estimates = estimates
+        self.write = write
+        self.done = 0
+        self.predicted = 0.0
+        self.start = self.last = time()
+
+    def eta(self):
+        """
+        Return the predicted number of seconds until the update finishes.
+
+        """
+        if self.predicted <= 0:
+            return self.remaining
+        return self.remaining * (self.last - self.start) / self.predicted
+
+    def __call__(self, changeset):
+        now = time()
+        estimate = self.estimates.get(changeset.hex_hash, 0.0)
+        self.done += 1
+        self.predicted += estimate
+        self.remaining = max(0.0, self.remaining - estimate)
+        seconds, self.last = now - self.last, now
+        self.write('[{0}/{1}] {2} (order {3}) in {4}, ETA {5}'.format(
+            self.done, self.total, changeset.hex_hash, changeset.order,
+            _format_seconds(seconds), _format_seconds(self.eta()),
+        ))
+
+
+def timings_report(timings, orders, top=10):
+    """
+    Return a human-readable report of recorded timings.
+
+    :param timings:  The timings, see ``AdapterBase.get_timings``.
+    :type timings:  dict
+    :param orders:  A dictionary mapping the hex hashes of the applied
+        changesets to their orders.
+    :type orders:  dict
+    :param top:  The number of slowest changesets to list.
+    :type top:  int
+
+    """
+    total = sum(timing[1] for timing in timings.values())
+    lines = ['{0} of {1} changesets timed, {2} in total.'.format(
+        len(timings), len(orders), _format_seconds(total),
+    )]
+    slowest = sorted(timings.items(), key=lambda x: -x[1][1])[:top]
+    if slowest:
+        lines.append('Slowest:')
+    for hex_hash, (applied_at, duration, statements) in slowest:
+        lines.append(
+            '    {0}  order {1}, {2} statements, applied {3}:  {4}'.format(
+                hex_hash, orders.get(hex_hash), statements,
+                datetime.utcfromtimestamp(applied_at).strftime(
+                    '%Y-%m-%d %H:%M:%S',
+                ),
+                _format_seconds(duration),
+            )
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,139 @@
+from __future__ import absolute_import
+
+import asyncio
+import shutil
+import tempfile
+import os
+import os.path
+
+from nose.tools import eq_
+
+from ..adapters.aio import AsyncSQLiteAdapter
+from ..aio import AsyncTern
+from ..api import Tern
+from ..adapters.sqlite import SQLiteAdapter
+from ..changeset import Changeset
+from ..exceptions import NotInitialized
+
+
+class TestAsyncTern(object):
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix='terntest-')
+        self.directory = os.path.join(self.root, 'tern')
+        os.mkdir(self.directory)
+        self.changesets = [
+            Changeset('create table foo(id integer);', 'drop table foo;', 1),
+            Changeset('insert into foo values (1);', 'delete from foo;', 2),
+        ]
+        for changeset in self.changesets:
+            changeset.save(os.path.join(self.directory, changeset.hex_hash))
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def _adapter(self, name):
+        return AsyncSQLiteAdapter(
+            host=os.path.join(self.root, name),
+            dbname=None,
+            username=None,
+            password=None,
+        )
+
+    def _run(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_async_update(self):
+        async def migrate(adapter):
+            async with adapter:
+                await adapter.initialize_tern()
+            tern = AsyncTern(adapter, self.directory)
+            await tern.verify()
+            await tern.update(batch=False)
+            async with adapter:
+                return await adapter.get_applied()
+
+        async def migrate_all():
+            return await asyncio.gather(*[
+                migrate(self._adapter('{0}.db'.format(i))) for i in range(3)
+            ])
+
+        results = self._run(migrate_all())
+        for applied in results:
+            eq_(set(applied), set(self.changesets))
+
+    def test_async_verify(self):
+        tern = AsyncTern(self._adapter('new.db'), self.directory)
+        try:
+            self._run(tern.verify())
+            raise AssertionError('Verify did not throw exception.')
+        except NotInitialized:
+            pass
+
+    def test_async_apply(self):
+        adapter = self._adapter('apply.db')
+
+        async def apply():
+            async with adapter:
+                await adapter.initialize_tern()
+            tern = AsyncTern(adapter, self.directory)
+            changeset = Changeset('create table bar(id integer);', '')
+            await tern.apply(changeset)
+            return changeset
+
+        changeset = self._run(apply())
+        assert changeset.order is not None
+        # Closing the adapter shut its thread down.
+        eq_(adapter._executor, None)
+        loaded = Changeset.from_file(
+            os.path.join(self.directory, changeset.hex_hash),
+        )
+        eq_(loaded, changeset)
+
+    def test_async_nested(self):
+        adapter = self._adapter('nested.db')
+
+        async def migrate():
+            async with adapter:
+                await adapter.initialize_tern()
+                await AsyncTern(adapter, self.directory).update()
+                # The inner close kept the thread for the outer context.
+                assert adapter._executor is not None
+                return await adapter.get_applied()
+
+        eq_(set(self._run(migrate())), set(self.changesets))
+        eq_(adapter._executor, None)
+
+    def test_async_update_like_sync(self):
+        # A baseline and a changeset run outside of a transaction are
+        # handled as ``Tern.update`` does.
+        changeset = Changeset('vacuum;', '', 3, transaction=False)
+        changeset.save(os.path.join(self.directory, changeset.hex_hash))
+        Tern(None, self.directory, verify=False).make_baseline(1)
+
+        adapter = SQLiteAdapter(
+            host=os.path.join(self.root, 'sync.db'),
+            dbname=None,
+            username=None,
+            password=None,
+        )
+        with adapter:
+            adapter.initialize_tern()
+            expected = Tern(adapter, self.directory).update(batch=True)
+            expected_applied = adapter.get_applied()
+
+        async def migrate(adapter):
+            async with adapter:
+                await adapter.initialize_tern()
+                result = await AsyncTern(adapter, self.directory).update(
+                    batch=True,
+                )
+                return result, await adapter.get_applied()
+
+        result, applied = self._run(migrate(self._adapter('async.db')))
+        eq_(result, expected)
+        eq_(len(result[1]), 3)
+        eq_(set(applied), set(expected_applied))
@@ -0,0 +1,7 @@
+from __future__ import absolute_import
+import sys
+
+# The tests use ``async def``, a syntax error before Python 3.5, and the
+# asyncio API needs 3.7.
+if sys.version_info >= (3, 7):
+    from ._aio import TestAsyncTern  # noqa
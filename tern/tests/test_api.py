@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 
+from contextlib import contextmanager
 import shutil
 import random
 import string
@@ -11,6 +12,7 @@ from nose.tools import eq_
 from ..adapters.mock import MockAdapter
 from ..api import Tern
 from ..changeset import Changeset
+from ..exceptions import InvalidChangesetFile, ChangesetError
 
 
 class TestAPI(object):
@@ -79,6 +81,19 @@ class TestAPI(object):
         eq_(to_revert, [baz2, baz])
         eq_(to_apply, [bar, bar2])
 
+    def test_diff_filename_mismatch(self):
+        foo = Changeset(
+            setup='create foo',
+            teardown='drop foo',
+            order=1,
+        )
+        foo.save(os.path.join(self.directory, '0' * 40))
+        try:
+            self.tern.diff()
+            raise AssertionError('No error was thrown.')
+        except InvalidChangesetFile:
+            pass
+
     def test_update(self):
         foo = Changeset(
             setup='create foo',
@@ -110,3 +125,150 @@ class TestAPI(object):
 
         self.tern.update()
         eq_(self.adapter.applied, [foo, bar, bar2])
+
+    def test_update_up_to_date(self):
+        """
+        With the index enabled, a database whose digest matches the tern
+        directory is not diffed.
+
+        """
+        foo = Changeset(setup='create foo', teardown='drop foo', order=1)
+        bar = Changeset(setup='create bar', teardown='drop bar', order=2)
+        self._save_changesets([foo, bar])
+        self.adapter.applied = [foo, bar]
+        tern = Tern(self.adapter, self.directory, index=True)
+        eq_(tern.digest(), self.adapter.get_digest())
+
+        def get_applied_hashes():
+            raise AssertionError('The database was diffed.')
+        self.adapter.get_applied_hashes = get_applied_hashes
+        eq_(tern.update(), ([], []))
+
+        del self.adapter.get_applied_hashes
+        self.adapter.applied = [foo]
+        eq_(tern.update(), ([], [bar]))
+        eq_(self.adapter.applied, [foo, bar])
+
+    def _test_parallel_load(self, worker_type):
+        changesets = set(
+            Changeset(
+                setup='create foo{0}'.format(i),
+                teardown='drop foo{0}'.format(i),
+                order=i,
+            ) for i in range(10)
+        )
+        self._save_changesets(changesets)
+        tern = Tern(
+            self.adapter, self.directory, workers=3, worker_type=worker_type,
+            parallel_threshold=5,
+        )
+        eq_(tern._get_saved_changesets(), changesets)
+
+    def test_parallel_load_threads(self):
+        self._test_parallel_load('thread')
+
+    def test_parallel_load_processes(self):
+        self._test_parallel_load('process')
+
+    def test_update_batch(self):
+        foo = Changeset(
+            setup='create foo',
+            teardown='drop foo',
+            order=1,
+        )
+        bar = Changeset(
+            setup='create bar',
+            teardown='drop bar',
+            order=2,
+        )
+        baz = Changeset(
+            setup='create baz',
+            teardown='drop baz',
+            order=2,
+        )
+        self.adapter.applied = [foo, baz]
+        self._save_changesets([foo, bar])
+
+        apply = self.adapter.apply
+
+        def failing_apply(changeset):
+            apply(changeset)
+            if changeset == bar:
+                raise ValueError('Bad SQL')
+        self.adapter.apply = failing_apply
+
+        try:
+            self.tern.update(batch=True)
+            raise AssertionError('No error was thrown.')
+        except ChangesetError as e:
+            eq_(e.changeset, bar)
+            eq_(type(e.__cause__), ValueError)
+        # The revert of baz was rolled back too.
+        eq_(self.adapter.applied, [foo, baz])
+
+        self.adapter.apply = apply
+        self.tern.update(batch=True, batch_size=1)
+        eq_(self.adapter.applied, [foo, bar])
+
+    def test_update_batch_autocommit(self):
+        changesets = [
+            Changeset('create foo', 'drop foo', 1),
+            Changeset('index foo', 'unindex foo', 2, transaction=False),
+            Changeset('create bar', 'drop bar', 3),
+            Changeset('create baz', 'drop baz', 4),
+        ]
+        self._save_changesets(changesets)
+
+        batches = list()
+        batch = self.adapter.batch
+        apply = self.adapter.apply
+
+        @contextmanager
+        def recording_batch():
+            batches.append(list())
+            with batch():
+                yield
+            batches.append(None)
+
+        def recording_apply(changeset):
+            apply(changeset)
+            if batches and batches[-1] is not None:
+                batches[-1].append(changeset.order)
+            else:
+                batches.append(changeset.order)
+
+        self.adapter.batch = recording_batch
+        self.adapter.apply = recording_apply
+        self.tern.update(batch=True)
+        # The changeset run outside of a transaction splits the batch.
+        eq_(batches, [[1], None, 2, [3, 4], None])
+        eq_(self.adapter.applied, changesets)
+
+    def test_update_progress(self):
+        foo = Changeset('create foo', 'drop foo', 1)
+        bar = Changeset('create bar', 'drop bar', 2)
+        baz = Changeset('create baz', 'drop baz', 3)
+        self.adapter.applied = [baz]
+        self._save_changesets([foo, bar])
+        done = list()
+        self.tern.update(progress=done.append)
+        eq_(done, [baz, foo, bar])
+
+    def test_update_error(self):
+        foo = Changeset(
+            setup='create foo',
+            teardown='drop foo',
+            order=1,
+        )
+        self._save_changesets([foo])
+
+        def failing_apply(changeset):
+            raise ValueError('Bad SQL')
+        self.adapter.apply = failing_apply
+
+        try:
+            self.tern.update()
+            raise AssertionError('No error was thrown.')
+        except ChangesetError as e:
+            eq_(e.changeset, foo)
+            assert isinstance(e.error, ValueError)
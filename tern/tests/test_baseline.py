@@ -0,0 +1,96 @@
+from __future__ import absolute_import
+
+import shutil
+import tempfile
+import os
+import os.path
+
+from nose.tools import eq_
+
+from ..adapters.sqlite import SQLiteAdapter
+from ..api import Tern
+from ..baseline import Baseline
+from ..changeset import Changeset
+from ..digest import digest
+
+
+class TestBaseline(object):
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix='terntest-')
+        self.directory = os.path.join(self.root, 'tern')
+        os.mkdir(self.directory)
+        # A table is created and later dropped, and then the real one.
+        self.changesets = [
+            Changeset('create table tmp(id integer);', 'drop table tmp;', 1),
+            Changeset('insert into tmp values (1);', 'delete from tmp;', 2),
+            Changeset('drop table tmp;', 'create table tmp(id integer);', 3),
+            Changeset('create table foo(id integer);', 'drop table foo;', 4),
+            Changeset('insert into foo values (1);', 'delete from foo;', 5),
+        ]
+        for changeset in self.changesets:
+            changeset.save(os.path.join(self.directory, changeset.hex_hash))
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def _adapter(self, name):
+        adapter = SQLiteAdapter(
+            host=os.path.join(self.root, name),
+            dbname=None,
+            username=None,
+            password=None,
+        )
+        with adapter:
+            adapter.initialize_tern()
+        return adapter
+
+    def test_baseline_file(self):
+        baseline = Baseline(
+            3, 'create table foo(id integer);\n--- End?\n',
+            [cs.hex_hash for cs in self.changesets[:3]],
+        )
+        baseline.save(self.directory)
+        loaded = Baseline.open(self.directory)
+        eq_(loaded.order, 3)
+        eq_(loaded.setup, baseline.setup)
+        eq_(loaded.hashes, baseline.hashes)
+        eq_(Baseline.open(self.root), None)
+
+    def test_baseline_update(self):
+        tern = Tern(None, self.directory, verify=False)
+        baseline = tern.make_baseline(3, setup='')
+        eq_(baseline.hashes, [cs.hex_hash for cs in self.changesets[:3]])
+
+        # An existing database is updated one changeset at a time.
+        existing = self._adapter('existing.db')
+        with existing:
+            existing.apply(self.changesets[0])
+            existing.round_trips = 0
+            eq_(
+                Tern(existing, self.directory).update(),
+                ([], self.changesets[1:]),
+            )
+
+        # A fresh database loads the baseline, and records the squashed
+        # changesets as applied, without running them.
+        fresh = self._adapter('fresh.db')
+        with fresh:
+            fresh.round_trips = 0
+            eq_(Tern(fresh, self.directory).update(), ([], self.changesets))
+            assert fresh.round_trips < existing.round_trips
+            eq_(set(fresh.get_applied()), set(self.changesets))
+            eq_(
+                fresh.get_digest(),
+                digest((cs.hex_hash, cs.order) for cs in self.changesets),
+            )
+            fresh.conn.execute('select * from foo')
+
+        # The squashed changesets can be reverted as usual.
+        for changeset in self.changesets[1:3]:
+            os.remove(os.path.join(self.directory, changeset.hex_hash))
+        os.remove(os.path.join(self.directory, Baseline.filename))
+        with fresh:
+            eq_(
+                Tern(fresh, self.directory).update(),
+                ([self.changesets[2], self.changesets[1]], []),
+            )
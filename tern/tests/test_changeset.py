@@ -3,6 +3,7 @@ import os.path
 from nose import with_setup
 from nose.tools import eq_
 from tern.changeset import Changeset
+from tern.exceptions import InvalidChangesetFile
 
 
 dir = os.path.dirname(__file__)
@@ -48,3 +49,88 @@ def test_changeset_save():
     eq_(loaded.order, 24)
     eq_(loaded.setup, 'foo')
     eq_(loaded.teardown, 'bar')
+
+
+def test_changeset_from_bytes():
+    changeset = Changeset.from_bytes(
+        b'Some comment\r\n'
+        b'--- Begin setup\r\n'
+        b'create table foo(id primary key);\r\n'
+        b'--- Order: 99\r\n'
+        b'  --- END  \r\n'
+        b'--- Created at: 123123\r\n'
+        b'---order:12\r\n'
+        b'--- begin teardown\r\n'
+        b'drop table foo;\r\n'
+    )
+    eq_(changeset.created_at, 123123)
+    eq_(changeset.order, 12)
+    eq_(changeset.setup, 'create table foo(id primary key);\n--- Order: 99')
+    eq_(changeset.teardown, 'drop table foo;')
+
+
+def test_changeset_from_bytes_invalid():
+    try:
+        Changeset.from_bytes(
+            b'--- Created at: 123123\n'
+            b'--- Begin setup\n'
+            b'--- End\n'
+            b'--- Begin teardown\n'
+            b'--- End\n'
+        )
+        raise AssertionError('No error was thrown.')
+    except InvalidChangesetFile:
+        pass
+
+
+@with_setup(lambda: None, save_teardown)
+def test_changeset_settings():
+    changeset = Changeset.from_bytes(
+        b'--- Created at: 123123\n'
+        b'--- Order: 12\n'
+        b'--- Set: maintenance_work_mem = 1GB\n'
+        b"---set:search_path='app, public'  \r\n"
+        b'--- Begin setup\n'
+        b'create index foo_id on foo(id);\n'
+        b'--- Set: inside = setup\n'
+        b'--- End\n'
+        b'--- Begin teardown\n'
+        b'drop index foo_id;\n'
+        b'--- End\n'
+    )
+    eq_(changeset.settings, [
+        ('maintenance_work_mem', '1GB'), ('search_path', 'app, public'),
+    ])
+    # Settings aren't part of the hash.
+    eq_(changeset, Changeset(changeset.setup, changeset.teardown, 12, 123123))
+
+    changeset.save(changeset_save_fn)
+    eq_(Changeset.from_file(changeset_save_fn).settings, changeset.settings)
+
+    # Values are quoted when saved, so quotes round-trip.
+    changeset.settings = [('application_name', '"x"'), ('a', "'y' ")]
+    changeset.save(changeset_save_fn)
+    eq_(Changeset.from_file(changeset_save_fn).settings, changeset.settings)
+
+
+@with_setup(lambda: None, save_teardown)
+def test_changeset_transaction():
+    data = (
+        b'--- Created at: 123123\n'
+        b'--- Order: 12\n'
+        b'--- Begin setup\n'
+        b'create index concurrently foo_id on foo(id);\n'
+        b'--- End\n'
+        b'--- Begin teardown\n'
+        b'drop index concurrently foo_id;\n'
+        b'--- End\n'
+    )
+    eq_(Changeset.from_bytes(data).transaction, True)
+    changeset = Changeset.from_bytes(
+        data.replace(b'--- Order', b'--- Transaction: OFF\n--- Order'),
+    )
+    eq_(changeset.transaction, False)
+    eq_(changeset, Changeset.from_bytes(data))
+
+    changeset.save(changeset_save_fn)
+    eq_(Changeset.from_file(changeset_save_fn).transaction, False)
@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+
+from nose.tools import eq_
+
+from ..adapters.mock import MockAdapter
+from ..adapters.sqlite import SQLiteAdapter
+from ..changeset import Changeset
+from ..compare import compare
+
+
+def _changesets(orders, tag=''):
+    return [
+        Changeset(
+            setup='create table t{0}{1}(id integer);'.format(tag, i),
+            teardown='drop table t{0}{1};'.format(tag, i),
+            order=i,
+            created_at=i,
+        ) for i in orders
+    ]
+
+
+class TestCompare(object):
+    def setup(self):
+        self.left = self._adapter()
+        self.right = self._adapter()
+
+    def teardown(self):
+        self.left.close()
+        self.right.close()
+
+    def _adapter(self):
+        adapter = SQLiteAdapter(
+            host=':memory:',
+            dbname=None,
+            username=None,
+            password=None,
+        )
+        adapter.open()
+        adapter.initialize_tern()
+        return adapter
+
+    def _save(self, adapter, changesets):
+        with adapter.conn:
+            for changeset in changesets:
+                adapter._save_changeset(changeset)
+
+    def test_compare_same(self):
+        changesets = _changesets(range(1, 1001))
+        self._save(self.left, changesets)
+        self._save(self.right, changesets)
+        result = compare(self.left, self.right)
+        assert result.same
+        # The order range, and one round of digests.
+        eq_(result.queries, 4)
+
+    def test_compare_empty(self):
+        assert compare(self.left, self.right).same
+
+    def test_compare_drift(self):
+        changesets = _changesets(range(1, 1001))
+        extra = _changesets([1001])
+        replaced = _changesets([500], tag='x')
+        self._save(self.left, changesets + extra)
+        self._save(
+            self.right,
+            [cs for cs in changesets if cs.order != 500] + replaced,
+        )
+        result = compare(self.left, self.right, buckets=4, leaf_size=8)
+        eq_(result.only_left, [
+            (changesets[499].hex_hash, 500), (extra[0].hex_hash, 1001),
+        ])
+        eq_(result.only_right, [(replaced[0].hex_hash, 500)])
+        assert result.queries < 50
+
+    def test_compare_default_implementation(self):
+        """
+        Adapters without range digests are compared through
+        ``get_applied_hashes``.
+
+        """
+        changesets = _changesets(range(1, 101))
+        mock = MockAdapter(None, None, None, None)
+        mock.applied = changesets[:-1]
+        self._save(self.left, changesets)
+        result = compare(self.left, mock)
+        eq_(result.only_left, [(changesets[-1].hex_hash, 100)])
+        eq_(result.only_right, [])
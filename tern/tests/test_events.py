@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+
+import json
+import os.path
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+from ..adapters.mock import MockAdapter
+from ..api import Tern
+from ..changeset import Changeset
+from ..exceptions import ChangesetError
+from ..events import JSONLinesSink, PrometheusSink
+
+
+class TestEvents(object):
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix='terntest-')
+        self.directory = os.path.join(self.root, 'tern')
+        os.mkdir(self.directory)
+        self.changesets = [
+            Changeset('create foo', 'drop foo', 1),
+            Changeset('create bar', 'drop bar', 2),
+        ]
+        for changeset in self.changesets:
+            changeset.save(os.path.join(self.directory, changeset.hex_hash))
+        self.adapter = MockAdapter(None, None, None, None)
+        self.events = list()
+        self.tern = Tern(
+            self.adapter, self.directory, hooks=[self.events.append],
+        )
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def test_update_events(self):
+        old = Changeset('create baz', 'drop baz', 3)
+        self.adapter.applied = [old]
+        self.tern.update()
+        eq_(
+            [(e.name, e.phase, e.hex_hash) for e in self.events],
+            [
+                ('diff', 'before', None), ('diff', 'after', None),
+                ('revert', 'before', old.hex_hash),
+                ('revert', 'after', old.hex_hash),
+            ] + [
+                ('apply', phase, cs.hex_hash)
+                for cs in self.changesets for phase in ('before', 'after')
+            ],
+        )
+        for event in self.events[1::2]:
+            assert event.ok
+            assert event.wall >= 0
+            assert event.cpu >= 0
+            eq_(event.round_trips, 0)
+
+    def test_error_event(self):
+        def failing_apply(changeset):
+            raise ValueError('Bad SQL')
+        self.adapter.apply = failing_apply
+        try:
+            self.tern.update()
+            raise AssertionError('No error was thrown.')
+        except ChangesetError:
+            pass
+        eq_(self.events[-1].name, 'apply')
+        eq_(self.events[-1].ok, False)
+
+    def test_test_event(self):
+        self.tern.test(self.changesets[0])
+        eq_(
+            [(e.name, e.phase) for e in self.events],
+            [('test', 'before'), ('test', 'after')],
+        )
+
+    def test_sinks(self):
+        jsonl = os.path.join(self.root, 'events.jsonl')
+        prom = os.path.join(self.root, 'tern.prom')
+        self.tern.hooks = [
+            JSONLinesSink(jsonl), PrometheusSink(prom, {'database': 'main'}),
+        ]
+        self.tern.update()
+        with open(jsonl) as fh:
+            events = [json.loads(line) for line in fh]
+        eq_([e['name'] for e in events], ['diff', 'apply', 'apply'])
+        eq_(events[1]['hash'], self.changesets[0].hex_hash)
+        eq_(events[1]['error'], None)
+        with open(prom) as fh:
+            metrics = fh.read().splitlines()
+        assert 'tern_events_total{database="main",event="apply"} 2' in metrics
+        assert 'tern_errors_total{database="main",event="diff"} 0' in metrics
+        assert '# TYPE tern_wall_seconds_total counter' in metrics
+        eq_(os.listdir(self.root).count('tern.prom'), 1)
+        eq_(len(os.listdir(self.root)), 3)
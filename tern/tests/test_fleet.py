@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+
+import shutil
+import tempfile
+import os
+import os.path
+
+from nose.tools import eq_
+
+from ..adapters.sqlite import SQLiteAdapter
+from ..changeset import Changeset
+from ..fleet import Fleet
+
+
+class TestFleet(object):
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix='terntest-')
+        self.directory = os.path.join(self.root, 'tern')
+        os.mkdir(self.directory)
+        for changeset in [
+            Changeset('create table foo(id integer);', 'drop table foo;', 1),
+            Changeset('insert into foo values (1);', 'delete from foo;', 2),
+        ]:
+            changeset.save(os.path.join(self.directory, changeset.hex_hash))
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def _adapter(self, name, initialize=True):
+        adapter = SQLiteAdapter(
+            host=os.path.join(self.root, name),
+            dbname=None,
+            username=None,
+            password=None,
+        )
+        if initialize:
+            with adapter:
+                adapter.initialize_tern()
+        return adapter
+
+    def test_fleet_update(self):
+        targets = [
+            ('a', self._adapter('a.db')),
+            ('b', self._adapter('b.db')),
+            ('broken', self._adapter('broken.db', initialize=False)),
+        ]
+        finished = list()
+        report = Fleet(targets, self.directory, jobs=2).update(
+            progress=finished.append,
+        )
+
+        eq_([result.name for result in report.results], ['a', 'b', 'broken'])
+        eq_(sorted(result.name for result in finished), ['a', 'b', 'broken'])
+        eq_([result.name for result in report.failed], ['broken'])
+        for result in report.succeeded:
+            eq_(result.applied, 2)
+
+        for _, adapter in targets[:2]:
+            with adapter:
+                eq_(len(adapter.get_applied()), 2)
+
+        # Running again is a no-op.
+        report = Fleet(targets[:2], self.directory).update()
+        eq_([result.applied for result in report.results], [0, 0])
+
+    def test_fleet_initialize(self):
+        targets = [('new', self._adapter('new.db', initialize=False))]
+        report = Fleet(targets, self.directory, initialize=True).update()
+        eq_(report.failed, [])
+        eq_(report.results[0].applied, 2)
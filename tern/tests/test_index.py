@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+
+import shutil
+import random
+import string
+import os
+import os.path
+
+from nose.tools import eq_
+
+from ..adapters.mock import MockAdapter
+from ..api import Tern
+from ..changeset import Changeset, LazyChangeset
+from ..index import ChangesetIndex
+
+
+class TestIndex(object):
+    def setup(self):
+        self.adapter = MockAdapter(None, None, None, None)
+        randstr = ''.join(
+            random.choice(string.ascii_lowercase) for _ in range(16)
+        )
+        self.directory = '.terntest-{0}'.format(randstr)
+        os.mkdir(self.directory)
+        self.tern = Tern(self.adapter, self.directory, index=True)
+        self.changesets = [
+            Changeset('create foo', 'drop foo', 1, 100),
+            Changeset('create bar', 'drop bar', 2, 101),
+        ]
+        for changeset in self.changesets:
+            self._save(changeset)
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def _save(self, changeset):
+        fn = os.path.join(self.directory, changeset.hex_hash)
+        changeset.save(fn)
+        # Backdate the file, so the index entry is not considered racy.
+        os.utime(fn, (1000000000, 1000000000))
+        return fn
+
+    def test_index_created(self):
+        saved = self.tern._get_saved_changesets()
+        eq_(saved, set(self.changesets))
+        index = ChangesetIndex(self.directory)
+        eq_(
+            sorted(entry[5] for entry in index.entries.values()),
+            sorted(cs.hex_hash for cs in self.changesets),
+        )
+
+    def test_index_used(self):
+        self.tern._get_saved_changesets()
+
+        # The classmethod itself, not the bound method ``from_file`` returns.
+        original = Changeset.__dict__['from_file']
+
+        def from_file(filename):
+            raise AssertionError('Changeset file was parsed.')
+        Changeset.from_file = staticmethod(from_file)
+        try:
+            saved = self.tern._get_saved_changesets()
+        finally:
+            Changeset.from_file = original
+
+        for changeset in saved:
+            assert isinstance(changeset, LazyChangeset)
+        eq_(saved, set(self.changesets))
+
+        # The SQL is loaded lazily.
+        by_order = dict((cs.order, cs) for cs in saved)
+        eq_(by_order[1].setup, 'create foo')
+        eq_(by_order[2].teardown, 'drop bar')
+
+    def test_index_invalidated(self):
+        self.tern._get_saved_changesets()
+
+        # Rewrite a file with a different changeset under the same name.
+        fn = os.path.join(self.directory, self.changesets[0].hex_hash)
+        changed = Changeset('create foo2', 'drop foo2', 1, 100)
+        changed.save(fn)
+        os.utime(fn, (1000000001, 1000000001))
+
+        saved = self.tern._get_saved_changesets()
+        eq_(saved, set([changed, self.changesets[1]]))
+
+    def test_index_pruned(self):
+        self.tern._get_saved_changesets()
+        os.remove(os.path.join(self.directory, self.changesets[0].hex_hash))
+        saved = self.tern._get_saved_changesets()
+        eq_(saved, set([self.changesets[1]]))
+        index = ChangesetIndex(self.directory)
+        eq_(list(index.entries), [self.changesets[1].hex_hash])
+
+    def test_index_corrupt(self):
+        with open(os.path.join(self.directory, '.tern-index'), 'w') as fh:
+            fh.write('{not json')
+        saved = self.tern._get_saved_changesets()
+        eq_(saved, set(self.changesets))
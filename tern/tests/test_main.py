@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+
+import shutil
+import sys
+import tempfile
+import os
+import os.path
+
+from nose.tools import eq_
+from six import StringIO
+import yaml
+
+from ..__main__ import main
+from ..adapters.sqlite import SQLiteAdapter
+from ..changeset import Changeset
+
+
+class TestCommands(object):
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix='terntest-')
+        self.directory = os.path.join(self.root, 'tern')
+        os.mkdir(self.directory)
+        for changeset in [
+            Changeset('create table foo(id integer);', 'drop table foo;', 1),
+            Changeset('insert into foo values (1);', 'delete from foo;', 2),
+        ]:
+            changeset.save(os.path.join(self.directory, changeset.hex_hash))
+        self.config = os.path.join(self.root, 'tern.yml')
+        with open(self.config, 'w') as fh:
+            fh.write(yaml.safe_dump(dict(
+                directory=self.directory,
+                workers=2,
+                adapter=dict(
+                    module='tern.adapters.sqlite',
+                    host=os.path.join(self.root, 'main.db'),
+                    dbname=None,
+                    username=None,
+                    password=None,
+                ),
+                targets=[
+                    dict(name=name, adapter=dict(
+                        module='tern.adapters.sqlite',
+                        host=os.path.join(self.root, name + '.db'),
+                        dbname=None,
+                        username=None,
+                        password=None,
+                    ))
+                    for name in ['a', 'b']
+                ],
+            )))
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def _main(self, *args):
+        argv, stdout = sys.argv, sys.stdout
+        sys.argv = ['tern', '-c', self.config] + list(args)
+        sys.stdout = StringIO()
+        try:
+            main()
+            return sys.stdout.getvalue()
+        finally:
+            sys.argv, sys.stdout = argv, stdout
+
+    def _adapter(self, name):
+        return SQLiteAdapter(
+            host=os.path.join(self.root, name + '.db'),
+            dbname=None,
+            username=None,
+            password=None,
+        )
+
+    def test_fleet(self):
+        output = self._main('fleet', '--jobs', '2', '--initialize')
+        assert '2 targets:  2 updated, 0 failed.' in output, output
+        for name in ['a', 'b']:
+            adapter = self._adapter(name)
+            with adapter:
+                eq_(len(adapter.get_applied()), 2)
+
+    def test_update(self):
+        adapter = self._adapter('main')
+        with adapter:
+            adapter.initialize_tern()
+        eq_(self._main('update'), 'Updating... Done\n')
+        with adapter:
+            eq_(len(adapter.get_applied()), 2)
+        # Without --eta, the databases under ``targets`` aren't touched.
+        eq_(os.path.exists(os.path.join(self.root, 'a.db')), False)
+
+    def test_update_eta(self):
+        adapter = self._adapter('main')
+        with adapter:
+            adapter.initialize_tern()
+        output = self._main('update', '--eta')
+        assert output.startswith('Updating 2 changesets, ETA'), output
+        with adapter:
+            eq_(len(adapter.get_applied()), 2)
+
+    def test_compare(self):
+        self._main('fleet', '--initialize')
+        eq_(self._main('compare', 'a', 'b'), 'Same changesets applied.\n')
@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+
+import shutil
+import tempfile
+import os
+import os.path
+
+from nose.tools import eq_
+
+from ..adapters.mock import MockAdapter
+from ..api import Tern
+from ..changeset import Changeset, LazyChangeset
+from ..exceptions import InvalidChangesetFile
+from ..pack import ChangesetPack
+
+
+class TestPack(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp(prefix='terntest-')
+        self.changesets = [
+            Changeset(
+                setup='create table foo{0}(id integer);'.format(i),
+                teardown='drop table foo{0};'.format(i),
+                order=i,
+                created_at=1000 + i,
+            ) for i in range(1, 21)
+        ]
+        for changeset in self.changesets:
+            changeset.save(os.path.join(self.directory, changeset.hex_hash))
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pack_lookup(self):
+        tern = Tern(None, self.directory, verify=False)
+        eq_(tern.pack(), 20)
+        eq_(os.listdir(self.directory), [ChangesetPack.filename])
+
+        pack = ChangesetPack.open(self.directory)
+        try:
+            eq_(len(pack), 20)
+            eq_(
+                pack.hashes(),
+                sorted(cs.hex_hash for cs in self.changesets),
+            )
+            for changeset in self.changesets:
+                packed = pack.lookup(changeset.hex_hash)
+                assert isinstance(packed, LazyChangeset)
+                eq_(packed.order, changeset.order)
+                eq_(packed.created_at, changeset.created_at)
+                # The SQL is read from the pack when needed.
+                eq_(packed._setup, None)
+                eq_(packed.setup, changeset.setup)
+                eq_(packed.teardown, changeset.teardown)
+                eq_(packed.hash, changeset.hash)
+            eq_(pack.lookup('0' * 40), None)
+            eq_(set(pack.changesets().values()), set(self.changesets))
+        finally:
+            pack.close()
+
+    def test_pack_transparent(self):
+        """
+        Packed and loose changesets are read together, and packing again
+        keeps the changesets already packed.
+
+        """
+        tern = Tern(None, self.directory, verify=False)
+        tern.pack()
+        extra = Changeset('create table bar(id integer);', '', 21)
+        extra.save(os.path.join(self.directory, extra.hex_hash))
+        eq_(tern._get_saved_changesets(), set(self.changesets + [extra]))
+
+        adapter = MockAdapter(None, None, None, None)
+        adapter.applied = self.changesets[:10]
+        tern = Tern(adapter, self.directory, index=True)
+        eq_(tern.update(), ([], self.changesets[10:] + [extra]))
+        eq_(tern.digest(), adapter.get_digest())
+
+        eq_(tern.pack(), 1)
+        eq_(tern.pack(), 0)
+        eq_(tern._get_saved_changesets(), set(self.changesets + [extra]))
+
+    def test_pack_reused(self):
+        """
+        The pack is opened again only when its file changes.
+
+        """
+        tern = Tern(None, self.directory, verify=False)
+        tern.pack()
+        tern._get_saved_changesets()
+        pack = tern._pack
+        tern._get_saved_changesets()
+        assert tern._pack is pack
+
+        extra = Changeset('create table bar(id integer);', '', 21)
+        extra.save(os.path.join(self.directory, extra.hex_hash))
+        tern.pack()
+        eq_(tern._get_saved_changesets(), set(self.changesets + [extra]))
+        assert tern._pack is not pack
+
+        os.remove(os.path.join(self.directory, ChangesetPack.filename))
+        eq_(tern._get_saved_changesets(), set())
+        eq_(tern._pack, None)
+
+    def test_pack_invalid(self):
+        with open(os.path.join(self.directory, ChangesetPack.filename), 'wb') \
+                as fh:
+            fh.write(b'NOTAPACK' + b'\0' * 8)
+        try:
+            ChangesetPack.open(self.directory)
+            raise AssertionError('No error was thrown.')
+        except InvalidChangesetFile:
+            pass
@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+
+from nose.tools import eq_
+
+from ..adapters.mock import MockAdapter
+from ..adapters.sqlite import SQLiteAdapter
+from ..changeset import Changeset
+from ..plan import plan, touched_tables
+
+
+def test_touched_tables():
+    eq_(touched_tables('alter table only foo add column x integer'), ['foo'])
+    eq_(
+        touched_tables(
+            'create unique index concurrently if not exists foo_x '
+            'on public.foo(x)'
+        ),
+        ['public.foo'],
+    )
+    eq_(
+        touched_tables(
+            "insert into foo select * from bar where name = 'delete from baz'"
+            " -- update qux"
+        ),
+        ['foo'],
+    )
+    eq_(
+        touched_tables(
+            'alter table foo add constraint fk foreign key (bar_id) '
+            'references "Bar"(id)'
+        ),
+        ['foo', '"Bar"'],
+    )
+
+
+class TestPlan(object):
+    def setup(self):
+        self.adapter = SQLiteAdapter(
+            host=':memory:',
+            dbname=None,
+            username=None,
+            password=None,
+        )
+        self.adapter.open()
+        self.adapter.initialize_tern()
+        self.adapter.apply(Changeset(
+            'create table foo(id integer, name text);\n'
+            "insert into foo select value, 'n' || value from ("
+            'with recursive n(value) as (select 1 union all '
+            'select value + 1 from n where value < 1000) select value from n);'
+            '\nanalyze;',
+            'drop table foo;',
+            1,
+        ))
+
+    def teardown(self):
+        self.adapter.close()
+
+    def test_plan(self):
+        applied = self.adapter.get_applied()
+        to_apply = [
+            Changeset(
+                'update foo set name = upper(name);\n'
+                'create index foo_name on foo(name);',
+                'drop index foo_name;',
+                2,
+            ),
+            Changeset('create table bar(id integer);', 'drop table bar;', 3),
+        ]
+        result = plan(
+            self.adapter, applied, to_apply, bytes_per_second=1024,
+            rows_per_second=100,
+        )
+        eq_(
+            [(cs.revert, cs.changeset.order) for cs in result.changesets],
+            [(True, 1), (False, 2), (False, 3)],
+        )
+        eq_(result.changesets[0].tables, ['foo'])
+        eq_(result.changesets[0].seconds, 0)
+
+        update, index = result.changesets[1].statements
+        eq_(update.rows, 1000)
+        eq_(update.seconds, 10)
+        size = result.table_sizes['foo'][0]
+        assert size > 0
+        eq_(result.table_sizes['foo'][1], 1000)
+        eq_(index.rows, None)
+        eq_(index.seconds, size / 1024.0)
+        eq_(result.changesets[2].seconds, 0)
+        eq_(result.seconds, 10 + size / 1024.0)
+        assert 'predicted duration' in result.report()
+
+        # Nothing was run.
+        eq_(self.adapter.get_applied(), applied)
+        eq_(self.adapter.conn.execute(
+            'select count(*) from foo where name = upper(name)'
+        ).fetchone()[0], 0)
+
+
+def test_plan_unsupported():
+    adapter = MockAdapter(None, None, None, None)
+    changeset = Changeset('update foo set x = 1', 'drop foo', 1)
+    result = plan(adapter, [], [changeset])
+    eq_(result.table_sizes, {})
+    eq_(result.changesets[0].statements[0].rows, None)
+    eq_(result.seconds, 0)
@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+
+from nose.tools import eq_
+
+from ..adapters.sqlite import SQLiteAdapter
+from ..changeset import Changeset
+from ..stats import Progress, estimate_durations, timings_report
+
+
+def _adapter():
+    adapter = SQLiteAdapter(
+        host=':memory:',
+        dbname=None,
+        username=None,
+        password=None,
+    )
+    adapter.open()
+    adapter.initialize_tern()
+    return adapter
+
+
+class TestStats(object):
+    def setup(self):
+        self.changesets = [
+            Changeset(
+                'create table foo(id integer); insert into foo values (1);',
+                'drop table foo;',
+                1,
+            ),
+            Changeset('create table bar(id integer);', 'drop table bar;', 2),
+        ]
+        self.adapter = _adapter()
+        self.other = _adapter()
+
+    def teardown(self):
+        self.adapter.close()
+        self.other.close()
+
+    def test_get_timings(self):
+        eq_(self.adapter.get_timings(), {})
+        self.adapter.apply(self.changesets[0])
+        timings = self.adapter.get_timings()
+        eq_(list(timings), [self.changesets[0].hex_hash])
+        applied_at, duration, statements = timings[self.changesets[0].hex_hash]
+        assert applied_at > 0
+        assert duration >= 0
+        eq_(statements, 2)
+        eq_(self.adapter.get_timings([self.changesets[1].hex_hash]), {})
+
+        report = timings_report(timings, {self.changesets[0].hex_hash: 1})
+        assert report.startswith('1 of 1 changesets timed')
+
+    def test_estimate_durations(self):
+        self.other.apply(self.changesets[0])
+        self.other.conn.execute('update tern set duration = 42')
+        estimates = estimate_durations(
+            self.adapter, [], self.changesets, [self.other],
+        )
+        # Timed on the other database, and estimated from the table sizes.
+        eq_(estimates, {
+            self.changesets[0].hex_hash: 42,
+            self.changesets[1].hex_hash: 0,
+        })
+
+    def test_progress(self):
+        lines = list()
+        progress = Progress(
+            self.changesets,
+            {self.changesets[0].hex_hash: 10, self.changesets[1].hex_hash: 30},
+            lines.append,
+        )
+        eq_(progress.eta(), 40)
+        # The first took twice as long as predicted, so the rest should too.
+        progress.start -= 20
+        progress.last -= 20
+        progress(self.changesets[0])
+        eq_(progress.remaining, 30)
+        assert 60 <= progress.eta() < 61
+        eq_(len(lines), 1)
+        assert lines[0].startswith('[1/2] {0} (order 1)'.format(
+            self.changesets[0].hex_hash,
+        ))
+
+
+def test_initialize_timings():
+    """
+    Timings can be added to a database initialized before they were.
+
+    """
+    adapter = SQLiteAdapter(
+        host=':memory:',
+        dbname=None,
+        username=None,
+        password=None,
+    )
+    with adapter:
+        adapter.conn.execute(
+            'create table tern (hash text primary key, created_at integer, '
+            'setup text, teardown text, "order" integer)'
+        )
+        changeset = Changeset(setup='', teardown='', order=1)
+        adapter.apply(changeset)
+        eq_(adapter.get_timings(), None)
+        adapter.initialize_timings()
+        eq_(adapter.get_timings(), {})
+        adapter.apply(Changeset(setup='select 1;', teardown='', order=2))
+        eq_(len(adapter.get_timings()), 1)
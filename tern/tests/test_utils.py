@@ -0,0 +1,46 @@
+from __future__ import absolute_import
+
+import shutil
+import stat
+import tempfile
+import os
+import os.path
+
+from nose.tools import eq_
+
+from ..utils import atomic_write
+
+
+class TestAtomicWrite(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp(prefix='terntest-')
+        self.path = os.path.join(self.directory, 'file')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def _read(self):
+        with open(self.path) as fh:
+            return fh.read()
+
+    def test_atomic_write(self):
+        with atomic_write(self.path) as fh:
+            fh.write('foo')
+        eq_(self._read(), 'foo')
+        eq_(stat.S_IMODE(os.stat(self.path).st_mode), 0o644)
+        with atomic_write(self.path, 'wb') as fh:
+            fh.write(b'bar')
+        eq_(self._read(), 'bar')
+        eq_(os.listdir(self.directory), ['file'])
+
+    def test_atomic_write_error(self):
+        with atomic_write(self.path) as fh:
+            fh.write('foo')
+        try:
+            with atomic_write(self.path) as fh:
+                fh.write('bar')
+                raise ValueError()
+        except ValueError:
+            pass
+        eq_(self._read(), 'foo')
+        eq_(os.listdir(self.directory), ['file'])
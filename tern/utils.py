@@ -0,0 +1,42 @@
+"""
+Helpers shared by the modules writing files.
+
+"""
+from __future__ import absolute_import
+from contextlib import contextmanager
+import os
+import os.path
+import tempfile
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """
+    A context manager yielding a file to write the contents of ``path`` to.
+    The file is a temporary one in the same directory, which replaces
+    ``path`` when the block exits, so readers never see a partial file.  If
+    the block raises, ``path`` is left as it was.
+
+    :param path:  The path of the file to write.
+    :type path:  str
+    :param mode:  ``'w'``, or ``'wb'`` for binary files.
+    :type mode:  str
+
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(
+        prefix=os.path.basename(path) + '.', dir=directory,
+    )
+    try:
+        with os.fdopen(fd, mode) as fh:
+            yield fh
+        # mkstemp creates the file readable by its owner only.
+        os.chmod(tmp, 0o644)
+        # os.rename will not overwrite on Windows; prefer os.replace.
+        getattr(os, 'replace', os.rename)(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise